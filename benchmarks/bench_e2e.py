@@ -0,0 +1,217 @@
+# benchmarks/bench_e2e.py
+"""
+Offline end-to-end benchmark for the three pipelines.
+
+Starts local fakes of Reddit, OpenAI and raw.githubusercontent.com (see
+`fake_servers.py`) with configurable latency and injected failures, points the
+real pipelines at them and measures:
+
+    trends  `subreddit_trends.generate_trend_report` on subreddits of N posts
+    post    `SummarizationService.summarize_reddit` on N posts, `--workers` at a time, read
+            from a JSONL bulk file with a malformed and a non-object line that must be skipped
+    repo    `SummarizationService.summarize_github` on N READMEs, `--workers` at a time
+    docs    `github_repo_summarizer` --all-docs (archive download, per-file then repository
+            summary) on N repositories, one at a time with `--workers` files in parallel
+
+For each scenario and size it reports items/sec, p50/p95 item latency (trends
+reports the whole run as one item), upstream requests per item and LLM tokens
+per item. No network access or API keys are needed.
+
+Usage:
+    python benchmarks/bench_e2e.py [--scenarios trends,post,repo,docs] [--sizes 10,50,200]
+                                   [--latency-ms 50] [--jitter-ms 20] [--error-rate 0.02]
+                                   [--rate-limit-rate 0.02] [--workers 8] [--reddit-rpm N] [--json FILE]
+With --json, results are appended as one JSON line per run for tracking over time.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fake_servers import FakeGitHubServer, FakeOpenAIServer, FakeRedditServer, configure_environment
+
+SCENARIOS = ("trends", "post", "repo", "docs")
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def _timed(func, *args) -> tuple[float, BaseException | None]:
+    start = time.perf_counter()
+    try:
+        func(*args)
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, e
+
+# --- Scenarios ---
+def bench_trends(size: int, servers: dict, workdir: str, workers: int) -> tuple[list[float], list]:
+    import subreddit_trends as st
+    from corpus_store import CorpusStore
+
+    subreddit = f"bench{size}"
+    servers["reddit"].posts_per_subreddit = size
+    store = CorpusStore(os.path.join(workdir, f"corpus_{size}.sqlite"))
+    try:
+        elapsed, error = _timed(st.generate_trend_report, subreddit, os.path.join(workdir, f"{subreddit}.md"),
+                                'week', size, workers, "async", workers * 2, False, None, store)
+    finally:
+        store.close()
+    return [elapsed], [error] if error else []
+
+def _bench_service(urls: list[str], summarize, workers: int) -> tuple[list[float], list]:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda url: _timed(summarize, url), urls))
+    return [elapsed for elapsed, _ in results], [error for _, error in results if error]
+
+def bench_post(size: int, servers: dict, workdir: str, workers: int) -> tuple[list[float], list]:
+    from summarizer_daemon import SummarizationService
+
+    from reddit_post_summarizer import read_post_references
+
+    subreddit = f"posts{size}"
+    post_ids = servers["reddit"].post_ids(subreddit, size)
+    bulk_path = os.path.join(workdir, f"{subreddit}.jsonl")
+    with open(bulk_path, "w", encoding="utf-8") as f:
+        f.write('{"url": "https://www.reddit.com/r/truncated\n["not", "a", "record"]\n')
+        f.writelines(json.dumps({"url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/"}) + "\n"
+                     for post_id in post_ids)
+    read_ids = read_post_references(bulk_path)
+    if read_ids != post_ids:
+        return [0.0], [ValueError(f"read_post_references returned {len(read_ids)} of {len(post_ids)} post IDs")]
+
+    urls = [f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/" for post_id in read_ids]
+    return _bench_service(urls, SummarizationService().summarize_reddit, workers)
+
+def bench_repo(size: int, servers: dict, workdir: str, workers: int) -> tuple[list[float], list]:
+    from summarizer_daemon import SummarizationService
+
+    urls = [f"https://github.com/bench/repo-{size}-{i}" for i in range(size)]
+    return _bench_service(urls, SummarizationService().summarize_github, workers)
+
+def bench_docs(size: int, servers: dict, workdir: str, workers: int) -> tuple[list[float], list]:
+    from openai import OpenAI
+    import github_repo_summarizer as gr
+
+    client = OpenAI(max_retries=0)
+
+    def summarize(url):
+        repo_name, docs = gr.get_github_docs_content(url)
+        if isinstance(docs, str):
+            raise RuntimeError(docs)
+        _, failed, _ = gr.summarize_repository_docs(repo_name, docs, client, workers=workers)
+        if failed:
+            raise RuntimeError(f"{len(failed)} files failed, e.g. {failed[0]['path']}: {failed[0]['error']}")
+
+    latencies, errors = [], []
+    for i in range(size):
+        elapsed, error = _timed(summarize, f"https://github.com/bench/docs-{size}-{i}")
+        latencies.append(elapsed)
+        errors += [error] if error else []
+    return latencies, errors
+
+BENCHMARKS = {"trends": bench_trends, "post": bench_post, "repo": bench_repo, "docs": bench_docs}
+
+def run_case(scenario: str, size: int, servers: dict, workdir: str, workers: int, verbose: bool = False) -> dict:
+    import metrics
+
+    metrics.reset()
+    before = {name: server.total_requests() for name, server in servers.items()}
+    # The pipelines print progress for every item; only keep it when asked to
+    output = contextlib.ExitStack()
+    if not verbose:
+        output.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        output.enter_context(contextlib.redirect_stderr(io.StringIO()))  # tqdm progress bars
+    start = time.perf_counter()
+    with output:
+        latencies, errors = BENCHMARKS[scenario](size, servers, workdir, workers)
+    wall = time.perf_counter() - start
+    if errors:
+        print(f"  {scenario} x{size}: {len(errors)} failed, e.g. {type(errors[0]).__name__}: {str(errors[0])[:200]}")
+
+    tokens = sum(entry["prompt_tokens"] + entry["completion_tokens"] for entry in metrics.run_summary()["llm"].values())
+    return {
+        "scenario": scenario,
+        "size": size,
+        "failures": len(errors),
+        "wall_s": round(wall, 3),
+        "items_per_s": round(size / wall, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "requests_per_item": {name: round((server.total_requests() - before[name]) / size, 2)
+                              for name, server in servers.items()},
+        "llm_tokens_per_item": round(tokens / size, 1),
+    }
+
+def print_result(result: dict) -> None:
+    requests = " ".join(f"{name}={count}" for name, count in result["requests_per_item"].items())
+    print(f"{result['scenario']:<7} {result['size']:>6} {result['items_per_s']:>9.2f} {result['p50_ms']:>9.1f} "
+          f"{result['p95_ms']:>9.1f} {result['llm_tokens_per_item']:>9.1f} {result['failures']:>5}  {requests}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of trends,post,repo,docs.")
+    parser.add_argument("--sizes", default="10,50,200", help="Comma-separated corpus sizes (posts or READMEs).")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of every fake API response.")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Uniform random latency added on top.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with a 429 and Retry-After.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests (post/repo) or scrape workers (trends).")
+    parser.add_argument("--reddit-rpm", type=int, default=6000,
+                        help="Reddit token-bucket rate for the trends scrape (the real API allows 100).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency jitter and failure injection.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipelines' own progress output.")
+    parser.add_argument("--json", metavar="FILE", help="Append the results to FILE as a JSON line.")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    fault_options = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                         throttle_rate=args.rate_limit_rate, seed=args.seed)
+    servers = {
+        "reddit": FakeRedditServer(**fault_options).start(),
+        "openai": FakeOpenAIServer(**fault_options).start(),
+        "github": FakeGitHubServer(**fault_options).start(),
+    }
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(workdir)  # Reports and the fake praw.ini land in the scratch directory
+    # Must happen before the pipelines are imported: they read these at import time
+    configure_environment(servers["reddit"], servers["openai"], servers["github"])
+    os.environ.update({"LLM_CACHE_DISABLED": "1", "REDDIT_CORPUS_PATH": os.path.join(workdir, "corpus.sqlite"),
+                       "HTTP_CACHE_PATH": os.path.join(workdir, "http_responses.sqlite"),
+                       "REDDIT_REQUESTS_PER_MINUTE": str(args.reddit_rpm),
+                       "RETRY_BASE_DELAY_SECONDS": os.getenv("RETRY_BASE_DELAY_SECONDS", "0.05")})
+
+    results = []
+    print(f"Fake APIs: {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, {args.error_rate:.0%} errors, "
+          f"{args.rate_limit_rate:.0%} 429s; scratch dir {workdir}\n")
+    print(f"{'case':<7} {'size':>6} {'items/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'tok/item':>9} {'fail':>5}  requests/item")
+    try:
+        for scenario in scenarios:
+            for size in sizes:
+                result = run_case(scenario, size, servers, workdir, args.workers, args.verbose)
+                print_result(result)
+                results.append(result)
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    if json_path:
+        with open(json_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"timestamp": time.time(), "python": sys.version.split()[0],
+                                "options": vars(args), "results": results}) + "\n")
@@ -0,0 +1,66 @@
+# benchmarks/bench_import.py
+"""
+Cold-start benchmark for the CLI and pipeline modules.
+
+Each case runs in a fresh interpreter, so every measurement includes module
+import time, which is what `--help` and other fast paths pay.
+
+Usage:
+    python benchmarks/bench_import.py [--runs N] [--json FILE]
+With --json, results are appended as one JSON line per run for tracking over time.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "python -c pass (interpreter baseline)": [sys.executable, "-c", "pass"],
+    "cli.py --help": [sys.executable, "cli.py", "--help"],
+    "cli.py trends --help": [sys.executable, "cli.py", "trends", "--help"],
+    "cli.py post --help": [sys.executable, "cli.py", "post", "--help"],
+    "cli.py repo --help": [sys.executable, "cli.py", "repo", "--help"],
+    "import subreddit_trends": [sys.executable, "-c", "import subreddit_trends"],
+    "import reddit_post_summarizer": [sys.executable, "-c", "import reddit_post_summarizer"],
+    "import github_repo_summarizer": [sys.executable, "-c", "import github_repo_summarizer"],
+    "import praw, openai, nltk, requests (eager reference)": [
+        sys.executable, "-c", "import praw, openai, nltk, requests"
+    ],
+}
+
+def measure(command: list[str], runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return []
+        timings.append(elapsed * 1000)
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per case.")
+    parser.add_argument("--json", metavar="FILE", help="Append the results to FILE as a JSON line.")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<56} {'min ms':>8} {'median ms':>10}")
+    for name, command in CASES.items():
+        timings = measure(command, args.runs)
+        if not timings:
+            print(f"{name:<56} {'failed (missing dependency?)':>19}")
+            continue
+        results[name] = {"min_ms": round(min(timings), 1), "median_ms": round(statistics.median(timings), 1)}
+        print(f"{name:<56} {results[name]['min_ms']:>8.1f} {results[name]['median_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"timestamp": time.time(), "python": sys.version.split()[0], "results": results}) + "\n")
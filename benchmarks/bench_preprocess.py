@@ -0,0 +1,120 @@
+# benchmarks/bench_preprocess.py
+"""
+Micro-benchmark for `summarizer_utils.preprocess_text_to_numbered_sentences`.
+
+Compares the single-pass regex cleaner + cached Punkt tokenizer against the
+original path (Markdown → HTML → BeautifulSoup, then `nltk.sent_tokenize`),
+and checks that both produce the same sentence IDs on the corpus. Also
+guards the cleaner against super-linear inputs (unpaired `*`/`_`): each of
+PATHOLOGICAL_INPUTS must clean within --time-budget seconds, or the script
+exits non-zero.
+
+Usage:
+    python benchmarks/bench_preprocess.py [FILE_OR_DIR ...] [--repeat N] [--time-budget SECONDS]
+Defaults to every Markdown file in the repository.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import nltk
+import summarizer_utils as su
+
+# Unpaired emphasis delimiters, as in shell globs and snake_case identifiers
+PATHOLOGICAL_INPUTS = {
+    "unpaired *": "*a " * 10000,
+    "unpaired _": "_a " * 10000,
+    "unpaired **": "**a " * 8000,
+    "shell globs": "Run `make` then ls *.py and rm -rf build_* dist_*\n" * 1500,
+    "open * to end of block": "*" + "word " * 20000,
+}
+
+def legacy_sentences(raw_text: str) -> list[str]:
+    return nltk.sent_tokenize(su.clean_text_from_markup_via_html(raw_text))
+
+def fast_sentences(raw_text: str) -> list[str]:
+    return su.get_sentence_tokenizer().tokenize(su.clean_text_from_markup(raw_text))
+
+def load_corpus(paths: list[str]) -> list[tuple[str, str]]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "**", "*.md"), recursive=True))
+        else:
+            files.append(path)
+    corpus = []
+    for file_path in sorted(set(files)):
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            corpus.append((file_path, f.read()))
+    return corpus
+
+def time_path(func, corpus: list[tuple[str, str]], repeat: int) -> float:
+    """Best-of-`repeat` seconds to process the whole corpus."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def check_pathological_inputs(budget: float) -> list[tuple[str, float]]:
+    """Returns (name, seconds) for each of PATHOLOGICAL_INPUTS that took longer than `budget` to clean."""
+    slow = []
+    for name, text in PATHOLOGICAL_INPUTS.items():
+        start = time.perf_counter()
+        su.clean_text_from_markup(text)
+        elapsed = time.perf_counter() - start
+        print(f"Pathological input '{name}' ({len(text) / 1024:.0f} KiB): {elapsed * 1000:.1f} ms")
+        if elapsed > budget:
+            slow.append((name, elapsed))
+    return slow
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=[REPO_ROOT], help="Markdown files or directories to use as the corpus.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes per path; the best is reported.")
+    parser.add_argument("--time-budget", type=float, default=0.5,
+                        help="Seconds each pathological input may take to clean before the check fails.")
+    args = parser.parse_args()
+
+    slow = check_pathological_inputs(args.time_budget)
+    for name, elapsed in slow:
+        print(f"  SLOW: '{name}' took {elapsed:.2f} s (budget {args.time_budget:.2f} s)")
+
+    su.download_nltk_data_if_needed()
+    corpus = load_corpus(args.paths)
+    if not corpus:
+        sys.exit("No Markdown files found.")
+    total_kb = sum(len(text) for _, text in corpus) / 1024
+
+    mismatches = []
+    for file_path, text in corpus:
+        legacy, fast = legacy_sentences(text), fast_sentences(text)
+        if legacy != fast:
+            first = next((i for i, (a, b) in enumerate(zip(legacy, fast)) if a != b), min(len(legacy), len(fast)))
+            mismatches.append((file_path, len(legacy), len(fast), first,
+                               legacy[first] if first < len(legacy) else None,
+                               fast[first] if first < len(fast) else None))
+
+    legacy_time = time_path(legacy_sentences, corpus, args.repeat)
+    fast_time = time_path(fast_sentences, corpus, args.repeat)
+
+    print(f"Corpus: {len(corpus)} files, {total_kb:.1f} KiB")
+    print(f"Legacy (markdown + BeautifulSoup + sent_tokenize): {legacy_time * 1000:8.1f} ms")
+    print(f"Fast (regex cleaner + cached tokenizer):          {fast_time * 1000:8.1f} ms")
+    print(f"Speedup: {legacy_time / fast_time:.1f}x")
+    print(f"Sentence IDs identical on {len(corpus) - len(mismatches)} of {len(corpus)} files.")
+    for file_path, legacy_count, fast_count, first, legacy_sentence, fast_sentence in mismatches:
+        print(f"  {os.path.relpath(file_path, REPO_ROOT)}: {legacy_count} legacy vs {fast_count} fast sentences, "
+              f"first difference at S{first + 1}")
+        print(f"    legacy: {legacy_sentence!r}")
+        print(f"    fast:   {fast_sentence!r}")
+    if slow:
+        sys.exit(1)
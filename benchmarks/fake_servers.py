@@ -0,0 +1,402 @@
+# benchmarks/fake_servers.py
+"""
+Local stand-ins for the Reddit API, the OpenAI API and raw.githubusercontent.com
+(plus codeload.github.com archives),
+for offline benchmarks and dry runs.
+
+Every server is a threaded HTTP server on 127.0.0.1 with configurable latency
+(`latency_ms` plus uniform `jitter_ms`) and error injection (`error_rate` of
+requests answered 500, `throttle_rate` answered 429 with a Retry-After header),
+and counts the requests it serves per endpoint. Point the pipelines at them with:
+
+    oauth_url / reddit_url in praw.ini → FakeRedditServer.url  (PRAW reads ./praw.ini)
+    OPENAI_BASE_URL                   → FakeOpenAIServer.url + "/v1"
+    GITHUB_RAW_BASE_URL               → FakeGitHubServer.url
+    GITHUB_CODELOAD_BASE_URL          → FakeGitHubServer.url  (repository archives)
+
+`configure_environment` sets all of these (plus dummy credentials) at once.
+"""
+
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tarfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ("retrieval augmented generation vector index embedding chunking reranker latency context window "
+         "prompt evaluation benchmark hybrid search keyword dense sparse pipeline agent tool memory cache "
+         "document parser table image graph query rewrite citation hallucination grounding model").split()
+
+def _sentences(rng: random.Random, count: int) -> str:
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+        for _ in range(count)
+    )
+
+class Chunks(list):
+    """A response body sent as separate byte chunks, `chunk_delay_ms` apart (e.g. server-sent events)."""
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send(self, status: int, body, content_type: str = "application/json", headers: dict | None = None):
+        chunks = body if isinstance(body, Chunks) else [body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")]
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i and self.server.fake.chunk_delay_ms:
+                time.sleep(self.server.fake.chunk_delay_ms / 1000)
+            self.wfile.write(chunk)
+            self.wfile.flush()
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return dict((key, values[0]) for key, values in parse_qs(body.decode()).items())
+
+    def _dispatch(self, method: str):
+        server = self.server.fake
+        path = urlparse(self.path).path
+        body = self._read_json() if method == "POST" else {}  # Always drain the body to keep the connection usable
+        server.count(server.endpoint_name(method, path))
+        server.delay()
+        failure = server.injected_failure()
+        if failure == 429:
+            self._send(429, {"error": {"message": "Rate limit reached (injected)."}}, headers={"Retry-After": "0"})
+        elif failure == 500:
+            self._send(500, {"error": {"message": "Internal error (injected)."}})
+        else:
+            status, body, content_type, headers = server.handle(method, self.path, body, self.headers)
+            self._send(status, body, content_type, headers)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+class FakeServer:
+    """Base class: serves `handle()` on a background thread with latency and error injection."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.chunk_delay_ms = 0.0
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FakeHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def delay(self) -> None:
+        with self._lock:
+            seconds = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def injected_failure(self) -> int | None:
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def endpoint_name(self, method: str, path: str) -> str:
+        return f"{method} {path}"
+
+    def handle(self, method: str, raw_path: str, body: dict, headers) -> tuple:
+        """Returns (status, body, content type, extra headers)."""
+        raise NotImplementedError
+
+# --- Reddit ---
+class FakeRedditServer(FakeServer):
+    """
+    Serves the subset of the Reddit JSON API that PRAW uses here: app-only OAuth,
+    subreddit top/new listings, /api/info and comment trees. Every subreddit holds
+    `posts_per_subreddit` deterministic posts with `comments_per_post` comments each.
+    """
+
+    def __init__(self, posts_per_subreddit: int = 100, comments_per_post: int = 20, **kwargs):
+        super().__init__(**kwargs)
+        self.posts_per_subreddit = posts_per_subreddit
+        self.comments_per_post = comments_per_post
+        self.now = time.time()
+        self._index = {}  # Post ID → post record, filled as listings are served
+
+    def endpoint_name(self, method, path):
+        if path.startswith("/comments/"):
+            return "comments"
+        return path.rstrip("/").rsplit("/", 1)[-1] or path
+
+    def _post(self, subreddit: str, index: int) -> dict:
+        post_id = f"{hashlib.md5(f'{subreddit}/{index}'.encode()).hexdigest()[:6]}"
+        rng = random.Random(post_id)
+        return {
+            "id": post_id, "name": f"t3_{post_id}", "subreddit": subreddit, "author": f"user{index % 17}",
+            "title": " ".join(rng.choice(WORDS) for _ in range(6)).capitalize(),
+            "selftext": _sentences(rng, rng.randint(2, 6)), "is_self": True,
+            "url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+            "permalink": f"/r/{subreddit}/comments/{post_id}/post_{index}/",
+            "score": 1000 - index, "num_comments": self.comments_per_post,
+            "created_utc": self.now - index * 1800, "stickied": False,
+        }
+
+    def _listing(self, subreddit: str, query: dict, newest_first: bool) -> dict:
+        limit = min(int(query.get("limit", ["25"])[0]), 100)
+        after = query.get("after", [None])[0]
+        posts = [self._post(subreddit, i) for i in range(self.posts_per_subreddit)]
+        if newest_first:
+            posts.sort(key=lambda post: -post["created_utc"])
+        for post in posts:
+            self._index[post["id"]] = post
+        start = next((i + 1 for i, post in enumerate(posts) if post["name"] == after), 0) if after else 0
+        page = posts[start:start + limit]
+        next_after = page[-1]["name"] if page and start + limit < len(posts) else None
+        return {"kind": "Listing", "data": {"after": next_after, "before": None,
+                                            "children": [{"kind": "t3", "data": post} for post in page]}}
+
+    def _comments(self, post: dict, limit: int) -> list:
+        rng = random.Random(post["id"] + "c")
+        comments = [
+            {"kind": "t1", "data": {
+                "id": f"{post['id']}c{j}", "name": f"t1_{post['id']}c{j}", "body": _sentences(rng, rng.randint(1, 4)),
+                "author": f"user{j % 11}", "stickied": j == 0 and rng.random() < 0.2, "score": 100 - j,
+                "parent_id": post["name"], "link_id": post["name"], "subreddit": post["subreddit"], "replies": "",
+            }}
+            for j in range(min(limit, self.comments_per_post))
+        ]
+        return [
+            {"kind": "Listing", "data": {"after": None, "children": [{"kind": "t3", "data": post}]}},
+            {"kind": "Listing", "data": {"after": None, "children": comments}},
+        ]
+
+    def handle(self, method, raw_path, body, headers):
+        parsed = urlparse(raw_path)
+        path, query = parsed.path.rstrip("/"), parse_qs(parsed.query)
+        if path == "/api/v1/access_token":
+            return 200, {"access_token": "fake-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"}, "application/json", {}
+        match = re.fullmatch(r"/r/([^/]+)/(top|new|hot)", path)
+        if match:
+            return 200, self._listing(match.group(1), query, newest_first=match.group(2) == "new"), "application/json", {}
+        if path == "/api/info":
+            ids = ",".join(query.get("id", [""])).split(",")
+            children = [{"kind": "t3", "data": self._index[name[3:]]} for name in ids if name[3:] in self._index]
+            return 200, {"kind": "Listing", "data": {"after": None, "children": children}}, "application/json", {}
+        match = re.fullmatch(r"/comments/([a-z0-9]+)(?:/.*)?", path)
+        if match and match.group(1) in self._index:
+            limit = int(query.get("limit", [str(self.comments_per_post)])[0])
+            return 200, self._comments(self._index[match.group(1)], limit), "application/json", {}
+        return 404, {"message": "Not Found", "error": 404}, "application/json", {}
+
+    def post_ids(self, subreddit: str, count: int) -> list[str]:
+        """IDs of the first `count` posts of `subreddit` (registering them for /comments lookups)."""
+        posts = [self._post(subreddit, i) for i in range(count)]
+        for post in posts:
+            self._index[post["id"]] = post
+        return [post["id"] for post in posts]
+
+# --- OpenAI ---
+class FakeOpenAIServer(FakeServer):
+    """
+    OpenAI-compatible /v1/chat/completions and /v1/embeddings. Answers are derived
+    from the prompt so every pipeline can parse them: key sentence IDs, trend blocks,
+    batch and single classifications, summaries citing sentences or files, and hashed embedding vectors.
+    """
+
+    def __init__(self, embedding_dim: int = 64, token_delay_ms: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.embedding_dim = embedding_dim
+        self.chunk_delay_ms = token_delay_ms  # Gap between streamed chunks (stream=true)
+
+    def endpoint_name(self, method, path):
+        return path.rsplit("/", 1)[-1]
+
+    def _answer(self, messages: list[dict], json_mode: bool) -> str:
+        prompt = "\n".join(message.get("content") or "" for message in messages)
+        if json_mode and "key_sentence_ids" in prompt:
+            ids = list(dict.fromkeys(re.findall(r"\[(S\d+)\]", prompt)))
+            count = int(re.search(r"Identify the (\d+) most important", prompt).group(1)) if "most important" in prompt else 5
+            return json.dumps({"key_sentence_ids": ids[::max(1, len(ids) // max(count, 1))][:count]})
+        if json_mode and "classifications" in prompt:
+            post_count = len(re.findall(r"^\s*POST \d+:", prompt, re.MULTILINE))
+            return json.dumps({"classifications": [{"post_index": i, "trend_number": (i % 4) + 1} for i in range(1, post_count + 1)]})
+        if "Trend Title:" in prompt:
+            count = int(re.search(r"top (\d+)", prompt).group(1)) if re.search(r"top (\d+)", prompt) else 4
+            return "\n".join(f"Trend Title: Topic {i}\nSummary: Posts about {WORDS[i % len(WORDS)]} and {WORDS[(i * 7) % len(WORDS)]}.\n---"
+                             for i in range(1, count + 1))
+        if "Which trend number" in prompt:
+            return str(len(prompt) % 4 + 1)
+        ids = re.findall(r"\[(S\d+)\]", prompt)[:3] or re.findall(r"\[(D\d+)\]", prompt)[:3] or ["S1"]
+        return " ".join(f"This point is summarized here [{sid}]." for sid in ids)
+
+    def _usage(self, prompt_chars: int, completion_chars: int) -> dict:
+        prompt_tokens, completion_tokens = prompt_chars // 4 + 1, completion_chars // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+
+    def _embedding(self, text: str) -> list[float]:
+        vector = [0.0] * self.embedding_dim
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.embedding_dim] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def _stream_events(self, model: str, content: str, usage: dict) -> Chunks:
+        """Server-sent events for a streamed completion: one chunk per word, then usage, then [DONE]."""
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}])
+                  for piece in re.findall(r"\s*\S+", content)]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        events.append(dict(base, choices=[], usage=usage))
+        return Chunks([f"data: {json.dumps(event)}\n\n".encode("utf-8") for event in events] + [b"data: [DONE]\n\n"])
+
+    def handle(self, method, raw_path, body, headers):
+        path = urlparse(raw_path).path
+        if path.endswith("/chat/completions"):
+            messages = body.get("messages", [])
+            content = self._answer(messages, (body.get("response_format") or {}).get("type") == "json_object")
+            prompt_chars = sum(len(message.get("content") or "") for message in messages)
+            if body.get("stream"):
+                return 200, self._stream_events(body.get("model"), content, self._usage(prompt_chars, len(content))), \
+                    "text/event-stream", {}
+            return 200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": self._usage(prompt_chars, len(content)),
+            }, "application/json", {}
+        if path.endswith("/embeddings"):
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            usage = self._usage(sum(len(text) for text in inputs), 0)
+            return 200, {
+                "object": "list", "model": body.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": self._embedding(text)} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": usage["prompt_tokens"], "total_tokens": usage["prompt_tokens"]},
+            }, "application/json", {}
+        return 404, {"error": {"message": f"Unknown path {path}"}}, "application/json", {}
+
+# --- GitHub ---
+class FakeGitHubServer(FakeServer):
+    """
+    raw.githubusercontent.com and codeload.github.com stand-in: every repo has a generated
+    README.md on `main` only, and a tar.gz archive with more documentation at /<repo>/tar.gz/HEAD.
+    Responses carry an ETag and conditional requests for an unchanged README get a 304;
+    `edit(user_repo)` changes a README.
+    """
+
+    def __init__(self, readme_sentences: int = 120, **kwargs):
+        super().__init__(**kwargs)
+        self.readme_sentences = readme_sentences
+        self.revisions = Counter()
+
+    def endpoint_name(self, method, path):
+        return "readme" if path.endswith("README.md") else "archive" if "/tar.gz/" in path else path
+
+    def edit(self, user_repo: str) -> None:
+        with self._lock:
+            self.revisions[user_repo] += 1
+
+    def readme(self, user_repo: str) -> str:
+        rng = random.Random(f"{user_repo}@{self.revisions[user_repo]}" if self.revisions[user_repo] else user_repo)
+        sections = [f"# {user_repo}\n\n![badge](https://img.shields.io/badge/x-y-green)\n\n{_sentences(rng, 3)}"]
+        for index in range(max(1, self.readme_sentences // 10)):
+            sections.append(f"## Section {index + 1}\n\n{_sentences(rng, 6)}\n\n- {_sentences(rng, 1)}\n- `code` {_sentences(rng, 1)}\n\n{_sentences(rng, 2)}")
+        return "\n\n".join(sections)
+
+    def archive(self, user_repo: str) -> bytes:
+        """A codeload-style tar.gz of the repo: documentation in several places plus files that are not docs."""
+        rng = random.Random(f"{user_repo}/archive")
+        files = {
+            "README.md": self.readme(user_repo),
+            "CONTRIBUTING.md": f"# Contributing\n\n{_sentences(rng, 8)}",
+            "docs/index.md": f"# Guide\n\n{_sentences(rng, 30)}",
+            "docs/api/reference.md": f"# API\n\n{_sentences(rng, 40)}",
+            "examples/README": _sentences(rng, 5),
+            "node_modules/dep/README.md": _sentences(rng, 20),
+            "src/main.py": "print('not documentation')\n",
+            "LICENSE": "MIT\n",
+        }
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for path, text in files.items():
+                data = text.encode("utf-8")
+                info = tarfile.TarInfo(f"{user_repo.split('/')[-1]}-0123abc/{path}")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def handle(self, method, raw_path, body, headers):
+        archive_match = re.fullmatch(r"/([^/]+/[^/]+)/tar\.gz/HEAD", urlparse(raw_path).path)
+        if archive_match:
+            return 200, self.archive(archive_match.group(1)), "application/x-gzip", {}
+        match = re.fullmatch(r"/([^/]+/[^/]+)/main/README\.md", urlparse(raw_path).path)
+        if match:
+            content = self.readme(match.group(1)).encode("utf-8")
+            etag = f'"{hashlib.sha1(content).hexdigest()[:16]}"'
+            if headers.get("If-None-Match") == etag:
+                return 304, b"", "text/plain", {"ETag": etag}
+            return 200, content, "text/plain; charset=utf-8", {"ETag": etag}
+        return 404, b"404: Not Found", "text/plain", {}
+
+def configure_environment(reddit: FakeRedditServer | None = None, openai: FakeOpenAIServer | None = None,
+                          github: FakeGitHubServer | None = None) -> None:
+    """
+    Points PRAW, the OpenAI SDK and the README fetcher at the given fakes. Call from the
+    directory the pipelines will run in (PRAW only takes endpoints from ./praw.ini or
+    constructor arguments) and before importing them.
+    """
+    if reddit:
+        with open("praw.ini", "w", encoding="utf-8") as f:
+            f.write(f"[DEFAULT]\noauth_url={reddit.url}\nreddit_url={reddit.url}\nshort_url={reddit.url}\n")
+        os.environ.update({
+            "PRAW_ALLOW_ENDPOINT_OVERRIDE": "1",  # The praw.ini above is ours
+            "REDDIT_CLIENT_ID": "fake-id", "REDDIT_CLIENT_SECRET": "fake-secret", "REDDIT_USERNAME": "benchmark",
+        })
+    if openai:
+        os.environ.update({"OPENAI_BASE_URL": openai.url + "/v1", "OPENAI_API_KEY": "fake-key"})
+    if github:
+        os.environ.update({"GITHUB_RAW_BASE_URL": github.url, "GITHUB_CODELOAD_BASE_URL": github.url})
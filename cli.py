@@ -0,0 +1,50 @@
+# cli.py
+"""
+Single entry point for the project's pipelines:
+
+    python cli.py trends [--subreddit Rag ...]   # subreddit_trends.py
+    python cli.py schedule Rag LocalLLaMA:day:5  # trend_scheduler.py
+    python cli.py post [URL | --bulk FILE]       # reddit_post_summarizer.py
+    python cli.py repo [URL]                     # github_repo_summarizer.py
+    python cli.py daemon [--port 8765]           # summarizer_daemon.py
+
+Only the module behind the chosen subcommand is imported, and those modules
+defer their heavy dependencies (praw, openai, nltk, requests) to the code
+paths that use them, so `--help` and argument errors return immediately.
+"""
+
+import argparse
+import importlib
+import sys
+
+import metrics
+
+# Subcommand → (module implementing add_arguments/run, help text)
+COMMANDS = {
+    "trends": ("subreddit_trends", "Identify discussion trends in a subreddit and map posts to them."),
+    "schedule": ("trend_scheduler", "Generate trend reports for many subreddits under shared rate limits."),
+    "post": ("reddit_post_summarizer", "Summarize a Reddit post (or many, with --bulk) with traceable citations."),
+    "repo": ("github_repo_summarizer", "Summarize a GitHub repository's README with traceable citations."),
+    "daemon": ("summarizer_daemon", "Serve post and README summaries over a local JSON API with warm clients."),
+}
+
+def build_parser(command: str | None = None) -> argparse.ArgumentParser:
+    """Builds the CLI parser; only `command`'s module is imported to register its arguments."""
+    parser = argparse.ArgumentParser(prog="cli.py", description="Reddit and GitHub summarization pipelines.")
+    metrics.add_arguments(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="{" + ",".join(COMMANDS) + "}")
+    for name, (module_name, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        if name == command:
+            importlib.import_module(module_name).add_arguments(subparser)
+    return parser
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    command = next((arg for arg in argv if arg in COMMANDS), None)
+    parser = build_parser(command if command in COMMANDS else None)
+    args = parser.parse_args(argv)
+    metrics.run_instrumented(importlib.import_module(COMMANDS[args.command][0]).run, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# corpus_store.py
+"""
+Local SQLite store for scraped Reddit posts and comments, keyed by Reddit ID.
+Lets `scrape_subreddit_data` run incrementally: only posts newer than the
+stored watermark are listed again, and comment trees are refetched only when
+a post's `num_comments` has changed since they were stored. Every `top()`
+listing saved here is recorded, so a later run can tell whether the store
+covers its time window and limit or needs a fresh listing.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE_PATH = os.getenv("REDDIT_CORPUS_PATH", os.path.join(".cache", "reddit_corpus.sqlite"))
+
+# Length of each `top()` time filter window, in seconds.
+TIME_FILTER_SECONDS = {
+    "hour": 3600,
+    "day": 24 * 3600,
+    "week": 7 * 24 * 3600,
+    "month": 31 * 24 * 3600,
+    "year": 366 * 24 * 3600,
+    "all": None,
+}
+
+class CorpusStore:
+    """Posts and their stored top comments for any number of subreddits. Safe to share between threads."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS posts (
+                id TEXT PRIMARY KEY,
+                subreddit TEXT NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                selftext TEXT NOT NULL DEFAULT '',
+                is_self INTEGER NOT NULL DEFAULT 0,
+                score INTEGER NOT NULL DEFAULT 0,
+                num_comments INTEGER NOT NULL DEFAULT 0,
+                created_utc REAL NOT NULL,
+                comments_num_comments INTEGER,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_subreddit_created ON posts (subreddit, created_utc);
+            CREATE TABLE IF NOT EXISTS comments (
+                id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL REFERENCES posts (id),
+                position INTEGER NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_comments_post ON comments (post_id, position);
+            CREATE TABLE IF NOT EXISTS listings (
+                subreddit TEXT NOT NULL,
+                time_filter TEXT NOT NULL,
+                top_limit INTEGER NOT NULL,
+                exhausted INTEGER NOT NULL DEFAULT 0,
+                listed_at REAL NOT NULL,
+                PRIMARY KEY (subreddit, time_filter)
+            );
+            """
+        )
+        listing_columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(listings)")}
+        if "exhausted" not in listing_columns:  # Stores created before listings recorded it
+            self._conn.execute("ALTER TABLE listings ADD COLUMN exhausted INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    # --- Posts ---
+    def upsert_post(self, post, subreddit_name: str) -> None:
+        """Inserts or refreshes a post's metadata from a PRAW submission, keeping its stored comments."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO posts (id, subreddit, title, url, selftext, is_self, score, num_comments, created_utc, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    title = excluded.title, url = excluded.url, selftext = excluded.selftext,
+                    score = excluded.score, num_comments = excluded.num_comments, updated_at = excluded.updated_at
+                """,
+                (post.id, subreddit_name.lower(), post.title, post.url, post.selftext or "", int(post.is_self),
+                 post.score, post.num_comments, post.created_utc, time.time()),
+            )
+            self._conn.commit()
+
+    def get_watermark(self, subreddit_name: str) -> float | None:
+        """Returns the creation time of the newest stored post, or None for an empty subreddit."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(created_utc) FROM posts WHERE subreddit = ?", (subreddit_name.lower(),)
+            ).fetchone()
+        return row[0]
+
+    def post_ids_since(self, subreddit_name: str, since_utc: float | None) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM posts WHERE subreddit = ? AND created_utc >= ?",
+                (subreddit_name.lower(), since_utc or 0),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def top_posts(self, subreddit_name: str, since_utc: float | None, limit: int) -> list[sqlite3.Row]:
+        """The stored equivalent of `subreddit.top()`: highest-scoring posts created since `since_utc`."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM posts WHERE subreddit = ? AND created_utc >= ? ORDER BY score DESC, created_utc DESC LIMIT ?",
+                (subreddit_name.lower(), since_utc or 0, limit),
+            ).fetchall()
+
+    # --- Listing coverage ---
+    def record_listing(self, subreddit_name: str, time_filter: str, limit: int, exhausted: bool = False) -> None:
+        """
+        Notes that the top `limit` posts of `time_filter` were just listed and saved. `exhausted`
+        means the listing ended before `limit`: every post in the window was listed.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO listings (subreddit, time_filter, top_limit, exhausted, listed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (subreddit_name.lower(), time_filter, limit, int(exhausted), time.time()),
+            )
+            self._conn.commit()
+
+    def covers(self, subreddit_name: str, time_filter: str, limit: int) -> bool:
+        """
+        True when the top posts of `time_filter` were listed into the store at least `limit` deep,
+        or all of them were (an exhausted listing). Posts newer than that listing are kept current
+        by `new`; a wider window's top posts do not stand in for a narrower window's, so only the
+        same time filter counts.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM listings WHERE subreddit = ? AND time_filter = ? AND (top_limit >= ? OR exhausted)",
+                (subreddit_name.lower(), time_filter, limit),
+            ).fetchone()
+        return row is not None
+
+    def listing_exhausted(self, subreddit_name: str, time_filter: str) -> bool:
+        """True when the last `top()` listing of `time_filter` held every post in the window."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT exhausted FROM listings WHERE subreddit = ? AND time_filter = ?",
+                (subreddit_name.lower(), time_filter),
+            ).fetchone()
+        return bool(row and row["exhausted"])
+
+    # --- Comments ---
+    def comments_are_stale(self, post_row: sqlite3.Row) -> bool:
+        return post_row["comments_num_comments"] != post_row["num_comments"]
+
+    def replace_comments(self, post_id: str, comments: list[tuple[str, str]], num_comments: int) -> None:
+        """Stores `(comment_id, body)` pairs as the post's comments, as of `num_comments`."""
+        with self._lock:
+            self._conn.execute("DELETE FROM comments WHERE post_id = ?", (post_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO comments (id, post_id, position, body) VALUES (?, ?, ?, ?)",
+                [(comment_id, post_id, position, body) for position, (comment_id, body) in enumerate(comments)],
+            )
+            self._conn.execute(
+                "UPDATE posts SET comments_num_comments = ? WHERE id = ?", (num_comments, post_id)
+            )
+            self._conn.commit()
+
+    def get_comments(self, post_id: str) -> list[tuple[str, str]]:
+        """The post's stored `(comment_id, body)` pairs, in their original order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, body FROM comments WHERE post_id = ? ORDER BY position", (post_id,)
+            ).fetchall()
+        return [(row["id"], row["body"]) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
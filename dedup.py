@@ -0,0 +1,107 @@
+# dedup.py
+"""
+Near-duplicate detection for sentences and posts, applied before prompting.
+
+Reddit threads repeat themselves: quoted replies, reposts, bot boilerplate.
+Each text is reduced to hashed word shingles and a MinHash signature;
+locality-sensitive hashing over signature bands proposes candidate pairs and
+the exact shingle Jaccard similarity confirms them, so only texts at least
+`threshold` similar are collapsed. The first occurrence of a text is kept as
+the representative and later near-copies point at it, so callers can keep
+every original ID (sentence citations, post listings) resolvable.
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+
+import metrics
+from token_utils import count_tokens
+
+DEFAULT_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 3
+# 32 hashes in 8 bands of 4: pairs at Jaccard 0.8 become candidates ~98.5% of the time
+NUM_PERMUTATIONS = 32
+NUM_BANDS = 8
+_PRIME = (1 << 61) - 1
+_HASH_MASK = (1 << 32) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+_WORD_RE = re.compile(r"\w+")
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> frozenset[int]:
+    """
+    Hashed word `size`-grams of the lower-cased text; texts shorter than `size` words form a single
+    shingle. Text without any words (emoji, a bare link's punctuation) has no shingles.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return frozenset()
+    grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)] or [" ".join(words)]
+    return frozenset(int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+                     for gram in grams)
+
+def minhash_signature(shingle_set: frozenset[int]) -> tuple[int, ...]:
+    """One minimum per permutation (a·x + b mod p, truncated to 32 bits) over the shingle hashes."""
+    return tuple(min(((a * x + b) % _PRIME) & _HASH_MASK for x in shingle_set) for a, b in _PERMUTATIONS)
+
+def jaccard(first: frozenset, second: frozenset) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+class NearDuplicateIndex:
+    """
+    Remembers texts by key and answers, for each new text, which earlier text it
+    nearly duplicates. Safe to share between threads.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._rows = NUM_PERMUTATIONS // NUM_BANDS
+        self._buckets: list[dict[tuple, list]] = [{} for _ in range(NUM_BANDS)]
+        self._shingles: dict = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, text: str):
+        """
+        Returns the key of an earlier near-duplicate of `text`, or None after indexing `text` under `key`.
+        Word-less text is never a duplicate and is not indexed: it has nothing to compare.
+        """
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        signature = minhash_signature(shingle_set)
+        bands = [signature[i * self._rows:(i + 1) * self._rows] for i in range(NUM_BANDS)]
+        with self._lock:
+            seen = set()
+            for buckets, band in zip(self._buckets, bands):
+                for candidate in buckets.get(band, ()):
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        if jaccard(shingle_set, self._shingles[candidate]) >= self.threshold:
+                            return candidate
+            self._shingles[key] = shingle_set
+            for buckets, band in zip(self._buckets, bands):
+                buckets.setdefault(band, []).append(key)
+        return None
+
+def find_near_duplicates(texts: list[str], threshold: float = DEFAULT_THRESHOLD) -> dict[int, int]:
+    """Maps the index of every text that nearly duplicates an earlier one to the index of that first occurrence."""
+    index = NearDuplicateIndex(threshold)
+    duplicate_of = {}
+    for i, text in enumerate(texts):
+        original = index.add(i, text)
+        if original is not None:
+            duplicate_of[i] = original
+    return duplicate_of
+
+def report_removed(kind: str, total: int, removed_texts: list[str]) -> int:
+    """Prints and records how many `kind` ("sentences", "posts") were collapsed and the prompt tokens saved."""
+    tokens_removed = sum(count_tokens(text) for text in removed_texts)
+    metrics.record_dedup(kind, total, len(removed_texts), tokens_removed)
+    if removed_texts:
+        print(f"Collapsed {len(removed_texts)} of {total} {kind} as near-duplicates (~{tokens_removed} prompt tokens removed).")
+    return tokens_removed
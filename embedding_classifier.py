@@ -0,0 +1,100 @@
+# embedding_classifier.py
+"""
+Embedding-based backend for the pass-2 post-to-trend mapping.
+Trends and posts are embedded in bulk, and every post is assigned in a single
+cosine-similarity matrix product instead of one chat completion per post.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+
+import metrics
+from llm_utils import LLM_REQUEST_TIMEOUT, wait_for_quota
+from reddit_utils import Post
+from resilience import call_with_retries, get_breaker
+from token_utils import truncate_to_tokens
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+# Longest input the embedding models accept; longer posts are truncated rather than rejected with a 400
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+# Posts whose best cosine similarity falls below this are mapped to "None".
+DEFAULT_SIMILARITY_THRESHOLD = 0.3
+
+class OpenAIEmbedder:
+    """
+    Embeds texts with the OpenAI embeddings endpoint, `batch_size` inputs per request,
+    each truncated to `max_input_tokens` first.
+    """
+
+    def __init__(self, client=None, model: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 256,
+                 max_input_tokens: int = EMBEDDING_MAX_INPUT_TOKENS):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(max_retries=0)  # Retries are handled by resilience
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_input_tokens = max_input_tokens
+
+    def _embed_batch(self, batch: list[str]):
+        wait_for_quota("\n".join(batch), completion_tokens=0)
+        return self.client.embeddings.create(model=self.model, input=batch, timeout=LLM_REQUEST_TIMEOUT)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        texts = [truncate_to_tokens(text, self.max_input_tokens, self.model) or " " for text in texts]  # Empty inputs are rejected
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = call_with_retries(self._embed_batch, batch, name="openai", breaker=get_breaker("openai"))
+            metrics.record_llm_usage(self.model, getattr(response, "usage", None))
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return np.asarray(vectors, dtype=np.float32)
+
+class HashingEmbedder:
+    """
+    Deterministic, offline stand-in for a real embedding model.
+    Hashes word unigrams and bigrams into a fixed number of signed buckets, so
+    texts sharing vocabulary get similar vectors. Useful for tests and dry runs.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        return vectors
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def classify_posts_by_embedding(posts: list[Post], trends_data: dict, embedder=None,
+                                threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> list:
+    """
+    Pass 2 via embeddings: assigns each post to its most similar trend (title + summary).
+    Returns 1-based trend numbers (or None below `threshold`) in the same order as `posts`,
+    matching the output of the LLM classifiers.
+    """
+    if not posts or not trends_data:
+        return [None] * len(posts)
+    if embedder is None:
+        embedder = OpenAIEmbedder()
+
+    trend_vectors = _normalize_rows(embedder.embed([f"{title}: {summary}" for title, summary in trends_data.items()]))
+    post_vectors = _normalize_rows(embedder.embed([post.text for post in posts]))
+
+    similarities = post_vectors @ trend_vectors.T  # (num_posts, num_trends)
+    best = similarities.argmax(axis=1)
+    best_scores = similarities[np.arange(len(posts)), best]
+    return [int(index) + 1 if score >= threshold else None for index, score in zip(best, best_scores)]
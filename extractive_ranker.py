@@ -0,0 +1,87 @@
+# extractive_ranker.py
+"""
+Local extractive sentence ranking, used to prefilter or replace the LLM key
+sentence extraction in `summarizer_utils`.
+
+Sentences become L2-normalised TF-IDF rows (sublinear term frequency) kept as
+coordinate arrays, so nothing of size sentences × vocabulary or sentences ×
+sentences is ever materialised. Two scorers are available:
+  - "textrank": PageRank over the cosine-similarity graph of the sentences,
+    with similarity products computed as X(Xᵀv) in O(non-zeros) per iteration
+  - "tfidf": cosine similarity of each sentence to the document centroid
+"""
+
+import re
+
+import numpy as np
+
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-6
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def _tfidf_coordinates(sentences: list[str]):
+    """Returns (rows, cols, values) of the row-normalised TF-IDF matrix, and its vocabulary size."""
+    vocabulary, rows, cols = {}, [], []
+    for row, sentence in enumerate(sentences):
+        for word in _WORD_RE.findall(sentence.lower()):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    if not rows:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), 0
+
+    # Collapse repeated (sentence, term) pairs into counts
+    pairs, counts = np.unique(np.asarray(rows, np.int64) * len(vocabulary) + np.asarray(cols, np.int64),
+                              return_counts=True)
+    rows, cols = pairs // len(vocabulary), pairs % len(vocabulary)
+    document_frequency = np.bincount(cols, minlength=len(vocabulary))
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1.0
+    values = (1.0 + np.log(counts)) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(sentences)))
+    values = values / norms[rows]
+    return rows, cols, values, len(vocabulary)
+
+def _textrank_scores(rows, cols, values, sentence_count: int, vocabulary_size: int) -> np.ndarray:
+    has_terms = np.bincount(rows, minlength=sentence_count) > 0
+
+    def similarity_times(vector):
+        # S·v with S = X·Xᵀ minus its diagonal (each normalised row has self-similarity 1)
+        term_weights = np.bincount(cols, weights=values * vector[rows], minlength=vocabulary_size)
+        return np.bincount(rows, weights=values * term_weights[cols], minlength=sentence_count) - vector * has_terms
+
+    degree = similarity_times(np.ones(sentence_count))
+    scores = np.full(sentence_count, 1.0 / sentence_count)
+    for _ in range(MAX_ITERATIONS):
+        # Sentences sharing no terms with any other spread their score evenly
+        flow = similarity_times(np.divide(scores, degree, out=np.zeros_like(scores), where=degree > 0))
+        flow += scores[degree <= 0].sum() / sentence_count
+        updated = (1 - DAMPING) / sentence_count + DAMPING * flow
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+def _centroid_scores(rows, cols, values, sentence_count: int, vocabulary_size: int) -> np.ndarray:
+    centroid = np.bincount(cols, weights=values, minlength=vocabulary_size)
+    norm = np.linalg.norm(centroid)
+    if norm == 0:
+        return np.zeros(sentence_count)
+    return np.bincount(rows, weights=values * centroid[cols] / norm, minlength=sentence_count)
+
+SCORERS = {"textrank": _textrank_scores, "tfidf": _centroid_scores}
+
+def rank_sentences(sentences_map: dict, method: str = "textrank") -> list[str]:
+    """Returns the IDs of `sentences_map` from most to least central; ties keep document order."""
+    ids = list(sentences_map)
+    if not ids:
+        return []
+    rows, cols, values, vocabulary_size = _tfidf_coordinates([sentences_map[sid] for sid in ids])
+    if vocabulary_size == 0:
+        return ids
+    scores = SCORERS[method](rows, cols, values, len(ids), vocabulary_size)
+    return [ids[i] for i in np.argsort(-scores, kind="stable")]
+
+def top_sentence_ids(sentences_map: dict, count: int, method: str = "textrank") -> list[str]:
+    """The `count` highest-ranked sentence IDs, in document order."""
+    chosen = set(rank_sentences(sentences_map, method)[:count])
+    return [sid for sid in sentences_map if sid in chosen]
@@ -1,74 +1,404 @@
 # github_repo_summarizer.py
+# `requests` and the OpenAI SDK are imported on first use, keeping module import cheap.
+# READMEs are fetched over a pooled session and revalidated from an on-disk cache (see http_cache.py).
+# --all-docs streams the repository archive once and summarizes every Markdown file, then the repository.
 
-import requests
+import argparse
+import hashlib
+import json
 import re
 import os
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 # --- Import the core summarization logic ---
+import metrics
 import summarizer_utils as su
+from llm_utils import chat_completion
+from resilience import CircuitOpenError, call_with_retries, get_breaker
+from singleflight import get_group
 
 load_dotenv()
 
+SUMMARY_HEADING = ["\n\n---", "## Part 2: Final Summary (with Citations)\n"]
+# (connect, read) timeouts in seconds for each README request
+GITHUB_TIMEOUT = (5, 30)
+GITHUB_RAW_BASE_URL = os.getenv("GITHUB_RAW_BASE_URL", "https://raw.githubusercontent.com").rstrip("/")
+README_BRANCHES = ['main', 'master']
+# Shared by all fetches: each README fetch probes every branch in README_BRANCHES at once
+GITHUB_PROBE_WORKERS = int(os.getenv("GITHUB_PROBE_WORKERS", "16"))
+_probe_executor = None
+_probe_executor_lock = threading.Lock()
+GITHUB_CODELOAD_BASE_URL = os.getenv("GITHUB_CODELOAD_BASE_URL", "https://codeload.github.com").rstrip("/")
+# Documentation picked out of the repository archive by --all-docs
+DOC_SUFFIXES = (".md", ".markdown")
+DOC_BASENAMES = {"README", "CONTRIBUTING", "CHANGELOG", "CHANGES", "HISTORY"}
+DOC_EXCLUDED_DIRS = {"node_modules", "vendor", "third_party", "site-packages", ".venv"}
+GITHUB_DOC_MAX_BYTES = int(os.getenv("GITHUB_DOC_MAX_BYTES", str(512 * 1024)))
+GITHUB_DOCS_MAX_FILES = int(os.getenv("GITHUB_DOCS_MAX_FILES", "40"))
+_SENTENCE_CITATION_RE = re.compile(r"\s*\[S\d+(?:\s*,\s*S\d+)*\]")
+
 # --- GitHub-Specific Data Fetching ---
+def normalize_repo_url(repo_url: str) -> str:
+    """Returns a key identifying the repository behind any URL form (.git suffix, sub-paths, letter case)."""
+    match = re.search(r"github\.com/([^/]+/[^/.]+)", repo_url)
+    return f"github:{match.group(1).lower()}" if match else repo_url.strip()
+
 def get_github_readme_content(repo_url: str) -> tuple[str | None, str]:
-    """Retrieves the repo name and raw text content of the README.md for a given GitHub repo URL."""
+    """
+    Retrieves the repo name and raw text content of the README.md for a given GitHub repo URL.
+    On failure the repo name is None and the text is an error message.
+    Concurrent calls for the same repository share a single fetch.
+    """
+    return get_group("github_readme_fetch").do(normalize_repo_url(repo_url), _fetch_github_readme_content, repo_url)
+
+def _fetch_github_readme_content(repo_url: str) -> tuple[str | None, str]:
+    import requests
+    from http_cache import get_default_cache, get_session
+
     match = re.search(r"github\.com/([^/]+/[^/.]+)", repo_url)
     if not match:
         return None, "Error: Could not extract a valid 'user/repo' from the URL."
-        
+
     user_repo = match.group(1).replace('.git', '')
     repo_name_for_file = user_repo.replace('/', '_')
-    
-    for branch in ['main', 'master']:
-        raw_url = f"https://raw.githubusercontent.com/{user_repo}/{branch}/README.md"
+    session, cache = get_session(), get_default_cache()
+
+    def fetch(url):
+        if cache:
+            response = cache.get(session, url, timeout=GITHUB_TIMEOUT)
+        else:
+            response = session.get(url, timeout=GITHUB_TIMEOUT)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()  # Transient: let call_with_retries back off and try again
+        return response
+
+    def raw_url(branch):
+        return f"{GITHUB_RAW_BASE_URL}/{user_repo}/{branch}/README.md"
+
+    def probe(branch):
+        return branch, call_with_retries(fetch, raw_url(branch), name="github", breaker=get_breaker("github"))
+
+    def found(branch, response):
+        unchanged = " (unchanged since the last fetch)" if getattr(response, "revalidated", False) else ""
+        print(f"Successfully fetched README.md from the '{branch}' branch{unchanged}.")
+        return repo_name_for_file, response.text
+
+    # A branch that served the README before is revalidated on its own first
+    branches = list(README_BRANCHES)
+    known = [branch for branch in branches if cache and cache.contains(raw_url(branch))]
+    if known:
         try:
-            response = requests.get(raw_url)
+            branch, response = probe(known[0])
             if response.status_code == 200:
-                print(f"Successfully fetched README.md from the '{branch}' branch.")
-                return repo_name_for_file, response.text
-        except requests.exceptions.RequestException as e:
-            return None, f"An error occurred while fetching the README: {e}"
-            
+                return found(branch, response)
+        except (requests.exceptions.RequestException, CircuitOpenError):
+            pass  # Probe every branch below
+        branches.remove(known[0])
+
+    # The remaining default-branch guesses go out at once; the first README to arrive wins
+    error = None
+    futures = [_get_probe_executor().submit(probe, branch) for branch in branches]
+    for future in as_completed(futures):
+        try:
+            branch, response = future.result()
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            error = e
+            continue
+        if response.status_code == 200:
+            for other in futures:
+                other.cancel()
+            return found(branch, response)
+    if error is not None:
+        return None, f"Error: Could not fetch the README: {error}"
+
     return None, f"Error: Could not find README.md in either 'main' or 'master' branch for {user_repo}."
 
-# --- Main Execution Block ---
-if __name__ == "__main__":
+def _get_probe_executor() -> ThreadPoolExecutor:
+    global _probe_executor
+    with _probe_executor_lock:
+        if _probe_executor is None:
+            _probe_executor = ThreadPoolExecutor(max_workers=GITHUB_PROBE_WORKERS, thread_name_prefix="readme-probe")
+        return _probe_executor
+
+# --- Summary reuse ---
+def _summary_key(readme_text: str, model: str, extractor: str) -> str:
+    digest = hashlib.sha256(readme_text.encode("utf-8")).hexdigest()
+    return f"github_summary:{model}:{extractor}:{digest}"
+
+def get_cached_summary(readme_text: str, model: str, extractor: str) -> dict | None:
+    """
+    The summary stored for this exact README text by `store_summary`, if any: an unchanged
+    README (typically a 304) is never summarized again. Disabled with HTTP_CACHE_DISABLED.
+    """
+    from http_cache import get_default_cache
+    cache = get_default_cache()
+    value = cache.get_derived(_summary_key(readme_text, model, extractor)) if cache else None
+    return json.loads(value) if value else None
+
+def store_summary(readme_text: str, model: str, extractor: str, summary: dict) -> None:
+    """Stores {"sentence_count", "key_sentences": [{"id", "text"}], "summary"} for `get_cached_summary`."""
+    from http_cache import get_default_cache
+    cache = get_default_cache()
+    if cache:
+        cache.put_derived(_summary_key(readme_text, model, extractor), json.dumps(summary, ensure_ascii=False))
+
+# --- Whole-Repository Documentation ---
+def is_documentation_path(path: str) -> bool:
+    """Markdown files anywhere in the tree plus extension-less READMEs and the like, outside vendored code."""
+    parts = path.split("/")
+    if any(part in DOC_EXCLUDED_DIRS for part in parts[:-1]):
+        return False
+    stem, suffix = os.path.splitext(parts[-1])
+    return suffix.lower() in DOC_SUFFIXES or (suffix.lower() in ("", ".txt") and stem.upper() in DOC_BASENAMES)
+
+def _doc_priority(path: str) -> tuple:
+    """Root README first, then other top-level files, then docs/, then everything else by depth."""
+    depth = path.count("/")
+    is_readme = os.path.splitext(os.path.basename(path))[0].upper() == "README"
+    return (not (is_readme and depth == 0), depth > 0, not path.lower().startswith("docs/"), depth, path.lower())
+
+def get_github_docs_content(repo_url: str) -> tuple[str | None, dict | str]:
+    """
+    Streams the repository's tar.gz archive once and returns the repo name and {path: text} of
+    its documentation files, read in memory as they pass by; nothing else is kept or written
+    to disk. On failure the second element is an error message starting with "Error:".
+    """
+    import requests
+    import tarfile
+    from urllib3.exceptions import HTTPError as TransportError  # Raised while streaming the body
+    from http_cache import get_session
+
+    match = re.search(r"github\.com/([^/]+/[^/.]+)", repo_url)
+    if not match:
+        return None, "Error: Could not extract a valid 'user/repo' from the URL."
+    user_repo = match.group(1).replace('.git', '')
+    archive_url = f"{GITHUB_CODELOAD_BASE_URL}/{user_repo}/tar.gz/HEAD"
+
+    def download():
+        docs, skipped = {}, 0
+        with get_session().get(archive_url, stream=True, timeout=GITHUB_TIMEOUT) as response:
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()  # Transient: let call_with_retries back off and try again
+            if response.status_code != 200:
+                return None, response.status_code
+            response.raw.decode_content = True
+            # "r|*" reads the archive as a forward-only stream, whatever its compression
+            with tarfile.open(fileobj=response.raw, mode="r|*") as archive:
+                for member in archive:
+                    path = member.name.split("/", 1)[-1]  # Drop the "repo-<sha>/" prefix
+                    if not member.isfile() or not is_documentation_path(path):
+                        continue
+                    if member.size > GITHUB_DOC_MAX_BYTES:
+                        skipped += 1
+                        continue
+                    docs[path] = archive.extractfile(member).read().decode("utf-8", errors="replace")
+        if skipped:
+            print(f"Skipped {skipped} documentation files larger than {GITHUB_DOC_MAX_BYTES} bytes.")
+        return docs, 200
+
+    try:
+        docs, status = call_with_retries(download, name="github", breaker=get_breaker("github"))
+    except (requests.exceptions.RequestException, TransportError, tarfile.TarError, CircuitOpenError) as e:
+        return None, f"Error: Could not fetch the repository archive: {e}"
+    if docs is None:
+        return None, f"Error: Could not download the archive of {user_repo} (HTTP {status})."
+    if not docs:
+        return None, f"Error: Could not find any Markdown documentation in {user_repo}."
+    return user_repo.replace('/', '_'), docs
+
+def summarize_doc_file(path: str, text: str, client, model: str, extractor: str) -> dict | None:
+    """
+    Key sentences and a cited summary for one documentation file, reusing the stored summary
+    when the file is unchanged. Returns None for files without any sentences.
+    """
+    cached = get_cached_summary(text, model, extractor)
+    if cached:
+        return dict(cached, path=path)
+    with metrics.stage("preprocess"):
+        sentences_map, formatted_text = su.preprocess_text_to_numbered_sentences(text)
+    if not sentences_map:
+        return None
+    sentence_count = su.determine_sentence_count(len(sentences_map))
+    with metrics.stage("extract"):
+        if len(sentences_map) <= sentence_count:
+            key_ids = list(sentences_map)  # Short files are summarized whole
+        else:
+            key_ids = su.select_key_sentence_ids(sentences_map, formatted_text, client, model=model,
+                                                 sentence_count=sentence_count, mode=extractor)
+    key_sentences = [{"id": sid, "text": sentences_map[sid]} for sid in key_ids if sid in sentences_map]
+    if not key_sentences:
+        return None
+    with metrics.stage("summarize"):
+        summary = su.generate_abstractive_summary([f"[{s['id']}] {s['text']}" for s in key_sentences], client,
+                                                  model=model)
+    result = {"sentence_count": len(sentences_map), "key_sentences": key_sentences, "summary": summary}
+    if summary:
+        store_summary(text, model, extractor, result)
+    return dict(result, path=path)
+
+def _repository_summary_messages(repo_name: str, file_summaries: list[dict]) -> list[dict]:
+    # Sentence citations are local to each file, so only the file numbers are kept at this level
+    summaries_text = "\n".join(f"[D{i}] {doc['path']}: {_SENTENCE_CITATION_RE.sub('', doc['summary'])}"
+                                for i, doc in enumerate(file_summaries, start=1))
+    prompt = f"""
+    Combine the following summaries of the documentation files of the GitHub repository {repo_name} into one overview of its purpose, features, and usage.
+    CRITICAL: At the end of EACH sentence you write, you MUST cite the file number(s) it is based on, like `[D1]` or `[D2, D5]`.
+    Base your summary ONLY on the information provided.
+
+    File Summaries:
+    ---
+    {summaries_text}
+    ---
+    Repository Summary:
+    """
+    return [
+        {"role": "system", "content": "You are a skilled writer who follows citation rules perfectly."},
+        {"role": "user", "content": prompt}
+    ]
+
+def summarize_repository_docs(repo_name: str, docs: dict, client, model: str = "gpt-4.1-nano",
+                              extractor: str = su.DEFAULT_EXTRACTION_MODE,
+                              workers: int = 4) -> tuple[list[dict], list[dict], str]:
+    """
+    Hierarchical summary: every documentation file is preprocessed and summarized on its own,
+    `workers` files at a time, then the file summaries are combined into one repository summary.
+    Returns the per-file results (in priority order, see `_doc_priority`), the files that failed
+    as {"path", "error"} (a failing file never stops the others) and the repository summary.
+    """
+    paths = sorted(docs, key=_doc_priority)
+    if len(paths) > GITHUB_DOCS_MAX_FILES:
+        print(f"Summarizing the first {GITHUB_DOCS_MAX_FILES} of {len(paths)} documentation files.")
+        paths = paths[:GITHUB_DOCS_MAX_FILES]
+    results, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(summarize_doc_file, path, docs[path], client, model, extractor): path
+                   for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"Could not summarize {path}: {e}")
+                failed.append({"path": path, "error": str(e)})
+    file_summaries = [results[path] for path in paths if results.get(path) and results[path]["summary"]]
+    failed.sort(key=lambda failure: paths.index(failure["path"]))
+    if len(file_summaries) <= 1:
+        repo_summary = _SENTENCE_CITATION_RE.sub("", file_summaries[0]["summary"]) if file_summaries else ""
+        return file_summaries, failed, repo_summary
+
+    print(f"\nSending request to '{model}' to combine {len(file_summaries)} file summaries...")
+    with metrics.stage("summarize"):
+        response_text = chat_completion(client, model=model, temperature=0.5,
+                                        messages=_repository_summary_messages(repo_name, file_summaries))
+    return file_summaries, failed, (response_text or "").strip()
+
+def run_docs(args: argparse.Namespace, client, github_url: str, output_dir: str) -> None:
+    """Summarizes all of a repository's documentation into repo_summaries/<repo>_docs_summary.md."""
+    print("--- Step 1: Streaming the repository archive from GitHub ---")
+    metrics.enter_stage("fetch")
+    repo_name, docs = get_github_docs_content(github_url)
+    if isinstance(docs, str):
+        print(docs)
+        return
+    print(f"Found {len(docs)} documentation files in repo: \"{repo_name}\"")
+
+    print("\n--- Step 2: Summarizing each file, then the repository ---")
+    metrics.enter_stage(None)  # Worker threads time their own stages
+    file_summaries, failed, repo_summary = summarize_repository_docs(repo_name, docs, client, extractor=args.extractor,
+                                                                     workers=args.doc_workers)
+    if not file_summaries:
+        print("\nCould not summarize any documentation file. Exiting.")
+        return
+
+    print(f"\n--- Step 3: Generating Report ---")
+    metrics.enter_stage("report")
+    output_filename = os.path.join(output_dir, f"{repo_name}_docs_summary.md")
+    markdown_content = [
+        f"# Documentation Summary for GitHub Repo: {repo_name}\n",
+        f"**Source URL:** {github_url}\n",
+        f"**Files summarized:** {len(file_summaries)} of {len(docs)} documentation files\n", "---",
+        "## Part 1: Repository Summary (citing files)\n", repo_summary, "\n---",
+        "## Part 2: File Summaries (citing sentences)\n",
+    ]
+    for i, doc in enumerate(file_summaries, start=1):
+        markdown_content.append(f"### `D{i}` {doc['path']}\n")
+        markdown_content.append(doc["summary"] + "\n")
+        markdown_content.extend(f"* **`{s['id']}`**: {s['text']}" for s in doc["key_sentences"])
+        markdown_content.append("")
+    if failed:
+        markdown_content.append("## Files That Could Not Be Summarized\n")
+        markdown_content.extend(f"* {failure['path']}: {failure['error']}" for failure in failed)
+        markdown_content.append("")
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write("\n".join(markdown_content))
+    print(f"\n✅ Complete documentation summary successfully saved to: '{output_filename}'")
+
+# --- Command-Line Interface ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("url", nargs="?", help="GitHub repository URL (prompted for when omitted).")
+    parser.add_argument("--extractor", default=su.DEFAULT_EXTRACTION_MODE, choices=su.EXTRACTION_MODES,
+                        help="Key sentences from the LLM reading the whole text (default; EXTRACTION_MODE), "
+                             "a local shortlist checked by the LLM, or the local ranker alone.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write Part 1 as soon as it is ready and stream Part 2 to the report and stdout.")
+    parser.add_argument("--all-docs", action="store_true",
+                        help="Summarize every Markdown file in the repository (one archive download) instead of README.md.")
+    parser.add_argument("--doc-workers", type=int, default=4, help="Documentation files summarized concurrently with --all-docs.")
+
+def run(args: argparse.Namespace) -> None:
+    """Summarizes a repository's README.md (or, with --all-docs, all its documentation) into repo_summaries/."""
+    from openai import OpenAI
+
     # --- 1. Setup ---
     su.download_nltk_data_if_needed()
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # Retries are handled by resilience
     OUTPUT_DIR = "repo_summaries"
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     # --- 2. Input and Data Fetching ---
-    github_url = input("Please enter the GitHub Repository URL to summarize: ")
+    github_url = args.url or input("Please enter the GitHub Repository URL to summarize: ")
+    if args.all_docs:
+        run_docs(args, client, github_url, OUTPUT_DIR)
+        return
     print("--- Step 1: Fetching README.md from GitHub ---")
+    metrics.enter_stage("fetch")
     repo_name, readme_text = get_github_readme_content(github_url)
-    
-    if readme_text.startswith("Error:"):
+
+    if repo_name is None:  # `readme_text` holds the error message
         print(readme_text)
-        exit()
+        return
     print(f"Successfully fetched README for repo: \"{repo_name}\"")
 
     # --- 3. Pre-processing (using the utility function) ---
-    print("\n--- Step 2: Pre-processing Text ---")
-    sentences_map, formatted_text = su.preprocess_text_to_numbered_sentences(readme_text)
-    dynamic_count = su.determine_sentence_count(len(sentences_map))
-    print(f"Split text into {len(sentences_map)} sentences. Aiming for a {dynamic_count}-sentence summary.")
-    
-    # --- 4. Extraction (using the utility function) ---
-    print("\n--- Step 3: Extracting Key Sentences ---")
-    key_ids = su.extract_key_sentence_ids(formatted_text, client, model="gpt-4.1-nano", sentence_count=dynamic_count)
+    model = "gpt-4.1-nano"
+    cached = get_cached_summary(readme_text, model, args.extractor)
+    if cached:
+        print("\nREADME unchanged since it was last summarized; reusing that summary.")
+        key_ids = [s["id"] for s in cached["key_sentences"]]
+        sentences_map = {s["id"]: s["text"] for s in cached["key_sentences"]}
+    else:
+        print("\n--- Step 2: Pre-processing Text ---")
+        metrics.enter_stage("preprocess")
+        sentences_map, formatted_text = su.preprocess_text_to_numbered_sentences(readme_text)
+        dynamic_count = su.determine_sentence_count(len(sentences_map))
+        print(f"Split text into {len(sentences_map)} sentences. Aiming for a {dynamic_count}-sentence summary.")
+
+        # --- 4. Extraction (using the utility function) ---
+        print("\n--- Step 3: Extracting Key Sentences ---")
+        metrics.enter_stage("extract")
+        key_ids = su.select_key_sentence_ids(sentences_map, formatted_text, client, model=model,
+                                             sentence_count=dynamic_count, mode=args.extractor)
 
     if not key_ids:
         print("\nCould not extract key sentences. Exiting.")
-        exit()
+        return
 
     # --- 5. Report Generation (using the utility function) ---
     print(f"\n--- Step 4: Generating Report ---")
     output_filename = os.path.join(OUTPUT_DIR, f"{repo_name}_summary.md")
-    
+
     markdown_content = [
         f"# Detailed Summary for GitHub Repo: {repo_name}\n",
         f"**Source URL:** {github_url}\n", "---",
@@ -80,12 +410,33 @@ if __name__ == "__main__":
             sentence = sentences_map[sid]
             markdown_content.append(f"* **`{sid}`**: {sentence}")
             key_sentences_for_final_summary.append(f"[{sid}] {sentence}")
-    
-    final_summary = su.generate_abstractive_summary(key_sentences_for_final_summary, client, model="gpt-4.1-nano")
+
+    def remember(final_summary):
+        if final_summary and not cached:
+            store_summary(readme_text, model, args.extractor, {
+                "sentence_count": len(sentences_map),
+                "key_sentences": [{"id": sid, "text": sentences_map[sid]} for sid in key_ids if sid in sentences_map],
+                "summary": final_summary,
+            })
+
+    metrics.enter_stage("summarize")
+    if args.stream and not cached:
+        summary_pieces = su.stream_abstractive_summary(key_sentences_for_final_summary, client, model=model)
+        print(f"Writing the key sentences to '{output_filename}' and streaming the summary into it:")
+        remember(su.write_report_with_streamed_summary(output_filename, markdown_content, SUMMARY_HEADING,
+                                                       summary_pieces))
+        print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
+        return
+    if cached:
+        final_summary = cached["summary"]
+    else:
+        final_summary = su.generate_abstractive_summary(key_sentences_for_final_summary, client, model=model)
+        remember(final_summary)
     if final_summary:
-        markdown_content.extend(["\n\n---", "## Part 2: Final Summary (with Citations)\n", final_summary])
-    
+        markdown_content.extend(SUMMARY_HEADING + [final_summary])
+
+    metrics.enter_stage("report")
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write("\n".join(markdown_content))
-    
-    print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
\ No newline at end of file
+
+    print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
@@ -0,0 +1,169 @@
+# http_cache.py
+"""
+Pooled HTTP session and an on-disk cache of GET responses that revalidates
+with ETag/If-None-Match (and Last-Modified/If-Modified-Since).
+
+All fetches share one `requests.Session`, so repeated requests to a host reuse
+kept-alive TCP/TLS connections. A cached URL is re-requested conditionally;
+an unchanged resource comes back as a bodiless 304 and is served from disk.
+The cache also keeps small derived results (e.g. a finished summary) under a
+key of the caller's choosing, so work on unchanged content is not redone.
+`requests` is imported on first use, keeping module import cheap.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", os.path.join(".cache", "http_responses.sqlite"))
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+class CachedResponse:
+    """
+    The parts of a GET response the callers need. `revalidated` is True when a 304 confirmed
+    the cached copy; `response` is the underlying `requests.Response` either way.
+    """
+
+    def __init__(self, response, text: str, revalidated: bool = False):
+        self.response = response
+        self.status_code = 200 if revalidated else response.status_code
+        self.text = text
+        self.revalidated = revalidated
+
+    def raise_for_status(self) -> None:
+        self.response.raise_for_status()
+
+class HTTPCache:
+    """
+    Cached 200 responses by URL with their validators, plus derived results by key.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_HTTP_CACHE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.revalidated = 0  # 304s served from the stored body
+        self.fetched = 0  # Full responses downloaded
+        self.derived_hits = 0
+        self.derived_misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS derived (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def get(self, session, url: str, timeout=None) -> CachedResponse:
+        """
+        GETs `url` through `session`, conditionally when a cached copy exists. Returns the cached
+        body on a 304, stores 200 responses that carry a validator and passes anything else through.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and row is not None:
+            with self._lock:
+                self.revalidated += 1
+                self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+                self._conn.commit()
+            return CachedResponse(response, row[2], revalidated=True)
+
+        with self._lock:
+            self.fetched += 1
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            if response.status_code == 200 and (etag or last_modified):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, response.text, time.time()),
+                )
+                self._conn.commit()
+        return CachedResponse(response, response.text)
+
+    def contains(self, url: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM responses WHERE url = ?", (url,)).fetchone() is not None
+
+    def get_derived(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM derived WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.derived_hits += 1
+            else:
+                self.derived_misses += 1
+        return row[0] if row else None
+
+    def put_derived(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO derived (key, value, created_at) VALUES (?, ?, ?)",
+                               (key, value, time.time()))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Hits are revalidated responses plus derived results found; misses are full downloads
+        plus derived results not found.
+        """
+        hits, misses = self.revalidated + self.derived_hits, self.fetched + self.derived_misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "revalidated": self.revalidated, "fetched": self.fetched,
+                "derived_hits": self.derived_hits, "derived_misses": self.derived_misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+# --- Shared session and cache ---
+_session = None
+_default_cache = None
+_shared_lock = threading.Lock()
+
+def get_session():
+    """Returns the process-wide `requests.Session`, pooling up to HTTP_POOL_SIZE connections per host."""
+    global _session
+    with _shared_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def default_cache_stats() -> dict | None:
+    """Stats of the process-wide cache, or None when it has not been opened (it is not opened here)."""
+    with _shared_lock:
+        cache = _default_cache
+    return cache.stats() if cache else None
+
+def get_default_cache() -> HTTPCache | None:
+    """Returns the process-wide cache, or None when HTTP_CACHE_DISABLED is set."""
+    global _default_cache
+    if os.getenv("HTTP_CACHE_DISABLED"):
+        return None
+    with _shared_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache()
+        return _default_cache
@@ -0,0 +1,281 @@
+# llm_utils.py
+"""
+Shared plumbing for OpenAI chat completions.
+Every LLM call in the project goes through `chat_completion` (or its async
+and streaming twins), which serves repeated prompts from a persistent, content-addressed
+SQLite cache instead of paying for them again, and shares identical requests
+that are already in flight between threads. Requests that are sent are timed
+out, retried and circuit-broken by `resilience`.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from rate_limit import RateLimiter
+from resilience import acall_with_retries, call_with_retries, get_breaker
+from singleflight import get_group
+from token_utils import count_tokens
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite"))
+DEFAULT_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Per-attempt timeout; resilience.call_with_retries bounds the total time across attempts
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+
+class LLMCache:
+    """
+    On-disk cache of chat completion texts keyed on a hash of the request.
+    Holds at most `max_entries` responses, evicting the least recently used
+    ones first, and treats entries older than `ttl_seconds` as misses.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_CACHE_TTL_SECONDS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict], temperature=None, response_format=None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "response_format": response_format},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_accessed LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+# --- Default cache shared by all call sites ---
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> LLMCache | None:
+    """Returns the process-wide cache, or None when LLM_CACHE_DISABLED is set."""
+    global _default_cache
+    if os.getenv("LLM_CACHE_DISABLED"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+# --- Shared OpenAI quota ---
+# Every request in the process draws from the same buckets, so concurrent jobs
+# together stay under the account's limits. An unset limit is not enforced.
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "300"))
+_request_limiter = None
+_token_limiter = None
+_quota_wait_seconds = 0.0
+_quota_lock = threading.Lock()
+
+def configure_rate_limits(requests_per_minute: float | None = None, tokens_per_minute: float | None = None) -> None:
+    """
+    Sets the process-wide OpenAI requests-per-minute and tokens-per-minute budgets.
+    A limit passed as None is left unchanged; 0 lifts it.
+    """
+    global _request_limiter, _token_limiter
+    if requests_per_minute is not None:
+        _request_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+    if tokens_per_minute is not None:
+        _token_limiter = RateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+configure_rate_limits(float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0")),
+                      float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0")))
+
+def _quota_tokens(prompt_text: str, completion_tokens: int) -> float:
+    # A request larger than the whole bucket would wait forever; charge it a full bucket instead
+    return min(count_tokens(prompt_text) + completion_tokens, _token_limiter.capacity)
+
+def _record_quota_wait(waited: float) -> float:
+    global _quota_wait_seconds
+    if waited:
+        with _quota_lock:
+            _quota_wait_seconds += waited
+    return waited
+
+def wait_for_quota(prompt_text: str = "", completion_tokens: int = EXPECTED_COMPLETION_TOKENS) -> float:
+    """Blocks until the shared budgets admit one request of this size. Returns the seconds waited."""
+    request_limiter, token_limiter = _request_limiter, _token_limiter
+    waited = request_limiter.acquire() if request_limiter else 0.0
+    if token_limiter:
+        waited += token_limiter.acquire(_quota_tokens(prompt_text, completion_tokens))
+    return _record_quota_wait(waited)
+
+async def await_quota(prompt_text: str = "", completion_tokens: int = EXPECTED_COMPLETION_TOKENS) -> float:
+    """Async counterpart of `wait_for_quota`."""
+    request_limiter, token_limiter = _request_limiter, _token_limiter
+    waited = await request_limiter.acquire_async() if request_limiter else 0.0
+    if token_limiter:
+        waited += await token_limiter.acquire_async(_quota_tokens(prompt_text, completion_tokens))
+    return _record_quota_wait(waited)
+
+def quota_wait_seconds() -> float:
+    """Total time this process has spent waiting on the shared OpenAI budgets."""
+    return _quota_wait_seconds
+
+def _prompt_text(messages: list[dict]) -> str:
+    return "\n".join(message.get("content") or "" for message in messages)
+
+_USE_DEFAULT = object()
+
+def _request_kwargs(model, messages, temperature, response_format) -> dict:
+    kwargs = {"model": model, "messages": messages}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+def _send_request(client, kwargs: dict):
+    wait_for_quota(_prompt_text(kwargs["messages"]))  # Every attempt, retries included, spends quota
+    return client.chat.completions.create(**kwargs, timeout=LLM_REQUEST_TIMEOUT)
+
+async def _asend_request(client, kwargs: dict):
+    await await_quota(_prompt_text(kwargs["messages"]))
+    return await client.chat.completions.create(**kwargs, timeout=LLM_REQUEST_TIMEOUT)
+
+def _create_and_store(client, model, messages, temperature, response_format, cache, key) -> str:
+    response = call_with_retries(_send_request, client, _request_kwargs(model, messages, temperature, response_format),
+                                 name="openai", breaker=get_breaker("openai"))
+    metrics.record_llm_usage(model, getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if cache and content is not None:
+        cache.put(key, content, model)
+    return content
+
+def chat_completion(client, model: str, messages: list[dict], temperature: float | None = None,
+                    response_format: dict | None = None, cache=_USE_DEFAULT, coalesce: bool = True) -> str:
+    """
+    Runs a chat completion and returns the message text, serving identical requests from `cache`.
+    `client` is an `OpenAI` instance (or the `openai` module). Pass `cache=None` to bypass caching.
+    Identical requests already in flight on another thread are awaited and shared rather than
+    sent again, unless `coalesce` is False.
+    """
+    if cache is _USE_DEFAULT:
+        cache = get_default_cache()
+    key = LLMCache.make_key(model, messages, temperature, response_format)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    args = (client, model, messages, temperature, response_format, cache, key)
+    if not coalesce:
+        return _create_and_store(*args)
+    return get_group("llm_chat").do(key, _create_and_store, *args)
+
+async def achat_completion(client, model: str, messages: list[dict], temperature: float | None = None,
+                           response_format: dict | None = None, cache=_USE_DEFAULT) -> str:
+    """Async counterpart of `chat_completion` for an `AsyncOpenAI` client."""
+    if cache is _USE_DEFAULT:
+        cache = get_default_cache()
+    key = LLMCache.make_key(model, messages, temperature, response_format) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = await acall_with_retries(_asend_request, client, _request_kwargs(model, messages, temperature, response_format),
+                                        name="openai", breaker=get_breaker("openai"))
+    metrics.record_llm_usage(model, getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if cache and content is not None:
+        cache.put(key, content, model)
+    return content
+
+def _open_stream(client, kwargs: dict):
+    wait_for_quota(_prompt_text(kwargs["messages"]))
+    return client.chat.completions.create(**kwargs, stream=True, stream_options={"include_usage": True},
+                                          timeout=LLM_REQUEST_TIMEOUT)
+
+def stream_chat_completion(client, model: str, messages: list[dict], temperature: float | None = None, cache=_USE_DEFAULT):
+    """
+    Yields the message text of a chat completion piece by piece as it is generated.
+    A cached response is yielded in one piece, and a completed stream is cached like
+    `chat_completion` would cache it. Only opening the stream is retried: a failure
+    after text has been yielded is raised to the caller.
+    """
+    if cache is _USE_DEFAULT:
+        cache = get_default_cache()
+    key = LLMCache.make_key(model, messages, temperature, None)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    stream = call_with_retries(_open_stream, client, _request_kwargs(model, messages, temperature, None),
+                               name="openai", breaker=get_breaker("openai"))
+    parts = []
+    with stream:
+        for chunk in stream:
+            if chunk.usage is not None:  # Sent in a final chunk without choices
+                metrics.record_llm_usage(model, chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+    if cache and parts:
+        cache.put(key, "".join(parts), model)
@@ -0,0 +1,333 @@
+# metrics.py
+"""
+Process-wide instrumentation: where a run spends its time, tokens and money.
+
+Records
+  - wall time per pipeline stage (`enter_stage` / `stage`)
+  - duration and outcome of every upstream call attempt (`record_call`,
+    fed by resilience.call_with_retries)
+  - prompt, cached-prompt and completion tokens per model, with an estimated
+    cost from MODEL_PRICES_PER_MILLION (`record_llm_usage`)
+  - sentences and posts collapsed as near-duplicates before prompting (`record_dedup`)
+and combines them with the LLM cache, coalescing and circuit-breaker counters
+into a JSON run summary (`run_summary`) or Prometheus text (`prometheus_text`).
+`add_arguments`/`run_instrumented` give every CLI the same --metrics,
+--metrics-json, --metrics-prom and --profile flags.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# USD per 1M tokens: (input, cached input, output). Models not listed get no cost estimate.
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+_lock = threading.Lock()
+_started_at = time.time()
+_stages: dict[str, dict] = {}
+_calls: dict[str, dict] = {}
+_llm: dict[str, dict] = {}
+_dedup: dict[str, dict] = {}
+_current_stage = threading.local()
+
+def reset() -> None:
+    """Clears everything recorded so far (e.g. between benchmark runs)."""
+    global _started_at
+    with _lock:
+        _started_at = time.time()
+        _stages.clear()
+        _calls.clear()
+        _llm.clear()
+        _dedup.clear()
+
+# --- Stages ---
+def _add_stage_time(name: str, seconds: float) -> None:
+    with _lock:
+        entry = _stages.setdefault(name, {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+
+def enter_stage(name: str | None) -> None:
+    """Ends the calling thread's current stage (if any) and starts `name` (None just ends it)."""
+    now = time.perf_counter()
+    previous = getattr(_current_stage, "value", None)
+    if previous is not None:
+        _add_stage_time(previous[0], now - previous[1])
+    _current_stage.value = (name, now) if name is not None else None
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as one occurrence of stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_stage_time(name, time.perf_counter() - start)
+
+# --- Upstream calls ---
+def record_call(service: str, seconds: float, error: BaseException | None = None) -> None:
+    """Records one call attempt against `service` ("openai", "github", "reddit", ...)."""
+    with _lock:
+        entry = _calls.setdefault(service, {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0})
+        entry["count"] += 1
+        entry["errors"] += error is not None
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+# --- Token usage and cost ---
+def _usage_value(usage, name: str) -> int:
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return value if isinstance(value, int) else 0
+
+def record_llm_usage(model: str, usage) -> None:
+    """Adds a response's `usage` (an OpenAI usage object or dict; None is ignored) to the per-model totals."""
+    if usage is None:
+        return
+    prompt_tokens = _usage_value(usage, "prompt_tokens")
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = _usage_value(details, "cached_tokens") if details is not None else 0
+    completion_tokens = _usage_value(usage, "completion_tokens")
+    with _lock:
+        entry = _llm.setdefault(model, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+        entry["requests"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["cached_tokens"] += cached_tokens
+        entry["completion_tokens"] += completion_tokens
+
+def record_dedup(kind: str, items: int, removed: int, tokens_removed: int) -> None:
+    """Adds one deduplication pass over `items` texts of `kind` ("sentences", "posts") to the totals."""
+    with _lock:
+        entry = _dedup.setdefault(kind, {"items": 0, "removed": 0, "tokens_removed": 0})
+        entry["items"] += items
+        entry["removed"] += removed
+        entry["tokens_removed"] += tokens_removed
+
+def _price_for(model: str):
+    # Dated snapshots ("gpt-4.1-mini-2025-04-14") are priced like their base model
+    for name in sorted(MODEL_PRICES_PER_MILLION, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_PRICES_PER_MILLION[name]
+    return None
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float | None:
+    """Estimated USD cost of the given token counts, or None for models without a known price."""
+    prices = _price_for(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+# --- Export ---
+def run_summary() -> dict:
+    """Everything recorded in this process, plus cache, coalescing and breaker counters, as one JSON-ready dict."""
+    from http_cache import default_cache_stats
+    from llm_utils import get_default_cache, quota_wait_seconds
+    from resilience import resilience_stats
+    from singleflight import all_stats
+
+    with _lock:
+        stages = {name: {"count": e["count"], "seconds": round(e["seconds"], 3)} for name, e in _stages.items()}
+        calls = {
+            name: {"count": e["count"], "errors": e["errors"], "seconds": round(e["seconds"], 3),
+                   "mean_seconds": round(e["seconds"] / e["count"], 3), "max_seconds": round(e["max_seconds"], 3)}
+            for name, e in _calls.items()
+        }
+        llm = {model: dict(e) for model, e in _llm.items()}
+        dedup = {kind: dict(e) for kind, e in _dedup.items()}
+    total_cost = 0.0
+    for model, entry in llm.items():
+        cost = estimate_cost(model, entry["prompt_tokens"], entry["cached_tokens"], entry["completion_tokens"])
+        entry["estimated_cost_usd"] = round(cost, 6) if cost is not None else None
+        total_cost += cost or 0.0
+
+    llm_cache = get_default_cache()
+    return {
+        "started_at": _started_at,
+        "wall_seconds": round(time.time() - _started_at, 3),
+        "stages": stages,
+        "calls": calls,
+        "llm": llm,
+        "estimated_cost_usd": round(total_cost, 6),
+        "dedup": dedup,
+        "caches": {"llm_response": llm_cache.stats() if llm_cache else None, "http_response": default_cache_stats(),
+                   "coalescing": all_stats()},
+        "resilience": resilience_stats(),
+        "quota_wait_seconds": round(quota_wait_seconds(), 3),
+    }
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(summary: dict | None = None) -> str:
+    """Renders a run summary in the Prometheus text exposition format."""
+    summary = summary or run_summary()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label_value(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    metric("summarizer_stage_seconds_total", "counter", "Wall time spent in each pipeline stage.",
+           [({"stage": name}, e["seconds"]) for name, e in summary["stages"].items()])
+    lines.append("# HELP summarizer_upstream_call_seconds Duration of upstream call attempts.")
+    lines.append("# TYPE summarizer_upstream_call_seconds summary")
+    for name, e in summary["calls"].items():
+        lines.append(f'summarizer_upstream_call_seconds_sum{{service="{_label_value(name)}"}} {e["seconds"]}')
+        lines.append(f'summarizer_upstream_call_seconds_count{{service="{_label_value(name)}"}} {e["count"]}')
+    metric("summarizer_upstream_call_errors_total", "counter", "Upstream call attempts that failed.",
+           [({"service": name}, e["errors"]) for name, e in summary["calls"].items()])
+    metric("summarizer_llm_requests_total", "counter", "LLM requests sent, per model.",
+           [({"model": model}, e["requests"]) for model, e in summary["llm"].items()])
+    metric("summarizer_llm_tokens_total", "counter", "LLM tokens, per model and kind.",
+           [({"model": model, "kind": kind}, e[f"{kind}_tokens"])
+            for model, e in summary["llm"].items() for kind in ("prompt", "cached", "completion")])
+    metric("summarizer_llm_estimated_cost_usd_total", "counter", "Estimated LLM spend in USD, per model.",
+           [({"model": model}, e["estimated_cost_usd"]) for model, e in summary["llm"].items()
+            if e["estimated_cost_usd"] is not None])
+    metric("summarizer_dedup_removed_total", "counter", "Texts collapsed as near-duplicates before prompting.",
+           [({"kind": kind}, e["removed"]) for kind, e in summary["dedup"].items()])
+    metric("summarizer_dedup_tokens_removed_total", "counter", "Prompt tokens saved by near-duplicate removal.",
+           [({"kind": kind}, e["tokens_removed"]) for kind, e in summary["dedup"].items()])
+    llm_cache, http_cache = summary["caches"]["llm_response"], summary["caches"].get("http_response")
+    lookups = []
+    if llm_cache:
+        lookups += [({"cache": "llm_response", "result": "hit"}, llm_cache["hits"]),
+                    ({"cache": "llm_response", "result": "miss"}, llm_cache["misses"])]
+    if http_cache:
+        lookups += [({"cache": "http_response", "result": "revalidated"}, http_cache["revalidated"]),
+                    ({"cache": "http_response", "result": "fetched"}, http_cache["fetched"]),
+                    ({"cache": "http_derived", "result": "hit"}, http_cache["derived_hits"]),
+                    ({"cache": "http_derived", "result": "miss"}, http_cache["derived_misses"])]
+    if lookups:
+        metric("summarizer_cache_lookups_total", "counter", "Cache lookups, per cache and result.", lookups)
+    metric("summarizer_coalesced_calls_total", "counter", "Calls served by another caller's in-flight work.",
+           [({"group": name}, e["coalesced"]) for name, e in summary["caches"]["coalescing"].items()])
+    metric("summarizer_retries_total", "counter", "Retried upstream calls, per service.",
+           [({"service": name}, e["retries"]) for name, e in summary["resilience"].items()])
+    metric("summarizer_quota_wait_seconds_total", "counter", "Time spent waiting on the shared OpenAI budgets.",
+           [({}, summary["quota_wait_seconds"])])
+    return "\n".join(lines) + "\n"
+
+def format_summary(summary: dict) -> str:
+    """A short human-readable version of the run summary."""
+    lines = [f"Run took {summary['wall_seconds']:.1f}s; estimated LLM cost ${summary['estimated_cost_usd']:.4f}."]
+    for name, e in summary["stages"].items():
+        lines.append(f"  stage {name:<12} {e['seconds']:8.2f}s  ({e['count']}x)")
+    for name, e in summary["calls"].items():
+        lines.append(f"  calls {name:<12} {e['count']:5d} attempts, {e['errors']} failed, mean {e['mean_seconds']:.2f}s")
+    for model, e in summary["llm"].items():
+        lines.append(f"  model {model:<20} {e['requests']} requests, {e['prompt_tokens']} prompt "
+                     f"({e['cached_tokens']} cached) + {e['completion_tokens']} completion tokens")
+    for kind, e in summary["dedup"].items():
+        lines.append(f"  dedup {kind:<12} {e['removed']} of {e['items']} collapsed, ~{e['tokens_removed']} tokens removed")
+    llm_cache = summary["caches"]["llm_response"]
+    if llm_cache:
+        lines.append(f"  LLM cache hit rate {llm_cache['hit_rate']:.0%} ({llm_cache['hits']} hits, {llm_cache['misses']} misses)")
+    http_cache = summary["caches"].get("http_response")
+    if http_cache:
+        lines.append(f"  HTTP cache hit rate {http_cache['hit_rate']:.0%} ({http_cache['revalidated']} revalidated, "
+                     f"{http_cache['fetched']} fetched; {http_cache['derived_hits']} stored summaries reused, "
+                     f"{http_cache['derived_misses']} missed)")
+    return "\n".join(lines)
+
+# --- Command-Line Integration ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--metrics", action="store_true", help="Print a timing, token and cost summary at the end.")
+    group.add_argument("--metrics-json", metavar="FILE", help="Write the run summary to FILE as JSON.")
+    group.add_argument("--metrics-prom", metavar="FILE", help="Write the run summary to FILE in Prometheus text format.")
+    group.add_argument("--profile", action="store_true",
+                       help="Profile the run with cProfile, in the main thread and every thread it starts "
+                            "(worker pools, the asyncio loop's thread), and print the hot spots.")
+    group.add_argument("--profile-output", metavar="FILE", help="With --profile, also save the raw stats to FILE.")
+
+class _RunProfiler:
+    """
+    cProfile over the main thread and every thread started while it runs. Before Python 3.12 a
+    profiler only sees the thread that enabled it, so `threading.Thread.run` is wrapped to give
+    each new thread its own profile, merged into one report at the end (a thread still running
+    then contributes what it has done so far). From 3.12 cProfile observes every thread itself.
+    Threads started before `start` are not covered on older versions.
+    """
+
+    def __init__(self):
+        import cProfile
+        import pstats
+        self._stats = pstats.Stats
+        self._new_profile = cProfile.Profile
+        self.main = cProfile.Profile()
+        self.thread_profiles = []
+        self._lock = threading.Lock()
+        self._original_run = None
+
+    def start(self) -> None:
+        if sys.version_info < (3, 12):
+            original_run, profiles, lock, new_profile = threading.Thread.run, self.thread_profiles, self._lock, self._new_profile
+
+            def profiled_run(thread):
+                profile = new_profile()
+                with lock:
+                    profiles.append(profile)
+                profile.enable()
+                try:
+                    original_run(thread)
+                finally:
+                    profile.disable()
+
+            self._original_run = original_run
+            threading.Thread.run = profiled_run
+        self.main.enable()
+
+    def stop(self):
+        """Stops profiling and returns the merged `pstats.Stats`."""
+        self.main.disable()
+        if self._original_run is not None:
+            threading.Thread.run = self._original_run
+        stats = self._stats(self.main)
+        with self._lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+        return stats
+
+def run_instrumented(run, args: argparse.Namespace) -> None:
+    """Calls run(args) under the instrumentation requested by the flags from `add_arguments`."""
+    profiler = None
+    if args.profile:
+        profiler = _RunProfiler()
+        profiler.start()
+    try:
+        run(args)
+    finally:
+        enter_stage(None)
+        if profiler:
+            stats = profiler.stop()
+            if args.profile_output:
+                stats.dump_stats(args.profile_output)
+                print(f"\nProfile saved to {args.profile_output}")
+            print(f"\nTop functions by cumulative time (main thread + {len(profiler.thread_profiles)} worker threads):")
+            stats.sort_stats("cumulative").print_stats(25)
+        if args.metrics or args.metrics_json or args.metrics_prom:
+            summary = run_summary()
+            if args.metrics:
+                print("\n" + format_summary(summary))
+            if args.metrics_json:
+                with open(args.metrics_json, 'w', encoding='utf-8') as f:
+                    json.dump(summary, f, indent=2)
+            if args.metrics_prom:
+                with open(args.metrics_prom, 'w', encoding='utf-8') as f:
+                    f.write(prometheus_text(summary))
@@ -0,0 +1,59 @@
+# rate_limit.py
+"""
+Thread-safe token-bucket rate limiting shared by worker pools.
+A single limiter instance is handed to every worker so that the pool as a
+whole stays under an API's request budget, whatever its size. Threads use
+`acquire`; coroutines use `acquire_async`, which never blocks the event loop.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` acquisitions per `per` seconds, with bursts
+    of up to `capacity` tokens. `acquire()` blocks until tokens are available.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: float | None = None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("rate and per must be positive.")
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.fill_rate)
+        self._last_refill = now
+
+    def _try_acquire(self, tokens: float) -> float:
+        """Consumes `tokens` and returns 0.0 if they are available, otherwise the seconds until they will be."""
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}.")
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.fill_rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Blocks until `tokens` are available and consumes them. Returns the seconds spent waiting."""
+        waited = 0.0
+        while (wait_time := self._try_acquire(tokens)) > 0:
+            time.sleep(wait_time)
+            waited += wait_time
+        return waited
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Like `acquire`, but waits with `asyncio.sleep` so the event loop keeps running."""
+        import asyncio
+        waited = 0.0
+        while (wait_time := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait_time)
+            waited += wait_time
+        return waited
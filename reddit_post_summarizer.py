@@ -1,175 +1,282 @@
 # reddit_post_summarizer.py
+# PRAW and the OpenAI SDK are imported on first use, keeping module import cheap.
 
-import praw # For Reddit
+from __future__ import annotations
+
+import argparse
+import json
 import re
 import os
-import json
-import nltk
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
+# --- Import the core summarization logic ---
+import metrics
+import summarizer_utils as su
+from reddit_utils import Post, fetch_info, is_regular_comment, request_top_comments, top_level_comments
+from resilience import call_with_retries, get_breaker
+from singleflight import get_group
+
+if TYPE_CHECKING:
+    import praw
+    from openai import OpenAI
+
 load_dotenv()
 
+REDDIT_DOCUMENT_TYPE = "Reddit post"
+# reddit.info() accepts at most 100 fullnames per request
+INFO_BATCH_SIZE = 100
+# More comments than for trend analysis, for a detailed summary
+COMMENTS_PER_POST = 10
+
 # --- Reddit Data Fetching ---
-def get_reddit_post_content(post_url: str) -> tuple[str, str, str]:
-    """Retrieves the title, ID, and full text content for a given Reddit post URL."""
+@lru_cache(maxsize=None)
+def get_reddit_client() -> praw.Reddit:
+    """Returns the process-wide Reddit client, created on first use."""
+    import praw # For Reddit
+    username = os.getenv("REDDIT_USERNAME")
+    return praw.Reddit(
+        client_id=os.getenv("REDDIT_CLIENT_ID"),
+        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+        user_agent=f"Post Summarizer v1.0 by u/{username}",
+    )
+
+def submission_to_text(submission) -> tuple[str, str, str]:
+    """Consolidates the title, body and top comments of a submission into (title, ID, full text)."""
+    request_top_comments(submission, COMMENTS_PER_POST)  # Before the first attribute read loads the post
+    comments = top_level_comments(submission, COMMENTS_PER_POST,
+                                  qualifies=lambda c: is_regular_comment(c) and c.author is not None)
+    post = Post.from_praw(submission, comments)
+    return post.title, post.id, post.document_text()
+
+def _fetch_reddit_post_content(post_url: str) -> tuple[str, str, str]:
     try:
-        client_id = os.getenv("REDDIT_CLIENT_ID")
-        client_secret = os.getenv("REDDIT_CLIENT_SECRET")
-        username = os.getenv("REDDIT_USERNAME")
-        user_agent = f"Post Summarizer v1.0 by u/{username}"
-        
-        reddit = praw.Reddit(client_id=client_id, client_secret=client_secret, user_agent=user_agent)
-        submission = reddit.submission(url=post_url)
-        
-        title = submission.title
-        post_id = submission.id
-        
-        # Consolidate text from title, body, and top comments
-        full_text = f"Title: {title}\n"
-        if submission.selftext:
-            full_text += f"Body: {submission.selftext}\n"
-        
-        full_text += "\n--- COMMENTS ---\n"
-        submission.comments.replace_more(limit=0)
-        for i, comment in enumerate(submission.comments.list()):
-            if i >= 10: break # Get more comments for a detailed summary
-            if not comment.stickied and isinstance(comment, praw.models.Comment) and comment.author:
-                full_text += f"{comment.author.name}: {comment.body.replace('#', '')}\n" # Sanitize text
-        
-        return title, post_id, full_text.replace('\n', ' ').replace('  ', ' ')
-        
+        submission = get_reddit_client().submission(url=post_url)
+        return call_with_retries(submission_to_text, submission, name="reddit", breaker=get_breaker("reddit"))
     except Exception as e:
         return None, None, f"Error: Could not fetch Reddit post. Details: {e}"
 
-# --- All other functions from your summarizer script are reused here ---
-# (I've copied them directly for a complete, runnable script)
+def normalize_post_url(post_url: str) -> str:
+    """Returns a key identifying the post behind any URL form (full, short, old.reddit, with query string)."""
+    post_id = extract_post_id(post_url)
+    return f"reddit:{post_id}" if post_id else post_url.strip()
 
-def download_nltk_data_if_needed():
-    try: nltk.sent_tokenize("test")
-    except LookupError: nltk.download('punkt')
+def get_reddit_post_content(post_url: str) -> tuple[str, str, str]:
+    """
+    Retrieves the title, ID, and full text content for a given Reddit post URL.
+    Concurrent calls for the same post share a single fetch.
+    """
+    return get_group("reddit_post_fetch").do(normalize_post_url(post_url), _fetch_reddit_post_content, post_url)
 
-def preprocess_text_to_numbered_sentences(raw_text: str):
-    sentences = nltk.sent_tokenize(raw_text)
-    sentences_map = {f"S{i+1}": sentence for i, sentence in enumerate(sentences)}
-    formatted_text = "\n".join([f"[{sid}] {s}" for sid, s in sentences_map.items()])
-    return sentences_map, formatted_text
+# --- Bulk Input ---
+def extract_post_id(reference: str) -> str | None:
+    """Returns the base-36 post ID from a post URL, a short redd.it link, a `t3_` fullname or a bare ID."""
+    reference = reference.strip()
+    match = re.search(r"/comments/([a-z0-9]+)", reference) or re.search(r"redd\.it/([a-z0-9]+)", reference)
+    if match:
+        return match.group(1)
+    match = re.fullmatch(r"(?:t3_)?([a-z0-9]+)", reference)
+    return match.group(1) if match else None
 
-def determine_sentence_count(total_sentences: int):
-    return max(7, min(int(total_sentences * 0.15), 40))
+def read_post_references(path: str) -> list[str]:
+    """
+    Reads post IDs from a file with one reference per line: a URL, an ID, or a JSON
+    object with a "url", "post_url" or "id" key (so JSONL exports work as-is).
+    Unrecognized lines are reported and skipped; duplicates are dropped.
+    """
+    post_ids = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            reference = line
+            if line.startswith(("{", "[")):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Warning: skipping line {line_number}: malformed JSON ({e.msg}).")
+                    continue
+                if not isinstance(record, dict):
+                    print(f"Warning: skipping line {line_number}: expected a JSON object, got {type(record).__name__}.")
+                    continue
+                reference = str(record.get("url") or record.get("post_url") or record.get("id") or "")
+            post_id = extract_post_id(reference)
+            if post_id is None:
+                print(f"Skipping line {line_number}: no Reddit post reference found.")
+                continue
+            post_ids.append(post_id)
+    return list(dict.fromkeys(post_ids))
 
-def extract_key_sentence_ids(formatted_text: str, client: OpenAI, model: str, sentence_count: int):
-    prompt = f"""
-    Analyze the following numbered text from a Reddit post. Identify the {sentence_count} most important sentences for understanding the main points.
-    Your ONLY output must be a single JSON object with a key "key_sentence_ids" containing an array of the sentence IDs.
+def iter_submissions(post_ids: list[str], reddit: praw.Reddit):
+    """Yields submissions for `post_ids`, resolving them INFO_BATCH_SIZE fullnames per (retried) request."""
+    for start in range(0, len(post_ids), INFO_BATCH_SIZE):
+        fullnames = [f"t3_{post_id}" for post_id in post_ids[start:start + INFO_BATCH_SIZE]]
+        yield from fetch_info(reddit, fullnames)
 
-    Example: {{"key_sentence_ids": ["S5", "S12", "S25"]}}
+# --- Summarization and Report ---
+SUMMARY_HEADING = ["\n\n---\n", "## Part 2: Final Summary (with Citations)\n"]
 
-    Numbered Text:
-    ---
-    {formatted_text}
-    ---
-    """
+def extractive_report_lines(source_url: str, sentences_map: dict, key_ids: list) -> list[str]:
+    """The report up to and including Part 1, the key sentences."""
+    markdown_content = [
+        f"# Detailed Summary for Reddit Post\n",
+        f"**Source URL:** {source_url}\n",
+        "---",
+        "## Part 1: Key Sentences (Extractive Summary)\n"
+    ]
+    for sid in key_ids:
+        if sid in sentences_map:
+            markdown_content.append(f"* **`{sid}`**: {sentences_map[sid]}")
+    return markdown_content
+
+def write_summary_report(output_filename: str, source_url: str, sentences_map: dict, key_ids: list, final_summary: str) -> None:
+    """Writes the Markdown report with the extractive (Part 1) and abstractive (Part 2) summaries."""
+    markdown_content = extractive_report_lines(source_url, sentences_map, key_ids)
+    if final_summary:
+        markdown_content.extend(SUMMARY_HEADING)
+        markdown_content.append(final_summary)
+
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write("\n".join(markdown_content))
+
+def summarize_submission(submission, client: OpenAI, output_dir: str, model: str = "gpt-4.1-nano",
+                         extractor: str = su.DEFAULT_EXTRACTION_MODE) -> str | None:
+    """Runs fetch-comments → preprocess → extract → summarize for one submission. Returns the report path."""
     try:
-        print(f"\nSending request to '{model}' to identify key sentences...")
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful research assistant that outputs only JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.0
-        )
-        data = json.loads(response.choices[0].message.content)
-        return data.get("key_sentence_ids", [])
+        with metrics.stage("fetch"):
+            post_title, post_id, long_text = call_with_retries(submission_to_text, submission, name="reddit",
+                                                               breaker=get_breaker("reddit"))
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return []
-
-def generate_abstractive_summary(key_sentences: list[str], client: OpenAI, model: str):
-    key_sentences_text = "\n".join(key_sentences)
-    prompt = f"""
-    Synthesize the following key sentences from a Reddit post into a smooth summary paragraph.
-    CRITICAL: At the end of EACH new sentence you write, you MUST cite the original sentence number(s) it is based on, like `[S1]` or `[S5, S12]`.
-    Base your summary ONLY on the information provided.
-
-    Key Sentences to Rewrite:
-    ---
-    {key_sentences_text}
-    ---
-    Final Summary:
-    """
+        print(f"Could not fetch post {submission.id}: {e}")
+        return None
+
+    with metrics.stage("preprocess"):
+        sentences_map, formatted_prompt_text = su.preprocess_text_to_numbered_sentences(long_text, clean_markup=False)
+    dynamic_count = su.determine_sentence_count(len(sentences_map))
     try:
-        print(f"\nSending request to '{model}' to generate the final summary...")
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a skilled writer who follows citation rules perfectly."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5
-        )
-        return response.choices[0].message.content.strip()
+        with metrics.stage("extract"):
+            key_ids = su.select_key_sentence_ids(sentences_map, formatted_prompt_text, client, model=model,
+                                                 sentence_count=dynamic_count, document_type=REDDIT_DOCUMENT_TYPE,
+                                                 focus="the main points", mode=extractor)
+        if not key_ids:
+            print(f"Could not extract key sentences for post {post_id} (\"{post_title}\").")
+            return None
+        key_sentences = [f"[{sid}] {sentences_map[sid]}" for sid in key_ids if sid in sentences_map]
+        with metrics.stage("summarize"):
+            final_summary = su.generate_abstractive_summary(key_sentences, client, model=model,
+                                                            document_type=REDDIT_DOCUMENT_TYPE)
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return ""
+        print(f"Could not summarize post {post_id} (\"{post_title}\"): {e}")
+        return None
+    output_filename = os.path.join(output_dir, f"{post_id}_summary.md")
+    write_summary_report(output_filename, f"https://www.reddit.com{submission.permalink}", sentences_map, key_ids, final_summary)
+    return output_filename
 
-# --- Main Execution Block for the Post Summarizer ---
-if __name__ == "__main__":
-    download_nltk_data_if_needed()
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def summarize_in_bulk(input_path: str, client: OpenAI, output_dir: str, workers: int = 8,
+                      extractor: str = su.DEFAULT_EXTRACTION_MODE) -> list[str]:
+    """
+    Summarizes every post listed in `input_path` with one shared Reddit client.
+    Submissions are resolved in batches via reddit.info() and handed to a worker pool
+    as they arrive, so later batches resolve while earlier posts are being summarized.
+    """
+    post_ids = read_post_references(input_path)
+    print(f"Summarizing {len(post_ids)} posts with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(summarize_submission, submission, client, output_dir, extractor=extractor)
+            for submission in iter_submissions(post_ids, get_reddit_client())
+        ]
+        report_paths = [future.result() for future in futures]
+
+    completed = [path for path in report_paths if path]
+    print(f"\n✅ {len(completed)} of {len(post_ids)} summaries saved to '{output_dir}'.")
+    return completed
+
+# --- Command-Line Interface ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("url", nargs="?", help="Reddit post URL (prompted for when omitted).")
+    parser.add_argument("--bulk", metavar="FILE", help="File of post URLs/IDs, one per line or as JSONL records.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent summaries in bulk mode.")
+    parser.add_argument("--extractor", default=su.DEFAULT_EXTRACTION_MODE, choices=su.EXTRACTION_MODES,
+                        help="Key sentences from the LLM reading the whole text (default; EXTRACTION_MODE), "
+                             "a local shortlist checked by the LLM, or the local ranker alone.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write Part 1 as soon as it is ready and stream Part 2 to the report and stdout.")
+
+def run(args: argparse.Namespace) -> None:
+    """Summarizes one post (or, with --bulk, every post in a file) into reddit_summaries/."""
+    from openai import OpenAI
+
+    su.download_nltk_data_if_needed()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # Retries are handled by resilience
     OUTPUT_DIR = "reddit_summaries"
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    reddit_url = input("Please enter the Reddit Post URL for a deep-dive summary: ")
+    if args.bulk:
+        summarize_in_bulk(args.bulk, client, OUTPUT_DIR, workers=args.workers, extractor=args.extractor)
+        return
+
+    reddit_url = args.url or input("Please enter the Reddit Post URL for a deep-dive summary: ")
     print("--- Step 1: Fetching Post Content from Reddit ---")
-    
+    metrics.enter_stage("fetch")
+
     post_title, post_id, long_text = get_reddit_post_content(reddit_url)
-    
+
     if long_text.startswith("Error:"):
         print(long_text)
-        exit()
+        return
     print(f"Successfully fetched content for post: \"{post_title}\"")
 
     print("\n--- Step 2: Pre-processing Text ---")
-    sentences_map, formatted_prompt_text = preprocess_text_to_numbered_sentences(long_text)
-    dynamic_count = determine_sentence_count(len(sentences_map))
+    metrics.enter_stage("preprocess")
+    sentences_map, formatted_prompt_text = su.preprocess_text_to_numbered_sentences(long_text, clean_markup=False)
+    dynamic_count = su.determine_sentence_count(len(sentences_map))
     print(f"Split text into {len(sentences_map)} sentences. Aiming for a {dynamic_count}-sentence summary.")
-    
+
     print("\n--- Step 3: Extracting Key Sentences ---")
-    key_ids = extract_key_sentence_ids(formatted_prompt_text, client, model="gpt-4.1-nano", sentence_count=dynamic_count)
+    metrics.enter_stage("extract")
+    key_ids = su.select_key_sentence_ids(sentences_map, formatted_prompt_text, client, model="gpt-4.1-nano",
+                                         sentence_count=dynamic_count, document_type=REDDIT_DOCUMENT_TYPE,
+                                         focus="the main points", mode=args.extractor)
 
     if not key_ids:
         print("\nCould not extract key sentences. Exiting.")
-        exit()
+        return
 
     print(f"\n--- Step 4: Generating Report ---")
     output_filename = os.path.join(OUTPUT_DIR, f"{post_id}_summary.md")
-    
+
     # Part 1: Extractive Summary
-    markdown_content = [
-        f"# Detailed Summary for Reddit Post\n",
-        f"**Source URL:** {reddit_url}\n",
-        "---",
-        "## Part 1: Key Sentences (Extractive Summary)\n"
-    ]
-    key_sentences_for_final_summary = []
-    for sid in key_ids:
-        if sid in sentences_map:
-            sentence = sentences_map[sid]
-            markdown_content.append(f"* **`{sid}`**: {sentence}")
-            key_sentences_for_final_summary.append(f"[{sid}] {sentence}")
-    
+    key_sentences_for_final_summary = [f"[{sid}] {sentences_map[sid]}" for sid in key_ids if sid in sentences_map]
+
     # Part 2: Abstractive Summary
-    final_summary = generate_abstractive_summary(key_sentences_for_final_summary, client, model="gpt-4.1-nano")
-    if final_summary:
-        markdown_content.append("\n\n---\n")
-        markdown_content.append("## Part 2: Final Summary (with Citations)\n")
-        markdown_content.append(final_summary)
-    
+    metrics.enter_stage("summarize")
+    if args.stream:
+        summary_pieces = su.stream_abstractive_summary(key_sentences_for_final_summary, client, model="gpt-4.1-nano",
+                                                       document_type=REDDIT_DOCUMENT_TYPE)
+        print(f"Writing the key sentences to '{output_filename}' and streaming the summary into it:")
+        su.write_report_with_streamed_summary(output_filename, extractive_report_lines(reddit_url, sentences_map, key_ids),
+                                              SUMMARY_HEADING, summary_pieces)
+        print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
+        return
+    final_summary = su.generate_abstractive_summary(key_sentences_for_final_summary, client, model="gpt-4.1-nano",
+                                                    document_type=REDDIT_DOCUMENT_TYPE)
+
     # Write everything to the file
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        f.write("\n".join(markdown_content))
-    
-    print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
\ No newline at end of file
+    metrics.enter_stage("report")
+    write_summary_report(output_filename, reddit_url, sentences_map, key_ids, final_summary)
+
+    print(f"\n✅ Complete summary successfully saved to: '{output_filename}'")
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize Reddit posts with traceable citations.")
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    metrics.run_instrumented(run, parser.parse_args(argv))
+
+# --- Main Execution Block for the Post Summarizer ---
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# reddit_utils.py
+"""
+Post and comment records, listing and comment retrieval, shared by the
+subreddit scraper and the post summarizer.
+
+`Post` and `Comment` keep only the fields the pipelines read, in `__slots__`
+instances, and a post's prompt text is assembled on demand with a single
+join instead of being built up and held as one large string per post.
+
+Only a handful of top comments are ever used, so the request for a comment
+tree asks Reddit for just that: `comment_limit` and `comment_sort` are set on
+the submission before its comments are first loaded, which keeps the payload
+(and PRAW's parsing of it) proportional to what is kept rather than to the
+size of the thread. Only the top level of the returned forest is walked,
+without flattening it, and the walk stops at the first `count` qualifying
+comments. "Load more" stubs are skipped, never expanded.
+
+Listings and `info` lookups are fetched one page (or one batch of fullnames)
+per request through `call_with_retries`, so a 429 or 5xx from Reddit costs a
+retry of that page rather than the whole run.
+"""
+
+import os
+import re
+
+from resilience import call_with_retries, get_breaker
+
+DEFAULT_COMMENT_SORT = os.getenv("REDDIT_COMMENT_SORT", "confidence")  # Reddit's "best"
+# Reddit's limit counts replies and stickied or deleted comments too, so ask for some headroom
+COMMENT_LIMIT_FACTOR = 3
+MIN_COMMENT_LIMIT = 10
+# Reddit serves at most 100 listing items, or 100 fullnames of an info lookup, per request
+LISTING_PAGE_SIZE = 100
+
+_WHITESPACE_RUN_RE = re.compile(r"[ \n]+")
+
+# --- Records ---
+class Comment:
+    """A kept comment: its ID, body and (for post summaries) author name."""
+    __slots__ = ("id", "body", "author")
+
+    def __init__(self, id: str, body: str, author: str | None = None):
+        self.id = id
+        self.body = body
+        self.author = author
+
+    @classmethod
+    def from_praw(cls, comment) -> "Comment":
+        return cls(comment.id, comment.body, comment.author.name if comment.author else None)
+
+class Post:
+    """
+    A scraped post and its kept comments. `duplicate_of` is set by the streaming trend
+    pipeline on posts that nearly duplicate an earlier one (see trend_pipeline.py).
+    """
+    __slots__ = ("id", "title", "url", "selftext", "is_self", "comments", "duplicate_of")
+
+    def __init__(self, id: str, title: str, url: str, selftext: str = "", is_self: bool = False,
+                 comments: tuple = (), duplicate_of: int | None = None):
+        self.id = id
+        self.title = title
+        self.url = url
+        self.selftext = selftext
+        self.is_self = is_self
+        self.comments = tuple(comments)
+        self.duplicate_of = duplicate_of
+
+    @classmethod
+    def from_praw(cls, submission, comments) -> "Post":
+        return cls(submission.id, submission.title, submission.url, submission.selftext, submission.is_self,
+                   [Comment.from_praw(comment) for comment in comments])
+
+    @property
+    def text(self) -> str:
+        """The post as trend-analysis prompt text. Assembled with one join on every read; never stored."""
+        parts = ["POST TITLE: ", self.title, "\n"]
+        if self.is_self:
+            parts += ["POST BODY: ", self.selftext, "\n"]
+        for comment in self.comments:
+            parts += ["COMMENT: ", comment.body, "\n"]
+        return "".join(parts)
+
+    def document_text(self) -> str:
+        """The post as one paragraph for summarization: title, body, then `author: comment` lines."""
+        parts = [f"Title: {self.title}"]
+        if self.selftext:
+            parts.append(f"Body: {self.selftext}")
+        parts.append("--- COMMENTS ---")
+        parts += [f"{comment.author}: {comment.body.replace('#', '')}" for comment in self.comments]  # Sanitize text
+        return _WHITESPACE_RUN_RE.sub(" ", " ".join(parts))
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "title": self.title, "url": self.url, "selftext": self.selftext, "is_self": self.is_self,
+                "comments": [[comment.id, comment.body, comment.author] for comment in self.comments],
+                "duplicate_of": self.duplicate_of}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Post":
+        return cls(data["id"], data["title"], data["url"], data["selftext"], data["is_self"],
+                   [Comment(*fields) for fields in data["comments"]], data.get("duplicate_of"))
+
+# --- Listings ---
+def iter_listing(listing_method, limit: int | None, rate_limiter=None, **kwargs):
+    """
+    Yields up to `limit` items (all when None) of a PRAW listing such as `subreddit.top` or
+    `subreddit.new`, requesting one page at a time and retrying each page on transient errors.
+    Pages are fetched lazily, so a consumer that stops early never requests the rest.
+    Each page takes one token from `rate_limiter`, when given.
+    """
+    params = dict(kwargs.pop("params", None) or {})
+    yielded = 0
+    while limit is None or yielded < limit:
+        page_size = LISTING_PAGE_SIZE if limit is None else min(LISTING_PAGE_SIZE, limit - yielded)
+        if rate_limiter:
+            rate_limiter.acquire()
+        page = call_with_retries(lambda: list(listing_method(limit=page_size, params=dict(params), **kwargs)),
+                                 name="reddit", breaker=get_breaker("reddit"))
+        if not page:
+            return
+        yield from page
+        yielded += len(page)
+        params["after"] = page[-1].fullname
+        params["count"] = yielded
+
+def fetch_info(reddit, fullnames: list[str], rate_limiter=None) -> list:
+    """
+    Resolves up to LISTING_PAGE_SIZE fullnames in one `reddit.info` request, retried on transient
+    errors. The request takes one token from `rate_limiter`, when given.
+    """
+    if rate_limiter:
+        rate_limiter.acquire()
+    return call_with_retries(lambda: list(reddit.info(fullnames=fullnames)), name="reddit", breaker=get_breaker("reddit"))
+
+# --- Comment Retrieval ---
+def is_regular_comment(comment) -> bool:
+    """Not stickied (moderator and bot notices) and not deleted."""
+    return not comment.stickied and comment.body not in ("[deleted]", "[removed]")
+
+def request_top_comments(submission, count: int, sort: str = DEFAULT_COMMENT_SORT) -> None:
+    """
+    Sizes the comment request of a lazily loaded submission for `count` top-level comments.
+    Call before reading any attribute of a submission created from a URL or ID: the first
+    attribute read loads the post together with its comments. No-op once they are loaded.
+    """
+    from praw.exceptions import ClientException
+
+    try:
+        submission.comment_sort = sort
+        submission.comment_limit = max(MIN_COMMENT_LIMIT, count * COMMENT_LIMIT_FACTOR)
+    except ClientException:
+        pass  # Comments were already loaded; work with what is there
+
+def top_level_comments(submission, count: int, qualifies=is_regular_comment,
+                       sort: str = DEFAULT_COMMENT_SORT) -> list:
+    """
+    Returns up to `count` top-level comments of `submission` for which `qualifies(comment)` holds,
+    in `sort` order. Loading the comments costs one API request unless they are already loaded.
+    """
+    from praw.models import Comment
+
+    request_top_comments(submission, count, sort)
+    comments = []
+    for comment in submission.comments:  # Top level only; replies are never visited
+        if isinstance(comment, Comment) and qualifies(comment):
+            comments.append(comment)
+            if len(comments) >= count:
+                break
+    return comments
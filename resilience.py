@@ -0,0 +1,230 @@
+# resilience.py
+"""
+Retries, deadlines and circuit breaking shared by every LLM and HTTP call.
+
+`call_with_retries` (and its async twin) re-runs a call on transient failures
+- connection errors, timeouts, 408/409/429 and 5xx responses - with
+exponential backoff and full jitter, waiting at least as long as a
+Retry-After header asks. Each call has an overall deadline, so retries never
+run past it. Calls to a failing service trip its `CircuitBreaker`; while it
+is open, callers back off instead of adding load, and one trial call after
+`reset_timeout` decides whether it closes again. Errors that survive all of
+this are raised to the caller rather than swallowed.
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+
+import metrics
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+DEFAULT_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+DEFAULT_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "30"))
+DEFAULT_DEADLINE = float(os.getenv("RETRY_DEADLINE_SECONDS", "300"))
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# Exception class names from openai, httpx and requests that signal a transient network problem
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout",
+    "TimeoutException", "ChunkedEncodingError",
+}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then a single trial call is let through: success
+    closes the circuit, failure opens it again. Safe to share between threads.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"  # This caller makes the trial call
+                return
+            raise CircuitOpenError(self.name, max(remaining, 0.1))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float | None:
+        """Seconds until an open circuit lets a trial call through, or None when it is not open."""
+        with self._lock:
+            if self.state != "open":
+                return None
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, "times_opened": self.times_opened}
+
+_breakers: dict[str, CircuitBreaker] = {}
+_retry_counts: dict[str, int] = {}
+_registry_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Returns the process-wide circuit breaker for service `name` ("openai", "github", "reddit", ...)."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def resilience_stats() -> dict:
+    """Breaker state and retry count per service."""
+    with _registry_lock:
+        names = set(_breakers) | set(_retry_counts)
+        return {name: dict(_breakers[name].stats() if name in _breakers else {}, retries=_retry_counts.get(name, 0))
+                for name in sorted(names)}
+
+def _count_retry(name: str) -> None:
+    with _registry_lock:
+        _retry_counts[name] = _retry_counts.get(name, 0) + 1
+
+# --- Classifying failures ---
+def _status_code(exc: BaseException):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for errors worth retrying: open circuits, timeouts, connection failures, 408/409/429 and 5xx."""
+    if isinstance(exc, (CircuitOpenError, TimeoutError, ConnectionError)):
+        return True
+    if getattr(exc, "original_exception", None) is not None:  # prawcore wraps network errors
+        return is_retryable(exc.original_exception)
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """The server-requested wait from Retry-After / retry-after-ms headers (or an open circuit), if any."""
+    if isinstance(exc, CircuitOpenError):
+        return exc.retry_after
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, exc: BaseException, base_delay: float = DEFAULT_BASE_DELAY,
+                  max_delay: float = DEFAULT_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for the `attempt`-th retry, never shorter than Retry-After."""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    requested = retry_after_seconds(exc)
+    return max(delay, requested) if requested is not None else delay
+
+def _plan_retry(name: str, attempt: int, max_attempts: int, deadline_at: float, exc: BaseException) -> float | None:
+    """Returns how long to wait before the next attempt, or None when the error should be raised."""
+    if attempt >= max_attempts or not is_retryable(exc):
+        return None
+    delay = backoff_delay(attempt, exc)
+    if time.monotonic() + delay > deadline_at:
+        return None
+    _count_retry(name)
+    print(f"Retrying {name} call in {delay:.1f}s (attempt {attempt + 1}/{max_attempts}) after {type(exc).__name__}: {exc}")
+    return delay
+
+# --- Retrying calls ---
+def call_with_retries(func, *args, name: str = "call", breaker: CircuitBreaker | None = None,
+                      max_attempts: int = DEFAULT_MAX_ATTEMPTS, deadline: float = DEFAULT_DEADLINE, **kwargs):
+    """
+    Calls func(*args, **kwargs), retrying transient failures with backoff for up to
+    `max_attempts` attempts or `deadline` seconds overall, whichever comes first.
+    The last error is raised once retrying is no longer possible.
+    """
+    deadline_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if breaker:
+                breaker.before_call()
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                metrics.record_call(name, time.perf_counter() - started, e)
+            if breaker and not isinstance(e, CircuitOpenError):
+                # A non-transient error (e.g. a 400) still means the service itself is answering
+                breaker.record_failure() if is_retryable(e) else breaker.record_success()
+            delay = _plan_retry(name, attempt, max_attempts, deadline_at, e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        metrics.record_call(name, time.perf_counter() - started)
+        if breaker:
+            breaker.record_success()
+        return result
+
+async def acall_with_retries(func, *args, name: str = "call", breaker: CircuitBreaker | None = None,
+                             max_attempts: int = DEFAULT_MAX_ATTEMPTS, deadline: float = DEFAULT_DEADLINE, **kwargs):
+    """Async counterpart of `call_with_retries` for coroutine functions."""
+    import asyncio
+    deadline_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if breaker:
+                breaker.before_call()
+            started = time.perf_counter()
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                metrics.record_call(name, time.perf_counter() - started, e)
+            if breaker and not isinstance(e, CircuitOpenError):
+                # A non-transient error (e.g. a 400) still means the service itself is answering
+                breaker.record_failure() if is_retryable(e) else breaker.record_success()
+            delay = _plan_retry(name, attempt, max_attempts, deadline_at, e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        metrics.record_call(name, time.perf_counter() - started)
+        if breaker:
+            breaker.record_success()
+        return result
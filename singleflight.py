@@ -0,0 +1,88 @@
+# singleflight.py
+"""
+In-flight request coalescing ("singleflight").
+
+When several threads ask for the same key at the same time, only the first
+runs the work; the others wait for it and share its result (or its exception).
+Nothing is remembered once the call finishes, so this complements caching
+rather than replacing it: it removes duplicate work that is *concurrent*.
+"""
+
+import threading
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key. Thread-safe.
+    `calls` counts every request, `executions` the ones that actually ran,
+    and `coalesced` the ones served by another caller's in-flight work.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: dict = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), sharing one execution among concurrent callers with the same `key`."""
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "executions": self.executions, "coalesced": self.coalesced,
+                    "in_flight": len(self._in_flight)}
+
+# Every group created through `get_group` is reported by `all_stats`
+_groups: dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+def get_group(name: str) -> SingleFlight:
+    """Returns the process-wide coalescing group called `name`, creating it on first use."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+def all_stats() -> dict:
+    """Counters for every named group, e.g. {"reddit_fetch": {"calls": 5, "coalesced": 3, ...}}."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
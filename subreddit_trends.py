@@ -1,13 +1,33 @@
 # subreddit_trends.py
+# Heavy dependencies (praw, openai, tqdm, asyncio) are imported inside the functions
+# that use them, so importing this module (e.g. for `cli.py --help`) stays fast.
 
-import praw
+from __future__ import annotations
+
+import argparse
+import json
 import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-import openai
-from tqdm import tqdm
 from datetime import datetime
 
+import metrics
+from corpus_store import TIME_FILTER_SECONDS, CorpusStore
+from llm_utils import achat_completion, chat_completion, get_default_cache
+from rate_limit import RateLimiter
+from reddit_utils import LISTING_PAGE_SIZE, Comment, Post, fetch_info, iter_listing, top_level_comments
+from resilience import call_with_retries, get_breaker
+from token_utils import count_tokens
+
+if TYPE_CHECKING:
+    import asyncio
+    from openai import AsyncOpenAI
+
 # --- Load environment variables ---
 load_dotenv()
 
@@ -17,35 +37,173 @@ CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USERNAME = os.getenv("REDDIT_USERNAME")
 USER_AGENT = f"Trend Tracer v4.0 by u/{REDDIT_USERNAME}"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# OAuth clients get 100 requests per minute; shared by every scraping worker.
+REDDIT_REQUESTS_PER_MINUTE = int(os.getenv("REDDIT_REQUESTS_PER_MINUTE", "100"))
+# Extra prompt tokens per post in a batch for its "POST n:" header and delimiters.
+BATCH_TOKENS_PER_POST_OVERHEAD = 10
+# Pass-1 corpora larger than this many tokens are split into chunks and map-reduced.
+TREND_CHUNK_TOKEN_BUDGET = int(os.getenv("TREND_CHUNK_TOKEN_BUDGET", "60000"))
+POST_SEPARATOR = "\n---\n"
+# Top-level comments kept per post for trend analysis
+COMMENTS_PER_POST = 3
+
+# --- Shared Clients ---
+@lru_cache(maxsize=None)
+def get_reddit_client():
+    """Returns the process-wide Reddit client, importing PRAW on first use."""
+    if not all([CLIENT_ID, CLIENT_SECRET, REDDIT_USERNAME]):
+        raise ValueError("Reddit API credentials missing in .env file.")
+    import praw
+    return praw.Reddit(client_id=CLIENT_ID, client_secret=CLIENT_SECRET, user_agent=USER_AGENT)
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Returns the process-wide OpenAI client, importing the SDK on first use."""
+    if not OPENAI_API_KEY: raise ValueError("OPENAI_API_KEY not found in .env file")
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=0)  # Retries are handled by resilience
 
 # --- Function to Scrape Reddit Data (Modified for Traceability) ---
-def scrape_subreddit_data(subreddit_name: str, time_filter: str = 'week', limit: int = 50):
+def _fetch_top_comments(post, rate_limiter: RateLimiter | None = None) -> list:
+    """Loads just the leading top-level comments of a post (PRAW comments)."""
+    if rate_limiter:
+        rate_limiter.acquire()  # Loading the comments costs one API request
+    return call_with_retries(top_level_comments, post, COMMENTS_PER_POST, name="reddit", breaker=get_breaker("reddit"))
+
+def _build_post_record(post, rate_limiter: RateLimiter | None = None,
+                       store: CorpusStore | None = None, subreddit_name: str = "") -> Post:
+    """Fetches a post's top comments and assembles its record, saving both to `store` if given."""
+    comments = _fetch_top_comments(post, rate_limiter)
+    if store:
+        store.upsert_post(post, subreddit_name)
+        store.replace_comments(post.id, [(comment.id, comment.body) for comment in comments], post.num_comments)
+    return Post.from_praw(post, comments)
+
+def _map_in_order(func, items, workers: int) -> list:
+    """Applies `func` to every item, on a thread pool when `workers` > 1, preserving input order."""
+    if workers <= 1:
+        return [func(item) for item in items]
+    # executor.map yields results in submission order
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+def _scrape_incrementally(reddit, subreddit_name: str, time_filter: str, limit: int, store: CorpusStore,
+                          workers: int, rate_limiter: RateLimiter | None) -> list[Post]:
+    """
+    Brings the stored corpus up to date and returns its top posts:
+    lists only posts newer than the store's watermark, refreshes scores and comment
+    counts of stored posts in bulk, and refetches only comment trees that changed.
+    When the store was never listed for this window and limit (or holds too few posts),
+    the `top()` listing is fetched once more and merged in before ranking.
+    """
+    subreddit = reddit.subreddit(subreddit_name)
+    window = TIME_FILTER_SECONDS[time_filter]
+    since_utc = time.time() - window if window else None
+    watermark = store.get_watermark(subreddit_name)
+    known_ids = store.post_ids_since(subreddit_name, since_utc)
+    
+    # 1. `new` is sorted newest-first, so stop at the first post already covered
+    new_posts = 0
+    for post in iter_listing(subreddit.new, None, rate_limiter):
+        if post.created_utc <= watermark or (since_utc and post.created_utc < since_utc):
+            break
+        store.upsert_post(post, subreddit_name)
+        new_posts += 1
+    
+    # 2. Refresh score and num_comments of stored posts, 100 fullnames per request
+    for start in range(0, len(known_ids), LISTING_PAGE_SIZE):
+        batch = [f"t3_{post_id}" for post_id in known_ids[start:start + LISTING_PAGE_SIZE]]
+        for post in fetch_info(reddit, batch, rate_limiter):
+            store.upsert_post(post, subreddit_name)
+    
+    # 3. Rank from the store, topped up from `top()` when it does not cover this window and limit
+    # A small subreddit whose whole window was listed stays covered until new posts come in
+    rows = store.top_posts(subreddit_name, since_utc, limit)
+    complete = store.listing_exhausted(subreddit_name, time_filter) and new_posts == 0
+    if not store.covers(subreddit_name, time_filter, limit) or (len(rows) < limit and not complete):
+        print(f"The corpus store does not cover the top {limit} posts of the last {time_filter}; listing them again.")
+        listed = 0
+        for post in iter_listing(subreddit.top, limit, rate_limiter, time_filter=time_filter):
+            store.upsert_post(post, subreddit_name)
+            listed += 1
+        store.record_listing(subreddit_name, time_filter, limit, exhausted=listed < limit)
+        rows = store.top_posts(subreddit_name, since_utc, limit)
+
+    # 4. Refetch only the comment trees that changed
+    stale_rows = [row for row in rows if store.comments_are_stale(row)]
+    def refresh_comments(row):
+        comments = _fetch_top_comments(reddit.submission(id=row["id"]), rate_limiter)
+        store.replace_comments(row["id"], [(comment.id, comment.body) for comment in comments], row["num_comments"])
+    _map_in_order(refresh_comments, stale_rows, workers)
+    print(f"Incremental scrape: {new_posts} new posts, {len(stale_rows)} of {len(rows)} comment trees refreshed.")
+    
+    return [
+        Post(row["id"], row["title"], row["url"], row["selftext"], bool(row["is_self"]),
+             [Comment(comment_id, body) for comment_id, body in store.get_comments(row["id"])])
+        for row in rows
+    ]
+
+def scrape_subreddit_data(subreddit_name: str, time_filter: str = 'week', limit: int = 50,
+                          workers: int = 1, rate_limiter: RateLimiter | None = None,
+                          store: CorpusStore | None = None, incremental: bool = False):
     """
     Scrapes a subreddit and returns a structured list of post data.
+    With `workers` > 1, comment trees are fetched in parallel by a bounded thread
+    pool whose requests are paced by `rate_limiter` (by default one sized to
+    REDDIT_REQUESTS_PER_MINUTE). Posts are always returned in listing order.
+    Scraped posts and comments are saved to `store` when one is given. With
+    `incremental=True` and a non-empty store, only new posts and changed comment
+    trees are fetched (see `_scrape_incrementally`).
     """
-    if not all([CLIENT_ID, CLIENT_SECRET, REDDIT_USERNAME]):
-        raise ValueError("Reddit API credentials missing in .env file.")
+    if incremental and store is None:
+        raise ValueError("Incremental scraping requires a CorpusStore.")
 
     print(f"Scraping top {limit} posts from r/{subreddit_name} for the last {time_filter}...")
-    reddit = praw.Reddit(client_id=CLIENT_ID, client_secret=CLIENT_SECRET, user_agent=USER_AGENT)
-    subreddit = reddit.subreddit(subreddit_name)
-    top_posts = subreddit.top(time_filter=time_filter, limit=limit)
-    
-    scraped_posts = []
-    for post in top_posts:
-        post_text = f"POST TITLE: {post.title}\n"
-        if post.is_self:
-            post_text += f"POST BODY: {post.selftext}\n"
-        post.comments.replace_more(limit=0)
-        for i, comment in enumerate(post.comments.list()):
-            if i >= 3: break
-            if not comment.stickied and isinstance(comment, praw.models.Comment):
-                post_text += f"COMMENT: {comment.body}\n"
-        scraped_posts.append({"title": post.title, "url": post.url, "text": post_text})
+    reddit = get_reddit_client()
+    if workers > 1 and rate_limiter is None:
+        rate_limiter = RateLimiter(REDDIT_REQUESTS_PER_MINUTE, per=60.0, capacity=workers)
+    
+    if incremental and store.get_watermark(subreddit_name) is not None:
+        scraped_posts = _scrape_incrementally(reddit, subreddit_name, time_filter, limit, store, workers, rate_limiter)
+    else:
+        top_posts = iter_listing(reddit.subreddit(subreddit_name).top, limit, rate_limiter, time_filter=time_filter)
+        scraped_posts = list(_iter_post_records(top_posts, workers, rate_limiter, store, subreddit_name))
+        if store:
+            store.record_listing(subreddit_name, time_filter, limit, exhausted=len(scraped_posts) < limit)
         
     print("Scraping complete.")
     return scraped_posts
 
+def _iter_post_records(posts, workers: int, rate_limiter: RateLimiter | None,
+                       store: CorpusStore | None = None, subreddit_name: str = ""):
+    """
+    Yields a record for each listed post, in listing order, as soon as its comments are in.
+    With `workers` > 1 comment trees load on a thread pool, at most 2 × `workers` posts ahead
+    of the consumer, so memory stays bounded however long the listing is.
+    """
+    if workers <= 1:
+        for post in posts:
+            yield _build_post_record(post, rate_limiter, store, subreddit_name)
+        return
+    max_in_flight = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for post in posts:
+            in_flight.append(executor.submit(_build_post_record, post, rate_limiter, store, subreddit_name))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def iter_subreddit_posts(subreddit_name: str, time_filter: str = 'week', limit: int = 50,
+                         workers: int = 1, rate_limiter: RateLimiter | None = None):
+    """Streaming form of `scrape_subreddit_data`: yields each post record as soon as it has been fetched."""
+    reddit = get_reddit_client()
+    if workers > 1 and rate_limiter is None:
+        rate_limiter = RateLimiter(REDDIT_REQUESTS_PER_MINUTE, per=60.0, capacity=workers)
+    top_posts = iter_listing(reddit.subreddit(subreddit_name).top, limit, rate_limiter, time_filter=time_filter)
+    yield from _iter_post_records(top_posts, workers, rate_limiter)
+
 # --- LLM Functions ---
 def get_trends_and_summaries_openai(all_text: str, subreddit_name: str, num_trends: int = 4):
     """
@@ -55,7 +213,6 @@ def get_trends_and_summaries_openai(all_text: str, subreddit_name: str, num_tren
     if not OPENAI_API_KEY: raise ValueError("OPENAI_API_KEY not found in .env file")
     
     print("Identifying trends and summaries with OpenAI...")
-    openai.api_key = OPENAI_API_KEY
     
     prompt = f"""
     You are an expert community analyst. Analyze the following text from the r/{subreddit_name} subreddit.
@@ -69,50 +226,117 @@ def get_trends_and_summaries_openai(all_text: str, subreddit_name: str, num_tren
     ---
     """
     
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-mini", # Powerful model for analysis
-            messages=[
-                {"role": "system", "content": f"You are an expert analyst for the r/{subreddit_name} subreddit."},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": "Here are the trends based on the data provided:\n\n" + all_text}
-            ],
-            temperature=0.5,
-        )
-        response_text = response.choices[0].message.content
+    # API errors that persist through the retries in chat_completion propagate: without trends there is no report
+    response_text = chat_completion(
+        get_openai_client(),
+        model="gpt-4.1-mini", # Powerful model for analysis
+        messages=[
+            {"role": "system", "content": f"You are an expert analyst for the r/{subreddit_name} subreddit."},
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": "Here are the trends based on the data provided:\n\n" + all_text}
+        ],
+        temperature=0.5,
+    )
+    return _parse_trends(response_text)
+
+def _parse_trends(response_text: str) -> dict:
+    """Parses the "Trend Title: / Summary: / ---" blocks of a trend response into {title: summary}."""
+    # Use regex to parse the structured output
+    trends_data = {}
+    pattern = re.compile(r"Trend Title: (.*?)\nSummary: (.*?)\n---", re.DOTALL)
+    matches = pattern.findall(response_text)
+    
+    if not matches:
+        print("Warning: Could not parse trends from the LLM response. The format may have been incorrect.")
+        return {}
         
-        # Use regex to parse the structured output
-        trends_data = {}
-        pattern = re.compile(r"Trend Title: (.*?)\nSummary: (.*?)\n---", re.DOTALL)
-        matches = pattern.findall(response_text)
+    for title, summary in matches:
+        trends_data[title.strip()] = summary.strip()
         
-        if not matches:
-            print("Warning: Could not parse trends from the LLM response. The format may have been incorrect.")
-            return {}
-            
-        for title, summary in matches:
-            trends_data[title.strip()] = summary.strip()
-            
-        return trends_data
-    except Exception as e:
-        print(f"An error occurred with the OpenAI API during trend identification: {e}")
-        return {}
+    return trends_data
 
-def map_post_to_trend_openai(post_text: str, trends_data: dict):
+def pack_texts_into_chunks(texts: list[str], token_budget: int) -> list[list[str]]:
+    """Greedily groups consecutive texts into chunks of at most `token_budget` tokens (an oversized text gets its own chunk)."""
+    separator_tokens = count_tokens(POST_SEPARATOR)
+    chunks, current, current_tokens = [], [], 0
+    for text in texts:
+        text_tokens = count_tokens(text) + separator_tokens
+        if current and current_tokens + text_tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += text_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def merge_trend_candidates(candidates: list[dict], subreddit_name: str, num_trends: int = 4) -> dict:
+    """Reduce step: consolidates per-chunk candidate trends into the final `num_trends` trends in one call."""
+    print(f"Merging {sum(len(c) for c in candidates)} candidate trends from {len(candidates)} chunks...")
+    candidates_formatted = "\n".join(
+        f"Trend Title: {title}\nSummary: {summary}\n---"
+        for chunk_trends in candidates for title, summary in chunk_trends.items()
+    )
+    prompt = f"""
+    You are an expert community analyst. Below are candidate discussion trends that were identified independently in different samples of posts from the r/{subreddit_name} subreddit.
+    Merge duplicates and overlapping candidates, and identify the top {num_trends} major trends across all samples. Candidates that recur across samples are more important.
+    
+    For each trend, provide a concise title and a 1-2 sentence summary.
+    **Format your output EXACTLY as follows for each trend, with no extra text:**
+    
+    Trend Title: [The title of the trend]
+    Summary: [The summary of the trend]
+    ---
+    
+    CANDIDATE TRENDS:
+    ---
+    {candidates_formatted}
     """
-    Pass 2: Categorizes a single post against trends, using summaries for context.
-    Uses a faster, cheaper model for high-volume classification.
+    response_text = chat_completion(
+        get_openai_client(),
+        model="gpt-4.1-mini",
+        messages=[
+            {"role": "system", "content": f"You are an expert analyst for the r/{subreddit_name} subreddit."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.5,
+    )
+    return _parse_trends(response_text)
+
+def get_trends_map_reduce(post_texts: list[str], subreddit_name: str, num_trends: int = 4,
+                          chunk_token_budget: int = TREND_CHUNK_TOKEN_BUDGET, workers: int = 8) -> dict:
     """
-    openai.api_key = OPENAI_API_KEY
-    trend_titles = list(trends_data.keys())
+    Pass 1 for corpora of any size. Posts are packed into chunks that fit `chunk_token_budget`;
+    if they all fit in one, this is a single `get_trends_and_summaries_openai` call. Otherwise
+    candidate trends are extracted from every chunk in parallel (map) and merged into the
+    final `num_trends` in one further call (reduce).
+    """
+    if not OPENAI_API_KEY: raise ValueError("OPENAI_API_KEY not found in .env file")
+    chunks = pack_texts_into_chunks(post_texts, chunk_token_budget)
+    if len(chunks) <= 1:
+        return get_trends_and_summaries_openai(POST_SEPARATOR.join(post_texts), subreddit_name, num_trends)
     
-    # Build a context-rich prompt
-    trends_formatted = "\n".join(
-        f"{i+1}. Trend Title: {title}\n   Summary: {trends_data[title]}" 
-        for i, title in enumerate(trend_titles)
+    print(f"Corpus exceeds {chunk_token_budget} tokens; extracting candidate trends from {len(chunks)} chunks...")
+    candidates_per_chunk = num_trends * 2
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        candidates = list(executor.map(
+            lambda chunk: get_trends_and_summaries_openai(POST_SEPARATOR.join(chunk), subreddit_name, candidates_per_chunk),
+            chunks,
+        ))
+    candidates = [chunk_trends for chunk_trends in candidates if chunk_trends]
+    if not candidates:
+        return {}
+    return merge_trend_candidates(candidates, subreddit_name, num_trends)
+
+def format_trends_for_prompt(trends_data: dict) -> str:
+    """Renders the trends as a numbered list of titles and summaries for classification prompts."""
+    return "\n".join(
+        f"{i+1}. Trend Title: {title}\n   Summary: {summary}"
+        for i, (title, summary) in enumerate(trends_data.items())
     )
-    
-    prompt = f"""
+
+def _build_classification_prompt(post_text: str, trends_formatted: str) -> str:
+    return f"""
     Below is the text from a single Reddit post. Following that is a numbered list of discussion trends, each with a title and a summary.
     
     POST TEXT:
@@ -128,69 +352,378 @@ def map_post_to_trend_openai(post_text: str, trends_data: dict):
     Which trend number is the MOST relevant to the post text?
     Respond with ONLY the number. If no trend is a good fit, respond with "None".
     """
-    
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-mini", # Fast, cheap model for classification
+
+def _parse_trend_number(response_text: str):
+    match = re.search(r'\d+', response_text)
+    return int(match.group(0)) if match else None
+
+def map_post_to_trend_openai(post_text: str, trends_data: dict):
+    """
+    Pass 2: Categorizes a single post against trends, using summaries for context.
+    Uses a faster, cheaper model for high-volume classification.
+    Raises if the request still fails after retries.
+    """
+    prompt = _build_classification_prompt(post_text, format_trends_for_prompt(trends_data))
+    response_text = chat_completion(
+        get_openai_client(),
+        model="gpt-4.1-mini", # Fast, cheap model for classification
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.0,
+    )
+    return _parse_trend_number(response_text.strip())
+
+async def map_post_to_trend_openai_async(post_text: str, trends_formatted: str,
+                                         client: AsyncOpenAI, semaphore: asyncio.Semaphore):
+    """Async counterpart of `map_post_to_trend_openai`; at most `semaphore`'s limit of calls run at once."""
+    prompt = _build_classification_prompt(post_text, trends_formatted)
+    async with semaphore:
+        response_text = await achat_completion(
+            client,
+            model="gpt-4.1-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.0,
         )
-        response_text = response.choices[0].message.content.strip()
-        match = re.search(r'\d+', response_text)
-        if match: return int(match.group(0))
-    except Exception as e:
-        print(f"\nWarning: Could not process a post classification. Error: {e}")
-    return None
+    return _parse_trend_number(response_text.strip())
 
-# --- Main Execution Block ---
-if __name__ == "__main__":
-    SUBREDDIT_TO_ANALYZE = "Rag"
-    POST_LIMIT = 10
+def report_classification_failures(failures: list[tuple[str, Exception]], total: int) -> None:
+    """Prints which posts could not be classified after retries; they are left out of every trend."""
+    if not failures:
+        return
+    print(f"\nWarning: {len(failures)} of {total} posts could not be classified after retries and are not in the report:")
+    for title, error in failures:
+        print(f"- {title}: {type(error).__name__}: {error}")
+
+async def classify_posts_async(posts: list[Post], trends_data: dict, concurrency: int = 10,
+                               client: AsyncOpenAI | None = None) -> list:
+    """
+    Pass 2, concurrently: classifies every post with up to `concurrency` requests in flight.
+    Returns the trend numbers (or None) in the same order as `posts`.
+    """
+    import asyncio
+    from tqdm import tqdm
     
-    posts = scrape_subreddit_data(SUBREDDIT_TO_ANALYZE, time_filter='week', limit=POST_LIMIT)
+    if client is None:
+        from openai import AsyncOpenAI
+        # A client created here is closed here, releasing its connection pool; passed-in clients are left open
+        async with AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0) as client:  # Retries are handled by resilience
+            return await classify_posts_async(posts, trends_data, concurrency, client)
+    semaphore = asyncio.Semaphore(concurrency)
+    trends_formatted = format_trends_for_prompt(trends_data)
+    failures = []
     
-    if posts:
-        # Pass 1: Identify trends and their summaries
-        consolidated_text = "\n---\n".join([p['text'] for p in posts])
-        trends_and_summaries = get_trends_and_summaries_openai(consolidated_text, SUBREDDIT_TO_ANALYZE)
+    with tqdm(total=len(posts), desc="Classifying posts") as progress:
+        async def classify(post):
+            try:
+                return await map_post_to_trend_openai_async(post.text, trends_formatted, client, semaphore)
+            except Exception as e:
+                failures.append((post.title, e))
+                return None
+            finally:
+                progress.update(1)
+        trend_numbers = await asyncio.gather(*(classify(post) for post in posts))
+    report_classification_failures(failures, len(posts))
+    return trend_numbers
 
-        if trends_and_summaries:
-            print("\nIdentified Trends and Summaries:")
-            for title, summary in trends_and_summaries.items():
-                print(f"- {title}: {summary}")
-            
-            # Pass 2: Map each post to a trend using the summaries for context
-            trend_titles = list(trends_and_summaries.keys())
-            trends_with_posts = {title: [] for title in trend_titles}
-            
-            print(f"\nCategorizing {len(posts)} posts against trends...")
-            for post in tqdm(posts, desc="Classifying posts"):
-                trend_number = map_post_to_trend_openai(post['text'], trends_and_summaries)
-                if trend_number and 1 <= trend_number <= len(trend_titles):
-                    trend_title = trend_titles[trend_number - 1]
-                    trends_with_posts[trend_title].append(post)
-
-            # Final step: Generate and save the detailed Markdown report
-            OUTPUT_FILENAME = os.path.join("reddit_trends", f"{SUBREDDIT_TO_ANALYZE}_trend_report_{datetime.now().strftime('%Y-%m-%d')}.md")
-            with open(OUTPUT_FILENAME, 'w', encoding='utf-8') as f:
-                f.write(f"# Trend Report for r/{SUBREDDIT_TO_ANALYZE}\n")
-                f.write(f"**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                
-                for title, summary in trends_and_summaries.items():
-                    f.write(f"## {title}\n\n")
-                    f.write(f"**Summary:** {summary}\n\n")
-                    
-                    contributing_posts = trends_with_posts.get(title, [])
-                    if contributing_posts:
-                        f.write("**Contributing Posts:**\n")
-                        for post in contributing_posts:
-                            f.write(f"*   [{post['title']}]({post['url']})\n")
-                    else:
-                        f.write("*No posts from the sample were strongly mapped to this trend.*\n")
-                    f.write("\n---\n\n")
+def _build_batch_classification_prompt(post_texts: list[str], trends_formatted: str) -> str:
+    posts_formatted = "\n".join(
+        f"POST {i+1}:\n---\n{text}\n---" for i, text in enumerate(post_texts)
+    )
+    return f"""
+    Below are {len(post_texts)} numbered Reddit posts. Following them is a numbered list of discussion trends, each with a title and a summary.
+    
+    POSTS:
+    {posts_formatted}
+    
+    TRENDS:
+    ---
+    {trends_formatted}
+    ---
+    
+    For EACH post, decide which trend number is the MOST relevant to it. Use null if no trend is a good fit.
+    Your ONLY output must be a single JSON object with a key "classifications" containing an array with one entry per post.
+    
+    Example: {{"classifications": [{{"post_index": 1, "trend_number": 2}}, {{"post_index": 2, "trend_number": null}}]}}
+    """
+
+def _pack_batches(post_texts: list[str], base_tokens: int, token_budget: int, max_batch_size: int) -> list[list[int]]:
+    """Greedily groups post indices so that each batch prompt stays within `token_budget`."""
+    batches, current, current_tokens = [], [], base_tokens
+    for i, text in enumerate(post_texts):
+        post_tokens = count_tokens(text) + BATCH_TOKENS_PER_POST_OVERHEAD
+        if current and (current_tokens + post_tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(i)
+        current_tokens += post_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def map_posts_to_trends_batched(posts: list[Post], trends_data: dict,
+                                token_budget: int = 12000, max_batch_size: int = 25) -> list:
+    """
+    Pass 2, batched: classifies several posts per request so the trend list is sent once per batch.
+    Batch size adapts to `token_budget` (prompt tokens per request). Posts the model leaves out of
+    its answer fall back to a single-post `map_post_to_trend_openai` call.
+    Returns the trend numbers (or None) in the same order as `posts`.
+    """
+    from tqdm import tqdm
+    
+    trends_formatted = format_trends_for_prompt(trends_data)
+    post_texts = [post.text for post in posts]
+    base_tokens = count_tokens(_build_batch_classification_prompt([], trends_formatted))
+    batches = _pack_batches(post_texts, base_tokens, token_budget, max_batch_size)
+    
+    trend_numbers = [None] * len(posts)
+    answered = set()
+    for batch in tqdm(batches, desc="Classifying post batches"):
+        prompt = _build_batch_classification_prompt([post_texts[i] for i in batch], trends_formatted)
+        try:
+            response_text = chat_completion(
+                get_openai_client(),
+                model="gpt-4.1-mini",
+                messages=[
+                    {"role": "system", "content": "You are a precise classifier that outputs only JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.0,
+            )
+            data = json.loads(response_text)
+            for item in data.get("classifications", []):
+                post_index = item.get("post_index")
+                if not isinstance(post_index, int) or not 1 <= post_index <= len(batch):
+                    continue
+                trend_number = item.get("trend_number")
+                original_index = batch[post_index - 1]
+                trend_numbers[original_index] = trend_number if isinstance(trend_number, int) else None
+                answered.add(original_index)
+        except Exception as e:
+            # Unanswered posts fall back to single-post classification below
+            print(f"\nWarning: Could not process a batch classification. Error: {e}")
+    
+    missing = [i for i in range(len(posts)) if i not in answered]
+    failures = []
+    if missing:
+        print(f"Falling back to single-post classification for {len(missing)} posts...")
+        for i in missing:
+            try:
+                trend_numbers[i] = map_post_to_trend_openai(post_texts[i], trends_data)
+            except Exception as e:
+                failures.append((posts[i].title, e))
+    report_classification_failures(failures, len(posts))
+    return trend_numbers
+
+def _default_embedder():
+    from embedding_classifier import OpenAIEmbedder  # Needs numpy
+    return OpenAIEmbedder(get_openai_client())
+
+def collapse_duplicate_posts(posts: list[Post]) -> tuple[list[Post], list[int]]:
+    """
+    Sets reposts and other near-duplicate posts aside before prompting. Returns the distinct
+    posts and, for every input post, the index of the distinct post that stands in for it.
+    """
+    from dedup import find_near_duplicates, report_removed
+    duplicate_of = find_near_duplicates([p.text for p in posts])
+    report_removed("posts", len(posts), [posts[i].text for i in duplicate_of])
+    unique_posts, unique_index = [], {}
+    for i, post in enumerate(posts):
+        if i not in duplicate_of:
+            unique_index[i] = len(unique_posts)
+            unique_posts.append(post)
+    return unique_posts, [unique_index[duplicate_of.get(i, i)] for i in range(len(posts))]
+
+def group_posts_by_trend(posts: list[Post], trend_numbers: list, trends_data: dict) -> dict:
+    """Builds the {trend title: [posts]} mapping from per-post trend numbers, dropping out-of-range answers."""
+    trend_titles = list(trends_data.keys())
+    trends_with_posts = {title: [] for title in trend_titles}
+    for post, trend_number in zip(posts, trend_numbers):
+        if trend_number and 1 <= trend_number <= len(trend_titles):
+            trends_with_posts[trend_titles[trend_number - 1]].append(post)
+    return trends_with_posts
+
+# --- Report ---
+def report_path(subreddit_name: str, time_filter: str = 'week') -> str:
+    """Default report location; windows other than the default week are named in the file."""
+    window = "" if time_filter == 'week' else f"_{time_filter}"
+    return os.path.join("reddit_trends", f"{subreddit_name}{window}_trend_report_{datetime.now().strftime('%Y-%m-%d')}.md")
+
+def write_trend_deltas(f, deltas: dict) -> None:
+    """Writes the "Changes since" table built by `TrendHistory.trend_deltas`."""
+    f.write(f"## Changes since {datetime.fromtimestamp(deltas['since']).strftime('%Y-%m-%d %H:%M')}\n\n")
+    f.write("| Trend | Status | Posts | Before |\n|---|---|---|---|\n")
+    for trend in deltas["trends"]:
+        previous = "-" if trend["previous_posts"] is None else trend["previous_posts"]
+        f.write(f"| {trend['title']} | {trend['status']} | {trend['posts']} | {previous} |\n")
+    if deltas["faded"]:
+        f.write("\n**Faded:** " + ", ".join(f"{trend['title']} ({trend['previous_posts']} posts)"
+                                           for trend in deltas["faded"]) + "\n")
+    f.write("\n---\n\n")
+
+def write_trend_report(output_filename: str, subreddit_name: str, trends_data: dict, trends_with_posts: dict,
+                       deltas: dict | None = None) -> None:
+    """Writes the Markdown trend report; posts only need their `title` and `url`."""
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write(f"# Trend Report for r/{subreddit_name}\n")
+        f.write(f"**Generated on:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        if deltas:
+            write_trend_deltas(f, deltas)
+        
+        for title, summary in trends_data.items():
+            f.write(f"## {title}\n\n")
+            f.write(f"**Summary:** {summary}\n\n")
             
-            print(f"\nAnalysis complete! Report saved to {OUTPUT_FILENAME}")
+            contributing_posts = trends_with_posts.get(title, [])
+            if contributing_posts:
+                f.write("**Contributing Posts:**\n")
+                for post in contributing_posts:
+                    f.write(f"*   [{post.title}]({post.url})\n")
+            else:
+                f.write("*No posts from the sample were strongly mapped to this trend.*\n")
+            f.write("\n---\n\n")
+
+# --- Command-Line Interface ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--subreddit", default="Rag", help="Subreddit to analyze (default: Rag).")
+    parser.add_argument("--time-filter", default="week", choices=list(TIME_FILTER_SECONDS), help="Window for top posts.")
+    parser.add_argument("--limit", type=int, default=10, help="Number of top posts to analyze.")
+    parser.add_argument("--scrape-workers", type=int, default=8, help="Concurrent comment-tree fetches.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent classification requests.")
+    parser.add_argument("--classifier", default="async", choices=["async", "batched", "embedding"],
+                        help="Pass-2 backend: one request per post, several posts per request, or cosine similarity.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update a local corpus store and refetch only new posts and changed comment trees "
+                             "(see corpus_store.py) instead of scraping from scratch.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Overlap scraping, trend extraction and classification (see trend_pipeline.py).")
+    parser.add_argument("--history", action="store_true",
+                        help="Match trends to earlier runs, reuse their post assignments and report changes "
+                             "(see trend_history.py; needs numpy). Ignored with --streaming.")
+
+def generate_trend_report(subreddit_name: str, output_filename: str, time_filter: str = 'week', limit: int = 10,
+                          scrape_workers: int = 8, classifier: str = "async", concurrency: int = 10,
+                          incremental: bool = False, rate_limiter: RateLimiter | None = None,
+                          store: CorpusStore | None = None, on_stage=None, history=None, embedder=None) -> dict:
+    """
+    Scrapes the subreddit, identifies trends, maps posts to them and writes the Markdown report.
+    Returns the trends found (empty if there was no data or no trends). `on_stage(name)` is
+    called as each stage starts: "scrape", "trends", "classify" and "report".
+    With a `history` (trend_history.TrendHistory), trends are matched to earlier runs using
+    `embedder` (OpenAI embeddings by default), posts keep their earlier assignments where the
+    trend survived, and the report opens with the changes since an earlier run.
+    With `incremental` and no `store`, the default CorpusStore is opened for this report.
+    """
+    own_store = store is None and incremental
+    if own_store:
+        store = CorpusStore()
+
+    def stage(name):
+        metrics.enter_stage(name)
+        if on_stage:
+            on_stage(name)
+
+    try:
+        stage("scrape")
+        posts = scrape_subreddit_data(subreddit_name, time_filter=time_filter, limit=limit, workers=scrape_workers,
+                                      rate_limiter=rate_limiter, store=store, incremental=incremental)
+        if not posts:
+            print(f"No data was scraped from r/{subreddit_name}. Cannot generate a report.")
+            return {}
+    
+        # Reposts are prompted once; their copies share the original's trend
+        unique_posts, representatives = collapse_duplicate_posts(posts)
+    
+        # Pass 1: Identify trends and their summaries
+        stage("trends")
+        trends_and_summaries = get_trends_map_reduce([p.text for p in unique_posts], subreddit_name)
+        if not trends_and_summaries:
+            print(f"Could not identify any trends from the r/{subreddit_name} data.")
+            return {}
+    
+        print(f"\nIdentified Trends and Summaries for r/{subreddit_name}:")
+        for title, summary in trends_and_summaries.items():
+            print(f"- {title}: {summary}")
+    
+        # Pass 2: Map each post to a trend using the summaries for context
+        stage("classify")
+        reused, trend_run = {}, None
+        if history is not None:
+            # Posts already assigned to a trend that is still present keep their assignment
+            trend_run = history.start_run(subreddit_name, time_filter, trends_and_summaries,
+                                          embedder or _default_embedder())
+            reused = history.reusable_classifications(trend_run, [p.id for p in unique_posts])
+        to_classify = [p for p in unique_posts if p.id not in reused]
+        print(f"\nCategorizing {len(to_classify)} posts against trends..."
+              + (f" ({len(reused)} reused from earlier runs)" if reused else ""))
+        if not to_classify:
+            new_numbers = []
+        elif classifier == "batched":
+            new_numbers = map_posts_to_trends_batched(to_classify, trends_and_summaries)
+        elif classifier == "embedding":
+            from embedding_classifier import classify_posts_by_embedding  # Needs numpy
+            new_numbers = classify_posts_by_embedding(to_classify, trends_and_summaries,
+                                                      embedder or _default_embedder())
+        else:
+            import asyncio
+            new_numbers = asyncio.run(classify_posts_async(to_classify, trends_and_summaries, concurrency=concurrency))
+        classified = dict(zip((p.id for p in to_classify), new_numbers))
+        unique_numbers = [reused[p.id] if p.id in reused else classified[p.id] for p in unique_posts]
+        trend_numbers = [unique_numbers[i] for i in representatives]
+        trends_with_posts = group_posts_by_trend(posts, trend_numbers, trends_and_summaries)
+    
+        # Final step: Generate and save the detailed Markdown report
+        stage("report")
+        deltas = None
+        if history is not None:
+            history.record_run(trend_run, [p.id for p in posts], trend_numbers,
+                               {p.id for p in posts if p.id in reused})
+            deltas = history.trend_deltas(trend_run)
+        write_trend_report(output_filename, subreddit_name, trends_and_summaries, trends_with_posts, deltas)
+        return trends_and_summaries
+    finally:
+        stage(None)
+        if own_store:
+            store.close()
+
+def run(args: argparse.Namespace) -> None:
+    """Writes the trend report for one subreddit, in batch or streaming mode."""
+    subreddit_name = args.subreddit
+    output_filename = report_path(subreddit_name, args.time_filter)
+    
+    if args.streaming:
+        from trend_pipeline import run_streaming_trend_report
+        if run_streaming_trend_report(subreddit_name, output_filename, time_filter=args.time_filter, limit=args.limit,
+                                      scrape_workers=args.scrape_workers, classify_concurrency=args.concurrency):
+            print(f"\nAnalysis complete! Report saved to {output_filename}")
         else:
             print("Could not identify any trends from the data.")
-    else:
-        print("No data was scraped. Cannot generate a report.")
\ No newline at end of file
+        return
+    
+    history = None
+    if args.history:
+        from trend_history import TrendHistory  # Needs numpy
+        history = TrendHistory()
+    try:
+        if not generate_trend_report(subreddit_name, output_filename, time_filter=args.time_filter, limit=args.limit,
+                                     scrape_workers=args.scrape_workers, classifier=args.classifier,
+                                     concurrency=args.concurrency, incremental=args.incremental, history=history):
+            return
+    finally:
+        if history:
+            history.close()
+    
+    print(f"\nAnalysis complete! Report saved to {output_filename}")
+    llm_cache = get_default_cache()
+    if llm_cache:
+        stats = llm_cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate).")
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Identify discussion trends in a subreddit and map posts to them.")
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    metrics.run_instrumented(run, parser.parse_args(argv))
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# summarizer_daemon.py
+"""
+Long-running summarization service with a local JSON API.
+
+The OpenAI client, the Reddit client and the NLTK sentence tokenizer are built
+once at start-up and shared by every request, so a request only pays for the
+fetch and the LLM calls. Requests are served concurrently, one thread each.
+
+    POST /summarize/reddit  {"url": "https://www.reddit.com/r/.../comments/..."}
+    POST /summarize/github  {"url": "https://github.com/user/repo"}
+    GET  /health
+    GET  /metrics   (Prometheus text format)
+
+Listens on 127.0.0.1:8765 by default, or on a Unix socket with --unix-socket.
+Concurrent requests for the same post or repository (in any URL form) share
+one in-flight job; GET /health reports how many calls were coalesced.
+A README that has not changed since it was last summarized is answered from
+the stored summary ("cached": true) without any LLM calls.
+Fetchers and the LLM client are injectable, so the service can run fully
+offline against local stand-ins.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import metrics
+import summarizer_utils as su
+from github_repo_summarizer import get_cached_summary, normalize_repo_url, store_summary
+from reddit_post_summarizer import REDDIT_DOCUMENT_TYPE, normalize_post_url
+from resilience import get_breaker, is_retryable, resilience_stats, retry_after_seconds
+from singleflight import all_stats, get_group
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MODEL = "gpt-4.1-nano"
+
+class SummarizationError(Exception):
+    """
+    A request that could not be summarized; `status` is the HTTP status to report and
+    `retry_after` the seconds to send as Retry-After, if any.
+    """
+
+    def __init__(self, message: str, status: int = 502, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def _default_reddit_fetcher(url: str) -> tuple[str, str, str]:
+    from reddit_post_summarizer import get_reddit_post_content
+    return get_reddit_post_content(url)
+
+def _default_github_fetcher(url: str) -> tuple[str | None, str]:
+    from github_repo_summarizer import get_github_readme_content
+    return get_github_readme_content(url)
+
+class SummarizationService:
+    """
+    Runs the fetch → preprocess → extract → summarize pipeline for Reddit posts and
+    GitHub READMEs against warm, shared clients. Safe to call from many threads.
+    """
+
+    def __init__(self, client=None, model: str = DEFAULT_MODEL,
+                 reddit_fetcher: Callable[[str], tuple] | None = None,
+                 github_fetcher: Callable[[str], tuple] | None = None,
+                 extractor: str = su.DEFAULT_EXTRACTION_MODE):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # Retries are handled by resilience
+        self.client = client
+        self.model = model
+        self.extractor = extractor
+        self.reddit_fetcher = reddit_fetcher or _default_reddit_fetcher
+        self.github_fetcher = github_fetcher or _default_github_fetcher
+        self.started_at = time.time()
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        """Builds the tokenizer and the Reddit client now rather than on the first request."""
+        su.download_nltk_data_if_needed()
+        su.get_sentence_tokenizer()
+        if self.reddit_fetcher is _default_reddit_fetcher:
+            from reddit_post_summarizer import get_reddit_client
+            try:
+                get_reddit_client()
+            except Exception as e:
+                print(f"Reddit client unavailable; /summarize/reddit will fail until it is configured: {e}")
+
+    def _summarize(self, raw_text: str, document_type: str, focus: str, clean_markup: bool, timings: dict) -> dict:
+        start = time.perf_counter()
+        sentences_map, formatted_text = su.preprocess_text_to_numbered_sentences(raw_text, clean_markup=clean_markup)
+        sentence_count = su.determine_sentence_count(len(sentences_map))
+        timings["preprocess_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        key_ids = su.select_key_sentence_ids(sentences_map, formatted_text, self.client, model=self.model,
+                                             sentence_count=sentence_count, document_type=document_type, focus=focus,
+                                             mode=self.extractor)
+        timings["extract_ms"] = (time.perf_counter() - start) * 1000
+        if not key_ids:
+            raise SummarizationError("Could not extract key sentences.")
+
+        key_sentences = [{"id": sid, "text": sentences_map[sid]} for sid in key_ids if sid in sentences_map]
+        start = time.perf_counter()
+        final_summary = su.generate_abstractive_summary([f"[{s['id']}] {s['text']}" for s in key_sentences],
+                                                        self.client, model=self.model, document_type=document_type)
+        timings["summarize_ms"] = (time.perf_counter() - start) * 1000
+        return {"sentence_count": len(sentences_map), "key_sentences": key_sentences, "summary": final_summary}
+
+    def _finish(self, result: dict, timings: dict, start: float) -> dict:
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        result["timings_ms"] = {name: round(value, 1) for name, value in timings.items()}
+        return result
+
+    def _coalesced(self, key: str, job, url: str) -> dict:
+        with self._lock:
+            self.requests_served += 1
+        result = get_group("summarize_jobs").do(key, job, url)
+        # Callers that joined another request's job may have used a different URL form
+        return dict(result, source_url=url)
+
+    def summarize_reddit(self, url: str) -> dict:
+        return self._coalesced(normalize_post_url(url), self._summarize_reddit, url)
+
+    def summarize_github(self, url: str) -> dict:
+        return self._coalesced(normalize_repo_url(url), self._summarize_github, url)
+
+    def _summarize_reddit(self, url: str) -> dict:
+        start, timings = time.perf_counter(), {}
+        post_title, post_id, long_text = self.reddit_fetcher(url)
+        timings["fetch_ms"] = (time.perf_counter() - start) * 1000
+        if long_text.startswith("Error:"):
+            raise SummarizationError(long_text)
+
+        result = {"kind": "reddit", "source_url": url, "id": post_id, "title": post_title}
+        result.update(self._summarize(long_text, REDDIT_DOCUMENT_TYPE, "the main points", False, timings))
+        return self._finish(result, timings, start)
+
+    def _summarize_github(self, url: str) -> dict:
+        start, timings = time.perf_counter(), {}
+        repo_name, readme_text = self.github_fetcher(url)
+        timings["fetch_ms"] = (time.perf_counter() - start) * 1000
+        if repo_name is None:  # The fetcher failed; `readme_text` is its error message, never a README
+            retry_after = get_breaker("github").retry_after()
+            if retry_after is not None:
+                raise SummarizationError(readme_text, status=503, retry_after=retry_after)
+            raise SummarizationError(readme_text, status=404 if "Could not find" in readme_text else 502)
+
+        result = {"kind": "github", "source_url": url, "repo": repo_name}
+        # An unchanged README keeps the summary it was given last time
+        summary = get_cached_summary(readme_text, self.model, self.extractor)
+        result["cached"] = summary is not None
+        if summary is None:
+            summary = self._summarize(readme_text, "document", "its purpose, features, and usage", True, timings)
+            store_summary(readme_text, self.model, self.extractor, summary)
+        result.update(summary)
+        return self._finish(result, timings, start)
+
+    def health(self) -> dict:
+        return {"status": "ok", "model": self.model, "extractor": self.extractor,
+                "uptime_s": round(time.time() - self.started_at, 1), "requests_served": self.requests_served, "coalescing": all_stats(), "upstreams": resilience_stats()}
+
+# --- HTTP Layer ---
+class SummarizationRequestHandler(BaseHTTPRequestHandler):
+    server_version = "SummarizerDaemon/1.0"
+
+    @property
+    def service(self) -> SummarizationService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _send_json(self, status: int, payload: dict, retry_after: float | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(max(1, round(retry_after))))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.service.health())
+        elif self.path == "/metrics":
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+    def do_POST(self):
+        routes = {"/summarize/reddit": self.service.summarize_reddit, "/summarize/github": self.service.summarize_github}
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            url = json.loads(self.rfile.read(length) or b"{}").get("url")
+        except (ValueError, AttributeError):
+            self._send_json(400, {"error": "Request body must be a JSON object."})
+            return
+        if not url:
+            self._send_json(400, {"error": "Missing \"url\" in request body."})
+            return
+
+        try:
+            self._send_json(200, handler(url))
+        except SummarizationError as e:
+            self._send_json(e.status, {"error": str(e), "source_url": url}, e.retry_after)
+        except Exception as e:
+            if is_retryable(e):
+                # Still failing after retries (or the circuit is open): tell the client to come back later
+                self._send_json(503, {"error": f"Upstream unavailable: {e}", "source_url": url}, retry_after_seconds(e))
+                return
+            print(f"Unexpected error while summarizing {url}: {e}")
+            self._send_json(500, {"error": f"Internal error: {e}", "source_url": url})
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service: SummarizationService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                unix_socket: str | None = None):
+    """Creates (but does not start) a threaded HTTP server bound to TCP or a Unix socket."""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, SummarizationRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), SummarizationRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+# --- Command-Line Interface ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on.")
+    parser.add_argument("--unix-socket", metavar="PATH", help="Listen on a Unix socket instead of TCP.")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Chat model for both summarization steps.")
+    parser.add_argument("--openai-base-url", help="OpenAI-compatible endpoint, e.g. a local stand-in server.")
+    parser.add_argument("--extractor", default=su.DEFAULT_EXTRACTION_MODE, choices=su.EXTRACTION_MODES,
+                        help="Key sentences from the LLM reading the whole text (default; EXTRACTION_MODE), "
+                             "a local shortlist checked by the LLM, or the local ranker alone.")
+
+def run(args: argparse.Namespace) -> None:
+    client = None
+    if args.openai_base_url:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "local"), base_url=args.openai_base_url, max_retries=0)
+    service = SummarizationService(client=client, model=args.model, extractor=args.extractor)
+    print("Warming up clients and tokenizer...")
+    service.warm_up()
+
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    print(f"Summarization daemon listening on {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve Reddit and GitHub summaries over a local JSON API.")
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    metrics.run_instrumented(run, parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
@@ -3,65 +3,218 @@
 Reusable core functions for the traceable summarization workflow.
 This module contains the logic for text processing, LLM interaction for
 extractive and abstractive summarization.
+NLTK and the OpenAI SDK are imported only where they are needed, keeping
+module import (and therefore CLI start-up) cheap.
 """
 
+from __future__ import annotations
+
+import html
 import json
-import nltk
-from openai import OpenAI
-import markdown                  # <-- ADDED IMPORT
-from bs4 import BeautifulSoup    # <-- ADDED IMPORT
+import os
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from llm_utils import chat_completion, stream_chat_completion
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# --- Markup Cleaning ---
+# Patterns for the single-pass Markdown/HTML stripper, applied in order by `clean_text_from_markup`.
+# Inline spans never cross a blank line, matching how Markdown scopes them to one block.
+_IN_BLOCK = r"(?:(?!\n[ \t]*\n).)"
+_LINK_TARGET = r"\((?:[^()]|\([^()]*\))*\)"  # URLs may contain one level of balanced parentheses
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_CODE_SPAN_RE = re.compile(r"(?<![`\\])(`+)(" + _IN_BLOCK + r"+?)(?<!`)\1(?!`)", re.DOTALL)
+_CODE_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+_IMAGE_RE = re.compile(r"!\[[^\]]*\](?:" + _LINK_TARGET + r"|\[[^\]]*\])")
+_HTML_IMAGE_RE = re.compile(r"<(?:img|picture|source|svg)\b[^>]*>", re.IGNORECASE)
+_EMPTY_LINK_RE = re.compile(r"\[\s*\](?:" + _LINK_TARGET + r"|\[[^\]]*\])")
+_INLINE_LINK_RE = re.compile(r"\[([^\]]+)\]" + _LINK_TARGET)
+_REFERENCE_LINK_RE = re.compile(r"\[([^\]]+)\]\[[^\]]*\]")
+_SHORTCUT_LINK_RE = re.compile(r"\[([^\]]+)\](?![\[(:])")
+_LINK_DEFINITION_RE = re.compile(
+    r"^[ ]{0,3}\[([^\]]+)\]:[ \t]*<?\S+?>?(?:[ \t]+(?:\"[^\"]*\"|'[^']*'|\([^)]*\)))?[ \t]*$", re.MULTILINE
+)
+_AUTOLINK_RE = re.compile(r"<((?:https?|ftp)://[^>\s]+|[^@>\s]+@[^@>\s]+\.[^@>\s]+)>")
+_HTML_TAG_RE = re.compile(r"</?[A-Za-z][A-Za-z0-9-]*(?:\s[^>]*)?/?>")
+_HEADING_RE = re.compile(r"^[ ]{0,3}#{1,6}[ \t]*|[ \t]+#+[ \t]*$", re.MULTILINE)
+_RULE_RE = re.compile(r"^[ ]{0,3}(?:(?:[-*_][ \t]*){3,}|=+)[ \t]*$", re.MULTILINE)
+_BLOCKQUOTE_RE = re.compile(r"^[ \t]*(?:>[ \t]?)+", re.MULTILINE)
+_LIST_MARKER_RE = re.compile(r"^[ \t]*(?:[-*+]|\d+[.)])[ \t]+", re.MULTILINE)
+# Emphasis spans are bounded and stop at a nested opener, so an unpaired `*` or `_` (shell
+# globs, snake_case) costs a short scan instead of one to the end of the block
+_MAX_EMPHASIS_SPAN = 500
+
+def _emphasis_span(opener: str) -> str:
+    return r"((?:(?!\n[ \t]*\n|" + opener + r").){1,%d}?)" % _MAX_EMPHASIS_SPAN
+
+_STRONG_RE = re.compile(
+    r"\*\*(?=\S)" + _emphasis_span(r"\*\*") + r"(?<=\S)\*\*"
+    r"|(?<!\w)__(?=\S)" + _emphasis_span(r"(?<!\w)__") + r"(?<=\S)__(?!\w)", re.DOTALL
+)
+_EMPHASIS_RE = re.compile(
+    r"\*(?=\S)" + _emphasis_span(r"\*") + r"(?<=\S)\*"
+    r"|(?<!\w)_(?=\S)" + _emphasis_span(r"(?<!\w)_") + r"(?<=\S)_(?!\w)", re.DOTALL
+)
+_ESCAPE_RE = re.compile(r"\\([\\`*_{}\[\]()#+\-.!])")
 
-# --- NEW FUNCTION TO CLEAN MARKUP ---
 def clean_text_from_markup(raw_text: str) -> str:
     """
-    Cleans raw text by stripping HTML and Markdown tags.
-    1. Converts Markdown to HTML.
-    2. Parses the HTML and extracts only the text content.
+    Cleans raw text by stripping HTML and Markdown syntax in a single regex pass,
+    keeping only the readable text. Images and badges are dropped entirely.
+    Yields the same sentences as `clean_text_from_markup_via_html` at a fraction of the cost.
     """
-    # Step 1: Convert Markdown to HTML
-    html = markdown.markdown(raw_text)
-    
-    # Step 2: Use BeautifulSoup to parse the HTML and extract text
-    soup = BeautifulSoup(html, "html.parser")
-    
-    # Get all the text, using a space as a separator and stripping whitespace
-    clean_text = soup.get_text(separator=' ', strip=True)
-    
-    return clean_text
+    text = _HTML_COMMENT_RE.sub(" ", raw_text)
+
+    # Code spans (which also cover ``` fences, as in the Markdown renderer) are set aside
+    # so that no later pattern touches their contents, and restored verbatim at the end
+    code_spans = []
+    def stash_code(match):
+        code_spans.append(match.group(2).strip())
+        return f" \x00{len(code_spans) - 1}\x00 "
+    text = _CODE_SPAN_RE.sub(stash_code, text)
+
+    # Images (and badges, which are linked images) go before links so no empty links remain
+    text = _IMAGE_RE.sub(" ", text)
+    text = _HTML_IMAGE_RE.sub(" ", text)
+    text = _EMPTY_LINK_RE.sub(" ", text)
+    text = _INLINE_LINK_RE.sub(r"\1", text)
+    text = _REFERENCE_LINK_RE.sub(r"\1", text)
+    link_labels = {label.lower() for label in _LINK_DEFINITION_RE.findall(text)}
+    text = _LINK_DEFINITION_RE.sub("", text)
+    if link_labels:
+        text = _SHORTCUT_LINK_RE.sub(lambda m: m.group(1) if m.group(1).lower() in link_labels else m.group(0), text)
+    text = _AUTOLINK_RE.sub(r"\1", text)
+    text = _HTML_TAG_RE.sub(" ", text)
+    text = _RULE_RE.sub(" ", text)
+    text = _BLOCKQUOTE_RE.sub(" ", text)
+    text = _LIST_MARKER_RE.sub(" ", text)  # Before headings, so "### 1. Title" keeps its number
+    text = _HEADING_RE.sub(" ", text)
+    text = _STRONG_RE.sub(lambda m: m.group(1) or m.group(2), text)
+    text = _EMPHASIS_RE.sub(lambda m: m.group(1) or m.group(2), text)
+    text = _ESCAPE_RE.sub(r"\1", text)
+    text = html.unescape(text)
+    text = _CODE_PLACEHOLDER_RE.sub(lambda m: code_spans[int(m.group(1))], text)
+    return " ".join(text.split())
+
+def clean_text_from_markup_via_html(raw_text: str) -> str:
+    """
+    Reference cleaner: renders Markdown to HTML and extracts its text with BeautifulSoup.
+    Kept to regression-test and benchmark `clean_text_from_markup` against.
+    """
+    import markdown
+    from bs4 import BeautifulSoup
+
+    html_text = markdown.markdown(raw_text)
+    soup = BeautifulSoup(html_text, "html.parser")
+    return soup.get_text(separator=' ', strip=True)
+
+def _punkt_resource() -> str:
+    """NLTK >= 3.8.2 loads Punkt from the "punkt_tab" data package; older releases use "punkt"."""
+    try:
+        from nltk.tokenize import PunktTokenizer  # noqa: F401
+        return "punkt_tab"
+    except ImportError:
+        return "punkt"
+
+@lru_cache(maxsize=None)
+def get_sentence_tokenizer(language: str = "english"):
+    """Loads the Punkt sentence tokenizer once per process and returns the shared instance."""
+    if _punkt_resource() == "punkt_tab":
+        from nltk.tokenize import PunktTokenizer
+        return PunktTokenizer(language)
+    import nltk
+    return nltk.data.load(f"tokenizers/punkt/{language}.pickle")
 
 def download_nltk_data_if_needed():
-    """Checks for and downloads the NLTK 'punkt' tokenizer if not present."""
+    """Checks for and downloads the NLTK Punkt tokenizer data if not present."""
+    import nltk
+    resource = _punkt_resource()
     try:
-        nltk.sent_tokenize("test sentence")
+        nltk.data.find(f"tokenizers/{resource}")  # Resource lookup only; nothing is loaded or run
     except LookupError:
-        print("NLTK 'punkt' tokenizer not found. Downloading...")
-        nltk.download('punkt')
+        print(f"NLTK '{resource}' tokenizer not found. Downloading...")
+        nltk.download(resource)
         print("Download complete.")
 
 # --- MODIFIED FUNCTION ---
-def preprocess_text_to_numbered_sentences(raw_text: str) -> tuple[dict, str]:
+def preprocess_text_to_numbered_sentences(raw_text: str, clean_markup: bool = True,
+                                          dedupe: bool = True) -> tuple[dict, str]:
     """
     Cleans markup and then splits the clean text into uniquely identified sentences.
+    Pass `clean_markup=False` for text that is already plain (e.g. consolidated Reddit posts).
+    With `dedupe`, near-duplicate sentences are left out of the numbered text but keep
+    their IDs in the returned map, so every ID still resolves.
     """
     # Step 1: Clean the raw text to remove HTML/Markdown (the new logic)
-    cleaned_text = clean_text_from_markup(raw_text)
+    cleaned_text = clean_text_from_markup(raw_text) if clean_markup else raw_text
     
     # Step 2: Tokenize the *cleaned* text into sentences
-    sentences = nltk.sent_tokenize(cleaned_text)
+    sentences = get_sentence_tokenizer().tokenize(cleaned_text)
     
-    # The rest of the function remains the same
     sentences_map = {f"S{i+1}": sentence for i, sentence in enumerate(sentences)}
-    formatted_text = "\n".join([f"[{sid}] {s}" for sid, s in sentences_map.items()])
+    lines = [f"[{sid}] {s}" for sid, s in sentences_map.items()]
+    if dedupe:
+        # Step 3: Only the first of each group of near-identical sentences is shown to the LLM
+        from dedup import find_near_duplicates, report_removed
+        duplicate_of = find_near_duplicates(sentences)
+        report_removed("sentences", len(lines), [lines[i] for i in duplicate_of])
+        lines = [line for i, line in enumerate(lines) if i not in duplicate_of]
+    formatted_text = "\n".join(lines)
     return sentences_map, formatted_text
 
 def determine_sentence_count(total_sentences: int) -> int:
     """Dynamically determines the ideal number of sentences for a summary."""
     return max(7, min(int(total_sentences * 0.15), 40))
 
-def extract_key_sentence_ids(formatted_text: str, client: OpenAI, model: str, sentence_count: int) -> list:
+# --- Key Sentence Selection ---
+EXTRACTION_MODES = ("llm", "hybrid", "local")
+# "llm" stays the default so existing reports keep their sentences; the ranker modes are opt-in
+DEFAULT_EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "llm")
+# In hybrid mode the LLM chooses among this many locally ranked candidates per sentence wanted
+HYBRID_CANDIDATES_PER_SENTENCE = 3
+_NUMBERED_ID_RE = re.compile(r"^\[(S\d+)\] ", re.MULTILINE)
+
+def select_key_sentence_ids(sentences_map: dict, formatted_text: str, client: OpenAI, model: str, sentence_count: int,
+                            document_type: str = "document", focus: str = "its purpose, features, and usage",
+                            mode: str = DEFAULT_EXTRACTION_MODE) -> list:
+    """
+    Picks the key sentence IDs in one of three modes:
+      "llm"    - the LLM reads the whole numbered text (`extract_key_sentence_ids`)
+      "local"  - the local ranker in extractive_ranker.py picks them, with no API call
+      "hybrid" - the ranker shortlists candidates and the LLM chooses among those only
+    Sentences left out of `formatted_text` (near-duplicates) are never candidates.
+    """
+    extract_kwargs = dict(client=client, model=model, sentence_count=sentence_count, document_type=document_type, focus=focus)
+    if mode == "llm":
+        return extract_key_sentence_ids(formatted_text, **extract_kwargs)
+    shown = {sid: sentences_map[sid] for sid in _NUMBERED_ID_RE.findall(formatted_text) if sid in sentences_map}
+    candidate_count = sentence_count if mode == "local" else sentence_count * HYBRID_CANDIDATES_PER_SENTENCE
+    if mode == "hybrid" and len(shown) <= candidate_count:
+        return extract_key_sentence_ids(formatted_text, **extract_kwargs)  # Already no larger than a shortlist
+    try:
+        from extractive_ranker import top_sentence_ids  # Needs numpy
+    except ImportError:
+        if mode == "local":
+            raise
+        print("numpy is not installed; sending the whole text for key sentence extraction.")
+        return extract_key_sentence_ids(formatted_text, **extract_kwargs)
+
+    candidates = top_sentence_ids(shown, candidate_count)
+    if mode == "local":
+        print(f"Ranked {len(shown)} sentences locally and kept the top {len(candidates)}.")
+        return candidates
+    print(f"Shortlisted {len(candidates)} of {len(shown)} sentences locally for key sentence extraction.")
+    return extract_key_sentence_ids("\n".join(f"[{sid}] {shown[sid]}" for sid in candidates), **extract_kwargs)
+
+def extract_key_sentence_ids(formatted_text: str, client: OpenAI, model: str, sentence_count: int,
+                             document_type: str = "document", focus: str = "its purpose, features, and usage") -> list:
     """Uses an LLM to identify the most important sentence IDs from a numbered text."""
     prompt = f"""
-    Analyze the following numbered text from a document. Identify the {sentence_count} most important sentences for understanding its purpose, features, and usage.
+    Analyze the following numbered text from a {document_type}. Identify the {sentence_count} most important sentences for understanding {focus}.
     Your ONLY output must be a single JSON object with a key "key_sentence_ids" containing an array of the sentence IDs.
 
     Example: {{"key_sentence_ids": ["S5", "S12", "S25"]}}
@@ -71,28 +224,29 @@ def extract_key_sentence_ids(formatted_text: str, client: OpenAI, model: str, se
     {formatted_text}
     ---
     """
+    # API errors that persist through the retries in chat_completion propagate to the caller
+    print(f"\nSending request to '{model}' to identify key sentences...")
+    response_text = chat_completion(
+        client,
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful research assistant that outputs only JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.0
+    )
     try:
-        print(f"\nSending request to '{model}' to identify key sentences...")
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful research assistant that outputs only JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.0
-        )
-        data = json.loads(response.choices[0].message.content)
+        data = json.loads(response_text)
         return data.get("key_sentence_ids", [])
-    except Exception as e:
-        print(f"An unexpected error occurred during key sentence extraction: {e}")
+    except (json.JSONDecodeError, AttributeError) as e:
+        print(f"The key sentence response was not the expected JSON object: {e}")
         return []
 
-def generate_abstractive_summary(key_sentences: list[str], client: OpenAI, model: str) -> str:
-    """Generates a final, cited summary from a list of key sentences."""
+def _abstractive_summary_messages(key_sentences: list[str], document_type: str) -> list[dict]:
     key_sentences_text = "\n".join(key_sentences)
     prompt = f"""
-    Synthesize the following key sentences from a document into a smooth summary paragraph.
+    Synthesize the following key sentences from a {document_type} into a smooth summary paragraph.
     CRITICAL: At the end of EACH new sentence you write, you MUST cite the original sentence number(s) it is based on, like `[S1]` or `[S5, S12]`.
     Base your summary ONLY on the information provided.
 
@@ -102,17 +256,61 @@ def generate_abstractive_summary(key_sentences: list[str], client: OpenAI, model
     ---
     Final Summary:
     """
-    try:
-        print(f"\nSending request to '{model}' to generate the final summary...")
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a skilled writer who follows citation rules perfectly."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"An unexpected error occurred during final summary generation: {e}")
-        return ""
\ No newline at end of file
+    return [
+        {"role": "system", "content": "You are a skilled writer who follows citation rules perfectly."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_abstractive_summary(key_sentences: list[str], client: OpenAI, model: str,
+                                 document_type: str = "document") -> str:
+    """Generates a final, cited summary from a list of key sentences."""
+    print(f"\nSending request to '{model}' to generate the final summary...")
+    response_text = chat_completion(client, model=model, messages=_abstractive_summary_messages(key_sentences, document_type),
+                                    temperature=0.5)
+    return (response_text or "").strip()
+
+def stream_abstractive_summary(key_sentences: list[str], client: OpenAI, model: str, document_type: str = "document"):
+    """
+    Like `generate_abstractive_summary`, but yields the summary text as it is generated.
+    Leading and trailing whitespace is dropped, so the pieces join to the same stripped text.
+    """
+    print(f"\nStreaming the final summary from '{model}'...")
+    pieces = stream_chat_completion(client, model=model, messages=_abstractive_summary_messages(key_sentences, document_type),
+                                    temperature=0.5)
+    held_back, started = "", False
+    for piece in pieces:
+        text = held_back + piece
+        if not started:
+            text = text.lstrip()
+            started = bool(text)
+        body = text.rstrip()
+        held_back = text[len(body):]  # Whitespace is only written once more text follows it
+        if body:
+            yield body
+
+# --- Reports ---
+def write_report_with_streamed_summary(output_filename: str, report_lines: list[str], summary_heading: list[str],
+                                       summary_pieces, echo: bool = True) -> str:
+    """
+    Writes `report_lines` (the extractive part) to the report at once, then appends the
+    `summary_heading` and each summary piece as it arrives, echoing the pieces to stdout.
+    The finished file equals "\n".join(report_lines + summary_heading + [summary]); the
+    heading is left out when the summary is empty. Returns the summary.
+    """
+    pieces = []
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write("\n".join(report_lines))
+        f.flush()
+        for piece in summary_pieces:
+            if not pieces:
+                f.write("\n" + "\n".join(summary_heading) + "\n")
+                if echo:
+                    print()
+            pieces.append(piece)
+            f.write(piece)
+            f.flush()
+            if echo:
+                print(piece, end="", flush=True)
+    if echo and pieces:
+        print()
+    return "".join(pieces)
\ No newline at end of file
@@ -0,0 +1,40 @@
+# token_utils.py
+"""
+Local token counting and truncation used to size prompts before they are sent.
+Uses `tiktoken` when it is installed and falls back to a character-based
+estimate (about 4 characters per token for English text) otherwise.
+"""
+
+from functools import lru_cache
+
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str, model: str = "gpt-4.1-mini") -> int:
+    """Returns the number of tokens `text` occupies in a prompt for `model`."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4.1-mini") -> str:
+    """
+    Returns `text` cut to at most `max_tokens` tokens for `model`. Without `tiktoken` the cut is
+    made at half the character estimate, since an input over a model's limit is rejected outright.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN // 2
+        return text if len(text) <= max_chars else text[:max_chars]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
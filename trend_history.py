@@ -0,0 +1,241 @@
+# trend_history.py
+"""
+Persisted cross-run trend index for `subreddit_trends`.
+
+Every run records its trends (title, summary, embedding) and which posts were
+mapped to each. A trend found in a new run is matched to an earlier trend of
+the same subreddit when their embeddings are at least `match_threshold`
+cosine-similar, so a topic keeps one identity across runs even when the LLM
+words it differently. That identity lets later runs
+  - reuse the classification of posts already assigned in an earlier run to a
+    trend that is still present, instead of classifying them again, and
+  - report deltas against an earlier run: new, growing, shrinking and faded trends.
+Needs numpy, like the embedding classifier.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from corpus_store import TIME_FILTER_SECONDS
+
+DEFAULT_HISTORY_PATH = os.getenv("TREND_HISTORY_PATH", os.path.join(".cache", "trend_history.sqlite"))
+# Cosine similarity above which a new trend is taken to be an earlier one
+DEFAULT_MATCH_THRESHOLD = float(os.getenv("TREND_MATCH_THRESHOLD", "0.75"))
+
+class TrendRun:
+    """The trends of a run in progress, each matched to an earlier trend ID (or None when new)."""
+
+    def __init__(self, subreddit: str, time_filter: str, trends_data: dict, embeddings: np.ndarray,
+                 trend_ids: list, similarities: list):
+        self.subreddit = subreddit
+        self.time_filter = time_filter
+        self.created_at = time.time()
+        self.titles = list(trends_data.keys())
+        self.summaries = list(trends_data.values())
+        self.embeddings = embeddings
+        self.trend_ids = trend_ids
+        self.similarities = similarities
+        self.run_id = None
+
+    def trend_number(self, trend_id) -> int | None:
+        """The 1-based number of trend `trend_id` in this run, if it is present."""
+        return self.trend_ids.index(trend_id) + 1 if trend_id is not None and trend_id in self.trend_ids else None
+
+class TrendHistory:
+    """Runs, trends and post assignments for any number of subreddits. Safe to share between threads."""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, match_threshold: float = DEFAULT_MATCH_THRESHOLD):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.match_threshold = match_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trends (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subreddit TEXT NOT NULL,
+                title TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_trends_subreddit ON trends (subreddit);
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subreddit TEXT NOT NULL,
+                time_filter TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_subreddit ON runs (subreddit, time_filter, created_at);
+            CREATE TABLE IF NOT EXISTS run_trends (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                trend_id INTEGER NOT NULL REFERENCES trends (id),
+                position INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                similarity REAL,
+                post_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (run_id, trend_id)
+            );
+            CREATE TABLE IF NOT EXISTS run_posts (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                post_id TEXT NOT NULL,
+                trend_id INTEGER REFERENCES trends (id),
+                reused INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (run_id, post_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_run_posts_post ON run_posts (post_id, run_id);
+            """
+        )
+        self._conn.commit()
+
+    # --- Matching ---
+    def start_run(self, subreddit_name: str, time_filter: str, trends_data: dict, embedder) -> TrendRun:
+        """
+        Embeds this run's trends and matches each to at most one earlier trend of the subreddit,
+        most similar pairs first. Nothing is stored until `record_run`.
+        """
+        from embedding_classifier import _normalize_rows
+        embeddings = _normalize_rows(embedder.embed([f"{title}: {summary}" for title, summary in trends_data.items()]))
+        with self._lock:
+            rows = self._conn.execute("SELECT id, embedding FROM trends WHERE subreddit = ?",
+                                      (subreddit_name.lower(),)).fetchall()
+        known = [(row["id"], np.frombuffer(row["embedding"], dtype=np.float32)) for row in rows]
+        known = [(trend_id, vector) for trend_id, vector in known if vector.shape[0] == embeddings.shape[1]]
+
+        trend_ids, similarities = [None] * len(embeddings), [None] * len(embeddings)
+        if known:
+            similarity = embeddings @ np.stack([vector for _, vector in known]).T
+            taken = set()
+            for flat in np.argsort(-similarity, axis=None):
+                row, column = divmod(int(flat), similarity.shape[1])
+                if similarity[row, column] < self.match_threshold:
+                    break
+                if trend_ids[row] is None and column not in taken:
+                    trend_ids[row], similarities[row] = known[column][0], float(similarity[row, column])
+                    taken.add(column)
+        matched = sum(trend_id is not None for trend_id in trend_ids)
+        print(f"Matched {matched} of {len(trend_ids)} trends to earlier runs of r/{subreddit_name}.")
+        return TrendRun(subreddit_name, time_filter, trends_data, embeddings, trend_ids, similarities)
+
+    def reusable_classifications(self, run: TrendRun, post_ids: list[str]) -> dict:
+        """
+        Post ID → trend number in `run`, for posts whose latest earlier assignment was to a
+        trend that `run` matched. Posts assigned to no trend, or to a trend not seen this
+        run, are left out and need classifying again.
+        """
+        if not post_ids or not any(run.trend_ids):
+            return {}
+        reusable = {}
+        with self._lock:
+            for start in range(0, len(post_ids), 500):
+                batch = post_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT rp.post_id, rp.trend_id FROM run_posts rp JOIN runs r ON r.id = rp.run_id
+                    WHERE r.subreddit = ? AND rp.post_id IN ({",".join("?" * len(batch))})
+                    ORDER BY rp.run_id
+                    """,
+                    (run.subreddit.lower(), *batch),
+                ).fetchall()
+                latest = {row["post_id"]: row["trend_id"] for row in rows}  # Later runs overwrite earlier ones
+                for post_id, trend_id in latest.items():
+                    trend_number = run.trend_number(trend_id)
+                    if trend_number is not None:
+                        reusable[post_id] = trend_number
+        return reusable
+
+    # --- Recording ---
+    def record_run(self, run: TrendRun, post_ids: list[str], trend_numbers: list, reused: set) -> int:
+        """Stores the run, its trends (creating new trend IDs) and every post's assignment. Returns the run ID."""
+        post_counts = [0] * len(run.titles)
+        for trend_number in trend_numbers:
+            if trend_number and 1 <= trend_number <= len(post_counts):
+                post_counts[trend_number - 1] += 1
+
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO runs (subreddit, time_filter, created_at) VALUES (?, ?, ?)",
+                                        (run.subreddit.lower(), run.time_filter, run.created_at))
+            run.run_id = cursor.lastrowid
+            for i, (title, summary, embedding) in enumerate(zip(run.titles, run.summaries, run.embeddings)):
+                blob = np.asarray(embedding, dtype=np.float32).tobytes()
+                if run.trend_ids[i] is None:
+                    run.trend_ids[i] = self._conn.execute(
+                        "INSERT INTO trends (subreddit, title, summary, embedding, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                        (run.subreddit.lower(), title, summary, blob, run.created_at, run.created_at),
+                    ).lastrowid
+                else:
+                    # The latest wording stands for the trend in later matches
+                    self._conn.execute("UPDATE trends SET title = ?, summary = ?, embedding = ?, last_seen = ? WHERE id = ?",
+                                       (title, summary, blob, run.created_at, run.trend_ids[i]))
+                self._conn.execute(
+                    """
+                    INSERT INTO run_trends (run_id, trend_id, position, title, summary, embedding, similarity, post_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (run.run_id, run.trend_ids[i], i + 1, title, summary, blob, run.similarities[i], post_counts[i]),
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO run_posts (run_id, post_id, trend_id, reused) VALUES (?, ?, ?, ?)",
+                [(run.run_id, post_id,
+                  run.trend_ids[number - 1] if number and 1 <= number <= len(run.trend_ids) else None,
+                  int(post_id in reused))
+                 for post_id, number in zip(post_ids, trend_numbers)],
+            )
+            self._conn.commit()
+        return run.run_id
+
+    # --- Deltas ---
+    def _baseline_run(self, run: TrendRun):
+        """The latest earlier run at least one time-filter window older (a week for 'week'), else the latest earlier run."""
+        window = TIME_FILTER_SECONDS.get(run.time_filter) or 0
+        query = "SELECT id, created_at FROM runs WHERE subreddit = ? AND time_filter = ? AND id != ? AND created_at <= ? " \
+                "ORDER BY created_at DESC LIMIT 1"
+        args = (run.subreddit.lower(), run.time_filter, run.run_id)
+        with self._lock:
+            row = self._conn.execute(query, (*args, run.created_at - window)).fetchone()
+            if row is None and window:
+                row = self._conn.execute(query, (*args, run.created_at)).fetchone()
+        return row
+
+    def trend_deltas(self, run: TrendRun) -> dict | None:
+        """
+        Compares a recorded run with its baseline run (see `_baseline_run`). Returns None when
+        there is no earlier run, else {"since": timestamp, "trends": [...], "faded": [...]} where
+        every current trend has its post count now and then and a status of new/up/down/steady.
+        """
+        baseline = self._baseline_run(run)
+        if baseline is None:
+            return None
+        with self._lock:
+            rows = self._conn.execute("SELECT trend_id, title, post_count FROM run_trends WHERE run_id = ?",
+                                      (baseline["id"],)).fetchall()
+            current = self._conn.execute("SELECT trend_id, post_count FROM run_trends WHERE run_id = ?",
+                                         (run.run_id,)).fetchall()
+        before = {row["trend_id"]: row for row in rows}
+        now = {row["trend_id"]: row["post_count"] for row in current}
+        trends = []
+        for title, trend_id in zip(run.titles, run.trend_ids):
+            posts, earlier = now.get(trend_id, 0), before.get(trend_id)
+            previous = earlier["post_count"] if earlier else None
+            if previous is None:
+                status = "new"
+            else:
+                status = "up" if posts > previous else "down" if posts < previous else "steady"
+            trends.append({"title": title, "status": status, "posts": posts, "previous_posts": previous})
+        faded = [{"title": row["title"], "previous_posts": row["post_count"]}
+                 for trend_id, row in before.items() if trend_id not in now]
+        return {"since": baseline["created_at"], "trends": trends, "faded": faded}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,232 @@
+# trend_pipeline.py
+"""
+Streaming scrape → trend extraction → classification → report pipeline.
+
+Posts flow out of the scraper through a bounded queue while it is still
+fetching. Every time enough posts for one map-phase chunk have arrived,
+candidate trend extraction for that chunk starts, overlapping the LLM work
+with network fetching. Posts are spooled to a temporary JSONL file rather
+than held in memory, then streamed back through bounded-concurrency
+classification into a report writer that records each result as it lands.
+Near-duplicate posts are spooled too but left out of the trend chunks, and
+take the trend of the earlier post they duplicate instead of being classified.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import subreddit_trends as st
+from dedup import NearDuplicateIndex, report_removed
+from reddit_utils import Post
+from token_utils import count_tokens
+
+_END_OF_STREAM = object()
+
+class IncrementalReportWriter:
+    """
+    Consumes classification results one at a time. Each result is appended to a
+    JSONL log next to the report as it arrives; only post titles and URLs are
+    kept in memory to render the final Markdown report on `close()`.
+    """
+
+    def __init__(self, output_filename: str, subreddit_name: str, trends_data: dict):
+        self.output_filename = output_filename
+        self.subreddit_name = subreddit_name
+        self.trends_data = trends_data
+        self.trend_titles = list(trends_data.keys())
+        self.trends_with_posts = {title: [] for title in self.trend_titles}
+        self.results_written = 0
+        self.log_filename = os.path.splitext(output_filename)[0] + ".assignments.jsonl"
+        self._log = open(self.log_filename, 'w', encoding='utf-8')
+
+    def add(self, position: int, post: Post, trend_number) -> None:
+        """Records the classification of the post at `position` in the listing."""
+        trend_title = None
+        if trend_number and 1 <= trend_number <= len(self.trend_titles):
+            trend_title = self.trend_titles[trend_number - 1]
+            self.trends_with_posts[trend_title].append((position, post.id, post.title, post.url))
+        self._log.write(json.dumps({"id": post.id, "title": post.title, "url": post.url, "trend": trend_title}) + "\n")
+        self._log.flush()
+        self.results_written += 1
+
+    def close(self) -> None:
+        self._log.close()
+        # Results arrive in completion order; the report lists posts in listing order like the batch flow
+        trends_with_posts = {
+            title: [Post(post_id, post_title, url) for _, post_id, post_title, url in sorted(entries)]
+            for title, entries in self.trends_with_posts.items()
+        }
+        st.write_trend_report(self.output_filename, self.subreddit_name, self.trends_data, trends_with_posts)
+
+def _put_unless_stopped(post_queue: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts `item` on the queue, waiting for room until `stop` is set. Returns False if it was."""
+    while not stop.is_set():
+        try:
+            post_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _scrape_into_queue(post_iter, post_queue: queue.Queue, errors: list, stop: threading.Event) -> None:
+    """Feeds scraped posts into the queue until the listing ends or the consumer sets `stop`."""
+    try:
+        for post in post_iter:
+            if not _put_unless_stopped(post_queue, post, stop):
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        post_iter.close()  # Shuts down the comment-fetching pool when stopped early
+        _put_unless_stopped(post_queue, _END_OF_STREAM, stop)
+
+def _extract_trends_while_scraping(post_queue: queue.Queue, spool, subreddit_name: str, num_trends: int,
+                                   chunk_token_budget: int, map_workers: int) -> tuple[int, dict]:
+    """
+    Drains the scraped-post queue into the spool file, launching candidate extraction for
+    each full chunk as soon as it fills. Returns (post count, final trends).
+    """
+    separator_tokens = count_tokens(st.POST_SEPARATOR)
+    candidates_per_chunk = num_trends * 2
+    duplicates = NearDuplicateIndex()
+    removed_texts = []
+    post_count = 0
+    chunk, chunk_tokens = [], 0
+    futures = []
+    with ThreadPoolExecutor(max_workers=map_workers) as executor:
+        def submit(chunk_texts):
+            futures.append(executor.submit(
+                st.get_trends_and_summaries_openai, st.POST_SEPARATOR.join(chunk_texts), subreddit_name, candidates_per_chunk
+            ))
+
+        while (post := post_queue.get()) is not _END_OF_STREAM:
+            post_text = post.text
+            post.duplicate_of = duplicates.add(post_count, post_text)
+            spool.write(json.dumps(post.to_dict()) + "\n")
+            post_count += 1
+            if post.duplicate_of is not None:
+                removed_texts.append(post_text)
+                continue
+            text_tokens = count_tokens(post_text) + separator_tokens
+            if chunk and chunk_tokens + text_tokens > chunk_token_budget:
+                submit(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(post_text)
+            chunk_tokens += text_tokens
+        spool.flush()
+        report_removed("posts", post_count, removed_texts)
+
+        if not futures:
+            # Everything fit in one chunk: a single direct pass-1 call, as in the batch flow
+            return post_count, (st.get_trends_and_summaries_openai(st.POST_SEPARATOR.join(chunk), subreddit_name, num_trends) if chunk else {})
+        if chunk:
+            submit(chunk)
+        candidates = [future.result() for future in futures]
+
+    candidates = [chunk_trends for chunk_trends in candidates if chunk_trends]
+    return post_count, (st.merge_trend_candidates(candidates, subreddit_name, num_trends) if candidates else {})
+
+def _iter_spooled_posts(spool_path: str):
+    with open(spool_path, encoding='utf-8') as f:
+        for line in f:
+            yield Post.from_dict(json.loads(line))
+
+async def _classify_stream(posts, trends_data: dict, concurrency: int, writer: IncrementalReportWriter,
+                           client=None) -> None:
+    """
+    Classifies streamed posts with at most 2 × `concurrency` posts held at once, feeding `writer` as
+    results complete. A post marked `duplicate_of` an earlier position waits for that post's result.
+    """
+    if client is None:
+        from openai import AsyncOpenAI
+        # A client created here is closed here, releasing its connection pool; passed-in clients are left open
+        async with AsyncOpenAI(api_key=st.OPENAI_API_KEY, max_retries=0) as client:  # Retries are handled by resilience
+            return await _classify_stream(posts, trends_data, concurrency, writer, client)
+    semaphore = asyncio.Semaphore(concurrency)
+    trends_formatted = st.format_trends_for_prompt(trends_data)
+    failures = []
+    loop = asyncio.get_running_loop()
+    results = {}  # Position → future trend number, for posts that later duplicates may point at
+
+    async def classify(position, post):
+        if post.duplicate_of is not None:
+            return position, post, await results[post.duplicate_of]
+        try:
+            trend_number = await st.map_post_to_trend_openai_async(post.text, trends_formatted, client, semaphore)
+        except Exception as e:
+            failures.append((post.title, e))
+            trend_number = None
+        results[position].set_result(trend_number)
+        return position, post, trend_number
+
+    def record(done_tasks):
+        for task in done_tasks:
+            writer.add(*task.result())
+
+    pending = set()
+    for position, post in enumerate(posts):
+        if len(pending) >= concurrency * 2:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            record(done)
+        if post.duplicate_of is None:
+            results[position] = loop.create_future()
+        pending.add(asyncio.create_task(classify(position, post)))
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        record(done)
+    st.report_classification_failures(failures, writer.results_written)
+
+def run_streaming_trend_report(subreddit_name: str, output_filename: str, time_filter: str = 'week', limit: int = 50,
+                               num_trends: int = 4, scrape_workers: int = 8, classify_concurrency: int = 10,
+                               chunk_token_budget: int = st.TREND_CHUNK_TOKEN_BUDGET, map_workers: int = 4,
+                               queue_size: int = 64) -> dict:
+    """
+    Runs the whole trend report as a streaming pipeline and returns the trends found
+    (empty if none). Scraping runs on a background thread feeding a queue of at most
+    `queue_size` posts; see the module docstring for how the stages overlap.
+    """
+    if not st.OPENAI_API_KEY: raise ValueError("OPENAI_API_KEY not found in .env file")
+    post_queue = queue.Queue(maxsize=queue_size)
+    scrape_errors = []
+    post_iter = st.iter_subreddit_posts(subreddit_name, time_filter=time_filter, limit=limit, workers=scrape_workers)
+    stop_scraping = threading.Event()
+    scraper = threading.Thread(target=_scrape_into_queue, args=(post_iter, post_queue, scrape_errors, stop_scraping),
+                               daemon=True)
+
+    print(f"Streaming top {limit} posts from r/{subreddit_name} for the last {time_filter}...")
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spool_path = os.path.join(spool_dir, "posts.jsonl")
+        try:
+            with open(spool_path, 'w', encoding='utf-8') as spool:
+                scraper.start()
+                post_count, trends_data = _extract_trends_while_scraping(
+                    post_queue, spool, subreddit_name, num_trends, chunk_token_budget, map_workers
+                )
+        finally:
+            # The scraper has already finished unless trend extraction failed; then it is told to stop
+            stop_scraping.set()
+            if scraper.ident is not None:
+                scraper.join()
+        if scrape_errors:
+            raise scrape_errors[0]
+        print(f"Scraped {post_count} posts.")
+        if not trends_data:
+            return {}
+
+        print("\nIdentified Trends and Summaries:")
+        for title, summary in trends_data.items():
+            print(f"- {title}: {summary}")
+
+        print(f"\nCategorizing {post_count} posts against trends...")
+        writer = IncrementalReportWriter(output_filename, subreddit_name, trends_data)
+        try:
+            asyncio.run(_classify_stream(_iter_spooled_posts(spool_path), trends_data, classify_concurrency, writer))
+        finally:
+            writer.close()
+    print(f"Classified {writer.results_written} posts; assignments logged to {writer.log_filename}")
+    return trends_data
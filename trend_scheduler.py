@@ -0,0 +1,199 @@
+# trend_scheduler.py
+"""
+Runs trend reports for many subreddits at once under shared API quotas.
+
+Jobs start in priority order, up to `max_jobs` at a time, and each one runs the
+usual scrape → trends → classify → report flow from `subreddit_trends`. All
+jobs draw from one Reddit token bucket and from the process-wide OpenAI
+request/token budgets in `llm_utils`, so adding jobs raises aggregate
+throughput without pushing any API past its rate limit.
+
+Jobs are given as `subreddit[:time_filter[:priority]]`, e.g. `Rag:week:5`,
+or as JSON lines with the keys subreddit, time_filter, priority and limit.
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_utils
+import metrics
+import subreddit_trends as st
+from corpus_store import TIME_FILTER_SECONDS, CorpusStore
+from rate_limit import RateLimiter
+
+class TrendJob:
+    """One subreddit report: its settings, current stage and time spent in each stage."""
+
+    def __init__(self, subreddit: str, time_filter: str = 'week', priority: int = 0, limit: int = 10):
+        if time_filter not in TIME_FILTER_SECONDS:
+            raise ValueError(f"Unknown time filter '{time_filter}' for r/{subreddit}.")
+        self.subreddit = subreddit
+        self.time_filter = time_filter
+        self.priority = priority
+        self.limit = limit
+        self.output_filename = st.report_path(subreddit, time_filter)
+        self.state = "queued"  # queued → running → done | no trends | failed
+        self.stage = None
+        self.error = None
+        self.stage_seconds = {}
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started = None
+
+    @property
+    def name(self) -> str:
+        return f"r/{self.subreddit} ({self.time_filter})"
+
+    def enter_stage(self, stage: str | None) -> None:
+        now = time.monotonic()
+        if self.stage is not None:
+            self.stage_seconds[self.stage] = self.stage_seconds.get(self.stage, 0.0) + now - self._stage_started
+        self.stage, self._stage_started = stage, now
+
+    def summary(self) -> dict:
+        return {
+            "subreddit": self.subreddit,
+            "time_filter": self.time_filter,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "report": self.output_filename if self.state == "done" else None,
+            "queue_wait_s": round((self.started_at or time.monotonic()) - self.queued_at, 2),
+            "latency_s": round(self.finished_at - self.started_at, 2) if self.finished_at else None,
+            "stage_seconds": {stage: round(seconds, 2) for stage, seconds in self.stage_seconds.items()},
+        }
+
+def parse_job_spec(spec: str, limit: int = 10) -> TrendJob:
+    """Parses `subreddit[:time_filter[:priority]]` or a JSON object with the same fields."""
+    spec = spec.strip()
+    if spec.startswith("{"):
+        record = json.loads(spec)
+        return TrendJob(record["subreddit"], record.get("time_filter", 'week'), int(record.get("priority", 0)),
+                        int(record.get("limit", limit)))
+    parts = spec.split(":")
+    time_filter = parts[1] if len(parts) > 1 and parts[1] else 'week'
+    priority = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+    return TrendJob(parts[0], time_filter, priority, limit)
+
+def read_job_file(path: str, limit: int = 10) -> list[TrendJob]:
+    with open(path, encoding='utf-8') as f:
+        return [parse_job_spec(line, limit) for line in f if line.strip() and not line.startswith("#")]
+
+def _run_job(job: TrendJob, scrape_workers: int, classifier: str, concurrency: int,
+             rate_limiter: RateLimiter, store: CorpusStore, history=None) -> None:
+    job.state, job.started_at = "running", time.monotonic()
+    try:
+        trends = st.generate_trend_report(job.subreddit, job.output_filename, time_filter=job.time_filter,
+                                          limit=job.limit, scrape_workers=scrape_workers, classifier=classifier,
+                                          concurrency=concurrency, rate_limiter=rate_limiter, store=store,
+                                          incremental=True, on_stage=job.enter_stage, history=history)
+        job.state = "done" if trends else "no trends"
+    except Exception as e:
+        job.state, job.error = "failed", str(e)
+        print(f"Job {job.name} failed: {e}")
+    finally:
+        job.enter_stage(None)
+        job.finished_at = time.monotonic()
+
+def format_progress(jobs: list[TrendJob], elapsed: float) -> str:
+    finished = sum(job.finished_at is not None for job in jobs)
+    running = ", ".join(f"{job.name}: {job.stage}" for job in jobs if job.state == "running")
+    return f"[{elapsed:6.1f}s] {finished}/{len(jobs)} jobs finished | running: {running or '-'}"
+
+def run_scheduled_reports(jobs: list[TrendJob], max_jobs: int = 4, scrape_workers: int = 4, classifier: str = "async",
+                          concurrency: int = 10, reddit_rpm: float = st.REDDIT_REQUESTS_PER_MINUTE,
+                          openai_rpm: float | None = None, openai_tpm: float | None = None,
+                          progress_interval: float = 10.0, history=None) -> list[dict]:
+    """
+    Runs every job, at most `max_jobs` at a time, highest priority first, and returns one
+    summary per job. Reddit calls from all jobs share one `reddit_rpm` token bucket; OpenAI
+    calls share the `openai_rpm`/`openai_tpm` budgets (left as configured when None).
+    All jobs record into the same trend `history` when one is given.
+    """
+    llm_utils.configure_rate_limits(openai_rpm, openai_tpm)  # Only the limits given are replaced
+    rate_limiter = RateLimiter(reddit_rpm, per=60.0, capacity=max(1, min(reddit_rpm, scrape_workers * max_jobs)))
+    store = CorpusStore()
+    ordered = sorted(jobs, key=lambda job: -job.priority)
+
+    print(f"Scheduling {len(jobs)} trend reports, {max_jobs} at a time...")
+    start = time.monotonic()
+    all_done = threading.Event()
+
+    def report_progress():
+        while not all_done.wait(progress_interval):
+            print(format_progress(ordered, time.monotonic() - start))
+
+    reporter = threading.Thread(target=report_progress, daemon=True)
+    reporter.start()
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        for job in ordered:
+            executor.submit(_run_job, job, scrape_workers, classifier, concurrency, rate_limiter, store, history)
+    all_done.set()
+    store.close()
+
+    print(format_progress(ordered, time.monotonic() - start))
+    print(f"\n{'job':<36} {'state':<10} {'queued s':>9} {'latency s':>10}  stages")
+    for job in ordered:
+        summary = job.summary()
+        stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in summary["stage_seconds"].items())
+        latency = f"{summary['latency_s']:.1f}" if summary["latency_s"] is not None else "-"
+        print(f"{job.name:<36} {job.state:<10} {summary['queue_wait_s']:>9.1f} {latency:>10}  {stages}")
+    print(f"Waited {llm_utils.quota_wait_seconds():.1f}s in total on the shared OpenAI budgets.")
+    return [job.summary() for job in ordered]
+
+# --- Command-Line Interface ---
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("jobs", nargs="*", metavar="SUBREDDIT[:TIME_FILTER[:PRIORITY]]",
+                        help="Subreddits to report on; higher priorities start first.")
+    parser.add_argument("--jobs-file", metavar="FILE", help="Additional jobs, one spec or JSON object per line.")
+    parser.add_argument("--limit", type=int, default=10, help="Top posts per subreddit unless a job sets its own.")
+    parser.add_argument("--max-jobs", type=int, default=4, help="Subreddits processed concurrently.")
+    parser.add_argument("--scrape-workers", type=int, default=4, help="Concurrent comment-tree fetches per job.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent classification requests per job.")
+    parser.add_argument("--classifier", default="async", choices=["async", "batched", "embedding"],
+                        help="Pass-2 backend (see subreddit_trends.py).")
+    parser.add_argument("--reddit-rpm", type=float, default=st.REDDIT_REQUESTS_PER_MINUTE,
+                        help="Reddit requests per minute shared by all jobs.")
+    parser.add_argument("--openai-rpm", type=float, help="OpenAI requests per minute shared by all jobs.")
+    parser.add_argument("--openai-tpm", type=float, help="OpenAI tokens per minute shared by all jobs.")
+    parser.add_argument("--history", action="store_true",
+                        help="Track trends across runs and report changes (see trend_history.py; needs numpy).")
+    parser.add_argument("--summary-json", metavar="FILE", help="Write the per-job summary to FILE as JSON.")
+
+def run(args: argparse.Namespace) -> None:
+    jobs = [parse_job_spec(spec, args.limit) for spec in args.jobs]
+    if args.jobs_file:
+        jobs += read_job_file(args.jobs_file, args.limit)
+    if not jobs:
+        print("No jobs given. Pass subreddits as arguments or use --jobs-file.")
+        return
+
+    history = None
+    if args.history:
+        from trend_history import TrendHistory  # Needs numpy
+        history = TrendHistory()
+    try:
+        summaries = run_scheduled_reports(jobs, max_jobs=args.max_jobs, scrape_workers=args.scrape_workers,
+                                          classifier=args.classifier, concurrency=args.concurrency,
+                                          reddit_rpm=args.reddit_rpm, openai_rpm=args.openai_rpm,
+                                          openai_tpm=args.openai_tpm, history=history)
+    finally:
+        if history:
+            history.close()
+    if args.summary_json:
+        with open(args.summary_json, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, indent=2)
+        print(f"Job summary saved to {args.summary_json}")
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate trend reports for many subreddits under shared rate limits.")
+    add_arguments(parser)
+    metrics.add_arguments(parser)
+    metrics.run_instrumented(run, parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()